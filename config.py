@@ -1,14 +1,17 @@
+import json
 import os
 
-import docker
-docker_client = docker.from_env()
-
 import logging
 logger = logging.getLogger(__name__)
 
 from dotenv import load_dotenv
 load_dotenv()
 
+docker_api_version = os.getenv("DOCKER_API_VERSION", "auto")  # "auto" asks the daemon on first use
+docker_max_pool_size = int(os.environ.get("DOCKER_MAX_POOL_SIZE", 32))
+docker_timeout = int(os.environ.get("DOCKER_TIMEOUT", 60))
+async_offload_workers = int(os.environ.get("ASYNC_OFFLOAD_WORKERS", 16))  # threads serving the async views' blocking calls
+
 db_name = os.environ.get("POSTGRES_DB")
 db_username = os.environ.get("POSTGRES_USER")
 db_password = os.environ.get("POSTGRES_PASSWORD")
@@ -17,12 +20,72 @@ db_port = int(os.environ.get("POSTGRES_PORT", "5432"))
 
 mapping_path = os.getenv("MAPPING_PATH", "~/code-spaces-mapping")
 nginx_conf_path = os.getenv("NGINX_CONF_PATH", "/nginx.conf")
+nginx_routes_dir = os.getenv("NGINX_ROUTES_DIR", "/code-spaces-routes")  # as seen by this controller
+nginx_routes_include_dir = os.getenv("NGINX_ROUTES_INCLUDE_DIR", "/etc/nginx/code-spaces-routes")  # as seen by nginx
+nginx_routing_strategy = os.getenv("NGINX_ROUTING_STRATEGY", "location")  # location, map, resolver
+nginx_resolver = os.getenv("NGINX_RESOLVER", "127.0.0.11")  # Docker embedded DNS
+nginx_reload_mode = os.getenv("NGINX_RELOAD_MODE", "exec")  # exec, force_update
+nginx_reload_debounce = float(os.environ.get("NGINX_RELOAD_DEBOUNCE", 2))
 base_url = os.getenv("BASE_URL", "http://localhost")
+code_server_image = os.getenv("CODE_SERVER_IMAGE", "taasheeadmin/code-server")
 
-accepted_containers_count = int(os.environ.get("ACCEPTED_CONTAINERS_COUNT", 5))
+accepted_containers_count = int(os.environ.get("ACCEPTED_CONTAINERS_COUNT", 5))  # slots of a node whose resources are not known yet
 min_capacity_required = int(os.environ.get("MIN_CAPACITY_REQUIRED", 2))
+scaling_policy_name = os.getenv("SCALING_POLICY", "threshold")  # threshold, rate
+scaling_rate_windows = [int(window) for window in os.getenv("SCALING_RATE_WINDOWS", "60,300").split(",")]  # seconds
+scaling_boot_latency = float(os.environ.get("SCALING_BOOT_LATENCY", 180))  # expected seconds until a new node takes sessions
+scaling_max_nodes_per_launch = int(os.environ.get("SCALING_MAX_NODES_PER_LAUNCH", 10))
+scaling_batch_interval = float(os.environ.get("SCALING_BATCH_INTERVAL", 60))  # seconds of expected demand added to each launch
+
+capacity_wait_timeout = float(os.environ.get("CAPACITY_WAIT_TIMEOUT", 900))
+capacity_poll_interval = float(os.environ.get("CAPACITY_POLL_INTERVAL", 15))
+node_provisioning_timeout = float(os.environ.get("NODE_PROVISIONING_TIMEOUT", 900))  # seconds before a node that never joined is failed
+capacity_reservation_ttl = float(os.environ.get("CAPACITY_RESERVATION_TTL", 1200))  # drop reservations never placed
+provisioning_workers = int(os.environ.get("PROVISIONING_WORKERS", 4))
+provisioning_job_timeout = float(os.environ.get("PROVISIONING_JOB_TIMEOUT", 1800))  # seconds without progress before an active job is failed, above CAPACITY_WAIT_TIMEOUT
+bulk_workers = int(os.environ.get("BULK_WORKERS", 8))
+scale_down_workers = int(os.environ.get("SCALE_DOWN_WORKERS", 8))
+
+swarm_cache_ttl = float(os.environ.get("SWARM_CACHE_TTL", 5))
+codespace_reconcile_interval = int(os.environ.get("CODESPACE_RECONCILE_INTERVAL", 60))
+
+placement_strategy = os.getenv("PLACEMENT_STRATEGY", "pack")  # pack, spread, swarm
+placement_reservation_ttl = float(os.environ.get("PLACEMENT_RESERVATION_TTL", 60))
+
+# Session resource profiles: CPUs and MiB a node must have free (reservation) and
+# a session may use at most (limit). SESSION_PROFILES (JSON) overrides or adds profiles.
+session_profiles = {
+    'small': {'cpu_reservation': 0.25, 'cpu_limit': 1, 'memory_reservation': 512, 'memory_limit': 1024},
+    'medium': {'cpu_reservation': 0.5, 'cpu_limit': 2, 'memory_reservation': 1024, 'memory_limit': 2048},
+    'large': {'cpu_reservation': 1, 'cpu_limit': 4, 'memory_reservation': 2048, 'memory_limit': 4096},
+    **json.loads(os.getenv("SESSION_PROFILES", "{}")),
+}
+default_session_profile = os.getenv("SESSION_PROFILE", "small")  # also the unit of one capacity slot
+
+consolidation_enabled = os.environ.get("CONSOLIDATION_ENABLED", "false").lower() == "true"
+consolidation_interval = int(os.environ.get("CONSOLIDATION_INTERVAL", 300))
+consolidation_max_occupancy = int(os.environ.get("CONSOLIDATION_MAX_OCCUPANCY", 2))  # nodes with at most this many sessions are drained
+consolidation_max_draining = int(os.environ.get("CONSOLIDATION_MAX_DRAINING", 1))  # nodes draining at once
+consolidation_disruption_budget = int(os.environ.get("CONSOLIDATION_DISRUPTION_BUDGET", 5))  # sessions moved per run
+consolidation_migrate_sessions = os.environ.get("CONSOLIDATION_MIGRATE_SESSIONS", "false").lower() == "true"
+
+image_prepull_enabled = os.environ.get("IMAGE_PREPULL_ENABLED", "false").lower() == "true"
+warm_pool_size = int(os.environ.get("WARM_POOL_SIZE", 0))  # idle workers kept on standby
+warm_pool_interval = int(os.environ.get("WARM_POOL_INTERVAL", 30))
+
+swarm_mirror_enabled = os.environ.get("SWARM_MIRROR_ENABLED", "true").lower() == "true"
+swarm_mirror_reconnect_delay = float(os.environ.get("SWARM_MIRROR_RECONNECT_DELAY", 5))
+swarm_mirror_resync_interval = float(os.environ.get("SWARM_MIRROR_RESYNC_INTERVAL", 300))
+
+readiness_poll_interval = float(os.environ.get("READINESS_POLL_INTERVAL", 1))  # one poll serves every watched session
+readiness_stream_timeout = float(os.environ.get("READINESS_STREAM_TIMEOUT", 900))
+readiness_keepalive = float(os.environ.get("READINESS_KEEPALIVE", 15))
 
 access_key = os.environ.get("ACCESS_KEY")
 secret_access_key = os.environ.get("SECRET_ACCESS_KEY")
 region = os.environ.get("REGION")
-launch_template_id = os.environ.get("LAUNCH_TEMPLATE_ID", 'lt-0d1c50952a593a1a8')
\ No newline at end of file
+launch_template_id = os.environ.get("LAUNCH_TEMPLATE_ID", 'lt-0d1c50952a593a1a8')
+cloud_provider_name = os.getenv("CLOUD_PROVIDER", "ec2")  # ec2, local, simulated
+sim_boot_latency = float(os.environ.get("SIM_BOOT_LATENCY", 180))
+sim_failure_rate = float(os.environ.get("SIM_FAILURE_RATE", 0.0))
+ec2_max_attempts = int(os.environ.get("EC2_MAX_ATTEMPTS", 5))
\ No newline at end of file
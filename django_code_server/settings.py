@@ -101,6 +101,12 @@ else:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # SQLite ignores select_for_update, taking the write lock at BEGIN
+            # keeps the capacity ledger serialized here too
+            'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 20},
+            # A file, not the shared in-memory default, so the concurrency tests'
+            # threads wait on the write lock instead of failing with "table is locked"
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
         }
     }
 
@@ -12,5 +12,13 @@ import os
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_code_server.settings')
+# Serving process: opt in to the scheduler and swarm mirror
+os.environ.setdefault('SCHEDULER_AUTOSTART', 'true')
 
 application = get_wsgi_application()
+
+# runserver imports this module after AppConfig.ready() has run; starting
+# again is a no-op when ready() already did it
+from docker_swarm.utils.scheduler import start_background_services_if_enabled  # noqa: E402
+
+start_background_services_if_enabled()
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from docker_swarm.models import NodeInstance, ScalingState
+from docker_swarm.models import NodeInstance, ScalingState, ProvisioningJob, NginxRoute, NginxState, CodeSpace, CapacityReservation
 
 # Register your models here.
-admin.site.register([NodeInstance, ScalingState])
\ No newline at end of file
+admin.site.register([NodeInstance, ScalingState, ProvisioningJob, NginxRoute, NginxState, CodeSpace, CapacityReservation])
\ No newline at end of file
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class DockerSwarmConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'docker_swarm'
+
+    def ready(self):
+        from docker_swarm.utils.scheduler import start_background_services_if_enabled
+
+        start_background_services_if_enabled()
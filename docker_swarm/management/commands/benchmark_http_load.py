@@ -0,0 +1,101 @@
+import http.client
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def read_thread_count(pid: int):
+    try:
+        with open(f"/proc/{pid}/status") as status_file:
+            for line in status_file:
+                if line.startswith("Threads:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def run_load(url: str, total: int, concurrency: int, pid: int = None):
+    """
+    Send `total` GETs to `url` from `concurrency` client threads. With
+    `pid`, the server process' thread count is sampled on the way.
+    """
+    parsed = urlparse(url)
+    path = parsed.path + (f"?{parsed.query}" if parsed.query else "")
+    latencies, statuses, errors = [], {}, []
+    lock = threading.Lock()
+    peak_threads = [0]
+    done = threading.Event()
+
+    def sample():
+        while not done.is_set():
+            peak_threads[0] = max(peak_threads[0], read_thread_count(pid) or 0)
+            time.sleep(0.02)
+
+    def request(_):
+        connection = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=120)
+        started = time.perf_counter()
+        try:
+            connection.request("GET", path)
+            response = connection.getresponse()
+            response.read()
+            with lock:
+                latencies.append(time.perf_counter() - started)
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+        finally:
+            connection.close()
+
+    if pid:
+        threading.Thread(target=sample, daemon=True).start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(request, range(total)))
+    elapsed = time.perf_counter() - started
+    done.set()
+
+    latencies.sort()
+    result = {
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+        'p95_ms': round(latencies[int(len(latencies) * 0.95)] * 1000, 1) if latencies else None,
+        'statuses': statuses,
+        'errors': len(errors),
+    }
+    if pid:
+        result['server_threads_peak'] = peak_threads[0]
+    return result
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test running servers and print throughput, latency and (with --pid) the server's peak "
+        "thread count. To compare WSGI and ASGI, start `fake_docker_api --latency 0.05`, point both "
+        "servers at it with DOCKER_HOST, e.g. `runserver 8001` and `uvicorn django_code_server.asgi:application "
+        "--port 8002`, then pass the same path on both, such as http://127.0.0.1:8001/node and "
+        "http://127.0.0.1:8002/async/node."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', action='append', required=True, help="URL to load, repeatable.")
+        parser.add_argument('--pid', type=int, action='append', default=[], help="Server PID per --url, for thread sampling.")
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=200)
+
+    def handle(self, *args, **options):
+        urls, pids = options['url'], options['pid']
+        if pids and len(pids) != len(urls):
+            raise CommandError("Give one --pid per --url, or none.")
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError("--requests and --concurrency must be at least 1.")
+
+        report = {}
+        for i, url in enumerate(urls):
+            report[url] = run_load(url, options['requests'], options['concurrency'], pids[i] if pids else None)
+        self.stdout.write(json.dumps(report, indent=2))
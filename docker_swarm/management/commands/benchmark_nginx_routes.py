@@ -0,0 +1,65 @@
+import json
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from docker_swarm.utils.nginx_utils import ROUTING_STRATEGIES, MAP_FILE, render_location_block, write_atomic
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def write_files(directory: str, files: dict):
+    for relative_path, content in files.items():
+        write_atomic(os.path.join(directory, relative_path), content)
+
+
+class Command(BaseCommand):
+    help = (
+        "Render N session routes with every nginx routing strategy into a scratch directory and print "
+        "the full render time, the config size and the cost of one session change. Touches neither "
+        "the database nor the live nginx config."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--routes', type=int, default=5000)
+        parser.add_argument('--changes', type=int, default=100, help="Session changes timed per strategy.")
+
+    def handle(self, *args, **options):
+        if options['routes'] < 1 or options['changes'] < 1:
+            raise CommandError("--routes and --changes must be at least 1.")
+        usernames = [f"user{i:05d}" for i in range(options['routes'])]
+        report = {}
+
+        for name, strategy in sorted(ROUTING_STRATEGIES.items()):
+            with tempfile.TemporaryDirectory() as directory:
+                os.makedirs(os.path.join(directory, "http"))
+                files, render_seconds = timed(strategy.render, usernames)
+                _, write_seconds = timed(write_files, directory, files)
+
+                # One session added, done the way the strategy's add_route does it
+                change_seconds = []
+                for i in range(options['changes']):
+                    username = f"new{i:05d}"
+                    started = time.perf_counter()
+                    if name == "location":
+                        write_atomic(os.path.join(directory, f"{username}.conf"), render_location_block(username))
+                    elif name == "map":
+                        write_atomic(os.path.join(directory, MAP_FILE), strategy.render_map(usernames + [username]))
+                    change_seconds.append(time.perf_counter() - started)
+
+                change_seconds.sort()
+                report[name] = {
+                    'files': len(files),
+                    'config_bytes': sum(len(content) for content in files.values()),
+                    'full_render_ms': round((render_seconds + write_seconds) * 1000, 2),
+                    'change_p50_ms': round(change_seconds[len(change_seconds) // 2] * 1000, 3),
+                    'change_max_ms': round(change_seconds[-1] * 1000, 3),
+                    'reload_per_change': strategy.reload_on_change,
+                }
+        self.stdout.write(json.dumps({'routes': options['routes'], 'strategies': report}, indent=2))
@@ -0,0 +1,43 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from docker_swarm.utils.node_utils import get_api_client, get_docker_node_detail_info
+
+
+class Command(BaseCommand):
+    help = (
+        "Call get_docker_node_detail_info against DOCKER_HOST and print the Docker API requests and "
+        "time per call. Run `fake_docker_api` for a daemon with many workers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calls', type=int, default=10)
+
+    def handle(self, *args, **options):
+        if options['calls'] < 1:
+            raise CommandError("--calls must be at least 1.")
+        api_client = get_api_client()
+        # Connect (and negotiate the API version) before counting
+        api_client.ping()
+
+        requests = []
+        api_client.hooks['response'].append(lambda response, *args, **kwargs: requests.append(response.request.path_url))
+        durations = []
+        for _ in range(options['calls']):
+            started = time.perf_counter()
+            response = get_docker_node_detail_info()
+            durations.append(time.perf_counter() - started)
+            if response['status'] != 'success':
+                raise CommandError(response['error'])
+
+        durations.sort()
+        self.stdout.write(json.dumps({
+            'workers': len(response['data']),
+            'tasks': sum(node['tasks_count'] for node in response['data']),
+            'requests_per_call': len(requests) / options['calls'],
+            'paths': sorted({path.split('?')[0] for path in requests}),
+            'p50_ms': round(durations[len(durations) // 2] * 1000, 2),
+            'max_ms': round(durations[-1] * 1000, 2),
+        }, indent=2))
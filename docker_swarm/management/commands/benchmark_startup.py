@@ -0,0 +1,54 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Startup must not need Docker: every run points at a socket that does not exist
+UNREACHABLE_DOCKER_HOST = "unix:///nonexistent/docker.sock"
+
+STARTUP_TARGETS = {
+    'manage_check': [sys.executable, "manage.py", "check"],
+    'wsgi_import': [sys.executable, "-c", "import django_code_server.wsgi"],
+    'urls_import': [sys.executable, "-c", "import django; django.setup(); import django_code_server.urls"],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Time `manage.py check`, the WSGI import and the URLconf import in fresh processes, "
+        "with Docker unreachable and the background services off, and print the medians."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+
+    def handle(self, *args, **options):
+        if options['runs'] < 1:
+            raise CommandError("--runs must be at least 1.")
+        env = {
+            **os.environ,
+            'DOCKER_HOST': UNREACHABLE_DOCKER_HOST,
+            'SCHEDULER_AUTOSTART': 'false',
+            'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'django_code_server.settings'),
+        }
+
+        report = {}
+        for name, command in STARTUP_TARGETS.items():
+            durations = []
+            for _ in range(options['runs']):
+                started = time.perf_counter()
+                completed = subprocess.run(command, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+                durations.append(time.perf_counter() - started)
+                if completed.returncode != 0:
+                    raise CommandError(f"{name} exited with {completed.returncode}: {completed.stderr.strip()[-500:]}")
+            report[name] = {
+                'median_s': round(statistics.median(durations), 3),
+                'min_s': round(min(durations), 3),
+                'max_s': round(max(durations), 3),
+            }
+        self.stdout.write(json.dumps({'runs': options['runs'], 'docker_host': UNREACHABLE_DOCKER_HOST, 'results': report}, indent=2))
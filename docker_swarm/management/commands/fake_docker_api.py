@@ -0,0 +1,124 @@
+import json
+import os
+import signal
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from django.core.management.base import BaseCommand, CommandError
+
+from docker_swarm.utils.session_profiles import get_slot_size
+
+
+def build_swarm(workers: int, tasks_per_worker: int):
+    """
+    Worker nodes sized for `tasks_per_worker` default-profile sessions and
+    one running session task per slot.
+    """
+    slot_cpu, slot_memory = get_slot_size()
+    nodes = [{
+        'ID': f"node{i}",
+        'Version': {'Index': 1},
+        'Spec': {'Role': 'worker', 'Availability': 'active', 'Labels': {}},
+        'Description': {'Hostname': f"worker{i}", 'Resources': {
+            'NanoCPUs': max(slot_cpu, 1) * tasks_per_worker, 'MemoryBytes': max(slot_memory, 1) * tasks_per_worker,
+        }},
+        'Status': {'State': 'ready', 'Addr': f"10.1.{i // 250}.{i % 250 + 1}"},
+    } for i in range(workers)]
+    tasks = [{
+        'ID': f"task{i}-{j}",
+        'ServiceID': f"service{i}-{j}",
+        'NodeID': f"node{i}",
+        'DesiredState': 'running',
+        'CreatedAt': "2025-01-01T00:00:00Z",
+        'Spec': {'ContainerSpec': {'Image': 'code-server', 'Labels': {}}},
+        'Status': {'State': 'running', 'Timestamp': "2025-01-01T00:00:00Z"},
+    } for i in range(workers) for j in range(tasks_per_worker)]
+    return nodes, tasks
+
+
+class FakeDockerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        return request, ("fake", 0)
+
+
+def stop_serving(signum, frame):
+    raise KeyboardInterrupt
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve a read-only fake of the Docker Engine API on a unix socket, with a swarm of "
+        "WORKERS nodes, for the benchmarks. Point DOCKER_HOST=unix://<socket> at it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default="/tmp/fake-docker.sock")
+        parser.add_argument('--workers', type=int, default=60)
+        parser.add_argument('--tasks-per-worker', type=int, default=4)
+        parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every response.")
+        parser.add_argument('--api-version', default="1.41")
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['tasks_per_worker'] < 1:
+            raise CommandError("--workers and --tasks-per-worker must be at least 1.")
+        nodes, tasks = build_swarm(options['workers'], options['tasks_per_worker'])
+        latency, api_version = options['latency'], options['api_version']
+        counts, counts_lock = {}, threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                path = "/" + url.path.strip("/").split("/", 1)[-1] if url.path.startswith("/v1.") else url.path
+                with counts_lock:
+                    counts[path] = counts.get(path, 0) + 1
+                if latency:
+                    time.sleep(latency)
+
+                filters = json.loads(parse_qs(url.query).get('filters', ['{}'])[0])
+                if path == "/nodes":
+                    body = nodes
+                elif path == "/tasks":
+                    services = filters.get('service') or []
+                    services = [services] if isinstance(services, str) else services
+                    body = [task for task in tasks if not services or task['ServiceID'] in services]
+                elif path in ("/services", "/containers/json"):
+                    body = []
+                elif path == "/_ping":
+                    body = "OK"
+                else:
+                    body = {'ApiVersion': api_version, 'Version': "fake"}
+                self.respond(body)
+
+            def respond(self, body):
+                data = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        if os.path.exists(options['socket']):
+            os.remove(options['socket'])
+        server = FakeDockerServer(options['socket'], Handler)
+        signal.signal(signal.SIGTERM, stop_serving)
+        self.stdout.write(f"Fake Docker API with {len(nodes)} workers and {len(tasks)} tasks on unix://{options['socket']}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            os.remove(options['socket'])
+            self.stdout.write(json.dumps({'requests': counts}, indent=2, sort_keys=True))
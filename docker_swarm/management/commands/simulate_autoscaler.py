@@ -0,0 +1,60 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from config import sim_boot_latency, sim_failure_rate
+from docker_swarm.utils.autoscale_sim import run_autoscaler_simulation
+from docker_swarm.utils.scaling_policy import SCALING_POLICIES
+
+
+def parse_param(value: str):
+    key, sep, raw = value.partition('=')
+    if not sep:
+        raise CommandError(f"--param expects key=value, got '{value}'.")
+    try:
+        return key, json.loads(raw)
+    except json.JSONDecodeError:
+        return key, raw
+
+
+class Command(BaseCommand):
+    help = "Replay a synthetic login storm against the scale-up logic on a simulated cloud and print the report."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=1000)
+        parser.add_argument('--rate', type=float, default=1.0, help="Session arrivals per second.")
+        parser.add_argument('--boot-latency', type=float, default=sim_boot_latency)
+        parser.add_argument('--failure-rate', type=float, default=sim_failure_rate)
+        parser.add_argument('--session-duration', type=float, default=None, help="Mean session lifetime in seconds.")
+        parser.add_argument('--initial-nodes', type=int, default=1)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--policy', default="threshold", choices=sorted(SCALING_POLICIES))
+        parser.add_argument('--param', action='append', default=[], help="Policy parameter as key=value (JSON values).")
+        parser.add_argument('--compare', action='store_true', help="Run every policy with its defaults and print a summary.")
+
+    def handle(self, *args, **options):
+        simulation = dict(
+            session_count=options['sessions'],
+            arrival_rate=options['rate'],
+            boot_latency=options['boot_latency'],
+            failure_rate=options['failure_rate'],
+            session_duration=options['session_duration'],
+            initial_nodes=options['initial_nodes'],
+            seed=options['seed'],
+        )
+        try:
+            if not options['compare']:
+                params = dict(parse_param(value) for value in options['param'])
+                report = run_autoscaler_simulation(policy=options['policy'], policy_params=params, **simulation)
+                self.stdout.write(json.dumps(report, indent=2))
+                return
+
+            summary = {}
+            for name in sorted(SCALING_POLICIES):
+                report = run_autoscaler_simulation(policy=name, **simulation)
+                summary[name] = {key: report[key] for key in (
+                    'wait_p50', 'wait_p95', 'wait_max', 'timed_out', 'nodes_launched', 'launch_calls', 'overprovisioning'
+                )}
+            self.stdout.write(json.dumps(summary, indent=2))
+        except ValueError as e:
+            raise CommandError(str(e))
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 08:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docker_swarm', '0004_nginxroute'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodeSpace',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('username', models.CharField(max_length=100, unique=True)),
+                ('service_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('service_name', models.CharField(max_length=150, unique=True)),
+                ('node_id', models.CharField(blank=True, db_index=True, max_length=100, null=True)),
+                ('image', models.CharField(blank=True, default='', max_length=255)),
+                ('port', models.PositiveIntegerField(blank=True, null=True)),
+                ('state', models.CharField(db_index=True, default='pending', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
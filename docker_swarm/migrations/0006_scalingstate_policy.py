@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-18 08:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docker_swarm', '0005_codespace'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scalingstate',
+            name='scaling_policy',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='scalingstate',
+            name='scaling_policy_params',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
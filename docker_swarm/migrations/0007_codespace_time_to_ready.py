@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 08:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docker_swarm', '0006_scalingstate_policy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codespace',
+            name='ready_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='codespace',
+            name='requested_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='codespace',
+            name='warm_start',
+            field=models.BooleanField(blank=True, null=True),
+        ),
+    ]
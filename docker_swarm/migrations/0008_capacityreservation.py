@@ -0,0 +1,22 @@
+# Generated by Django 5.2.1 on 2026-10-18 08:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docker_swarm', '0007_codespace_time_to_ready'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CapacityReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner', models.CharField(max_length=100, unique=True)),
+                ('slots', models.PositiveIntegerField(default=1)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-18 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docker_swarm', '0008_capacityreservation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='nodeinstance',
+            name='private_ip',
+            field=models.GenericIPAddressField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='nodeinstance',
+            name='status',
+            field=models.CharField(db_index=True, default='provisioning', max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docker_swarm', '0009_nodeinstance_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='provisioningjob',
+            name='profile',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+    ]
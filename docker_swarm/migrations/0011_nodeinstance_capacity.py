@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docker_swarm', '0010_provisioningjob_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nodeinstance',
+            name='capacity',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='nodeinstance',
+            name='instance_type',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+    ]
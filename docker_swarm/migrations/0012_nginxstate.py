@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docker_swarm', '0011_nodeinstance_capacity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NginxState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(default='global', max_length=100, unique=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
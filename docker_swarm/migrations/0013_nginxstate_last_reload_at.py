@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docker_swarm', '0012_nginxstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nginxstate',
+            name='last_reload_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.1 on 2026-10-18 09:41
+
+from django.db import migrations, models
+
+
+def fail_duplicate_active_jobs(apps, schema_editor):
+    # Keep each user's newest active job, the constraint allows only one
+    ProvisioningJob = apps.get_model('docker_swarm', 'ProvisioningJob')
+    active = ProvisioningJob.objects.filter(state__in=('queued', 'scaling', 'creating', 'routing')).order_by('username', '-created_at')
+    seen, duplicates = set(), []
+    for job in active.only('pk', 'username'):
+        if job.username in seen:
+            duplicates.append(job.pk)
+        seen.add(job.username)
+    ProvisioningJob.objects.filter(pk__in=duplicates).update(state='failed', message="Superseded by a newer job.")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docker_swarm', '0013_nginxstate_last_reload_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_duplicate_active_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='provisioningjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('state__in', ('queued', 'scaling', 'creating', 'routing'))), fields=('username',), name='one_active_provisioning_job_per_user'),
+        ),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 5.2.1 on 2026-10-18 09:42
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docker_swarm', '0014_provisioningjob_one_active_per_user'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='PortReservation',
+        ),
+    ]
@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 
 # Create your models here.
@@ -5,8 +7,10 @@ from django.db import models
 class NodeInstance(models.Model):
     instance_id = models.CharField(max_length=100, unique=True)
     node_id = models.CharField(max_length=100, null=True, blank=True)
-    private_ip = models.GenericIPAddressField()
-    status = models.CharField(max_length=20, default='provisioning')  # provisioning, active, failed, removed
+    private_ip = models.GenericIPAddressField(db_index=True)
+    status = models.CharField(max_length=20, default='provisioning', db_index=True)  # provisioning, active, draining, failed, removed
+    instance_type = models.CharField(max_length=50, blank=True, default='')
+    capacity = models.PositiveIntegerField(null=True, blank=True)  # slots, expected at launch and measured once joined
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -17,7 +21,86 @@ class NodeInstance(models.Model):
 class ScalingState(models.Model):
     key = models.CharField(max_length=100, unique=True, default='global')
     pending_capacity = models.PositiveIntegerField(default=0)
+    scaling_policy = models.CharField(max_length=50, blank=True, default='')  # empty: SCALING_POLICY
+    scaling_policy_params = models.JSONField(default=dict, blank=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.key} - Pending: {self.pending_capacity}"
+
+
+class CapacityReservation(models.Model):
+    owner = models.CharField(max_length=100, unique=True)
+    slots = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.owner} ({self.slots})"
+
+
+ACTIVE_JOB_STATES = ('queued', 'scaling', 'creating', 'routing')
+
+
+class ProvisioningJob(models.Model):
+    job_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    username = models.CharField(max_length=100, db_index=True)
+    profile = models.CharField(max_length=50, blank=True, default='')  # session resource profile, the default one when empty
+    state = models.CharField(max_length=20, default='queued')  # queued, scaling, creating, routing, completed, failed
+    message = models.TextField(blank=True, default='')
+    result = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    ACTIVE_STATES = ACTIVE_JOB_STATES
+
+    class Meta:
+        constraints = [
+            # One job at a time per user, concurrent submissions share it
+            models.UniqueConstraint(fields=['username'], condition=models.Q(state__in=ACTIVE_JOB_STATES),
+                                    name='one_active_provisioning_job_per_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.username} ({self.state})"
+
+
+class NginxRoute(models.Model):
+    username = models.CharField(max_length=100, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"/{self.username}/"
+
+
+class NginxState(models.Model):
+    key = models.CharField(max_length=100, unique=True, default='global')
+    last_reload_at = models.DateTimeField(null=True, blank=True)  # start of the latest applied reload, any process
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.key
+
+
+class CodeSpace(models.Model):
+    username = models.CharField(max_length=100, unique=True)
+    service_id = models.CharField(max_length=100, null=True, blank=True)
+    service_name = models.CharField(max_length=150, unique=True)
+    node_id = models.CharField(max_length=100, null=True, blank=True, db_index=True)
+    image = models.CharField(max_length=255, blank=True, default='')
+    port = models.PositiveIntegerField(null=True, blank=True)
+    state = models.CharField(max_length=20, default='pending', db_index=True)  # pending, running
+    requested_at = models.DateTimeField(null=True, blank=True)  # when the session was asked for
+    ready_at = models.DateTimeField(null=True, blank=True)  # when its task first ran
+    warm_start = models.BooleanField(null=True, blank=True)  # pinned to a node with the image pulled
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def time_to_ready(self):
+        if self.requested_at is None or self.ready_at is None:
+            return None
+        return round((self.ready_at - self.requested_at).total_seconds(), 3)
+
+    def __str__(self):
+        return f"{self.username} ({self.state})"
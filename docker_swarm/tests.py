@@ -1,3 +1,1550 @@
-from django.test import TestCase
+import asyncio
+import math
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import boto3
+import docker
+from asgiref.sync import sync_to_async
+from botocore.stub import Stubber
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from config import provisioning_job_timeout
+from docker_swarm.models import ProvisioningJob, CapacityReservation, CodeSpace, NginxRoute, NodeInstance, ScalingState
+from docker_swarm.utils import (
+    autoscale_sim, bulk_utils, cloud_provider, codespace_utils, consolidation, custom_utils, docker_utils, job_queue,
+    nginx_utils, node_utils, readiness, scale_up, warm_pool
+)
+from docker_swarm.utils.cloud_provider import EC2Provider, LocalProvider, SimulatedProvider, get_cloud_provider, set_cloud_provider
+from docker_swarm.utils.labels import NODE_CAPACITY_LABEL, OWNER_LABEL, PORT_LABEL, CREATED_AT_LABEL
+from docker_swarm.utils.placement import PlacementEngine
+from docker_swarm.utils.scaling_policy import ThresholdPolicy, RatePolicy, build_scaling_policy
+from docker_swarm.utils.swarm_cache import SwarmStateCache
+from docker_swarm.utils.session_profiles import get_node_slots, get_slot_size
+from docker_swarm.utils.swarm_mirror import SwarmStateMirror
+from docker_swarm.views import async_views, node_views, readiness_views
+
+
+def make_node(node_id, slots=None, labels=None, availability='active'):
+    """
+    Raw worker node attrs; `slots` sizes its resources in default-profile sessions.
+    """
+    slot_cpu, slot_memory = get_slot_size()
+    resources = {'NanoCPUs': slot_cpu * slots, 'MemoryBytes': slot_memory * slots} if slots else {}
+    return {
+        'ID': node_id,
+        'Spec': {'Role': 'worker', 'Availability': availability, 'Labels': labels or {}},
+        'Description': {'Hostname': node_id, 'Resources': resources},
+        'Status': {'State': 'ready', 'Addr': '10.0.0.1'},
+    }
+
+
+def make_task(task_id, service_id, node_id, slots=None):
+    """
+    Raw running task; `slots` sets reservations worth that many default-profile sessions.
+    """
+    slot_cpu, slot_memory = get_slot_size()
+    resources = {'Reservations': {'NanoCPUs': slot_cpu * slots, 'MemoryBytes': slot_memory * slots}} if slots else {}
+    return {
+        'ID': task_id,
+        'ServiceID': service_id,
+        'NodeID': node_id,
+        'Spec': {'ContainerSpec': {'Image': 'code-server'}, 'Resources': resources},
+        'Status': {'State': 'running'},
+    }
+
+
+def make_task_info(slots):
+    slot_cpu, slot_memory = get_slot_size()
+    return {'cpu_reservation': slot_cpu * slots, 'memory_reservation': slot_memory * slots}
+
+
+class FakeSwarmClient:
+    """
+    The `docker.APIClient` calls the swarm mirror makes, answered from dicts.
+    """
+    def __init__(self, nodes, tasks):
+        self.nodes_by_id = {node['ID']: node for node in nodes}
+        self.task_list = list(tasks)
+
+    def nodes(self, filters=None):
+        return list(self.nodes_by_id.values())
+
+    def inspect_node(self, node_id):
+        return self.nodes_by_id[node_id]
+
+    def tasks(self, filters=None):
+        service_id = (filters or {}).get('service')
+        return [task for task in self.task_list if service_id is None or task['ServiceID'] == service_id]
+
+
+class FakeNodeClient(FakeSwarmClient):
+    """
+    FakeSwarmClient that also takes node updates, node removals and service
+    updates. A node in `errors` raises that exception on update or removal.
+    """
+    def __init__(self, nodes, errors=None):
+        super().__init__(nodes, [])
+        self.errors = errors or {}
+        self.node_updates = []
+        self.removed = []
+        self.service_updates = []
+
+    def inspect_node(self, node_id):
+        if node_id not in self.nodes_by_id:
+            raise docker.errors.NotFound(f"node {node_id} not found")
+        return {**self.nodes_by_id[node_id], 'Version': {'Index': 1}}
+
+    def update_node(self, node_id, version, node_spec=None):
+        if node_id in self.errors:
+            raise self.errors[node_id]
+        self.nodes_by_id[node_id]['Spec'] = node_spec
+        self.node_updates.append((node_id, node_spec['Availability']))
+
+    def remove_node(self, node_id, force=False):
+        if node_id in self.errors:
+            raise self.errors[node_id]
+        if self.nodes_by_id.pop(node_id, None) is None:
+            raise docker.errors.NotFound(f"node {node_id} not found")
+        self.removed.append(node_id)
+
+    def inspect_service(self, service):
+        return {'ID': service, 'Version': {'Index': 1},
+                'Spec': {'TaskTemplate': {'Placement': {'Constraints': ['node.role == worker']}}}}
+
+    def update_service(self, service, version, task_template=None, fetch_current_spec=False):
+        self.service_updates.append((service, task_template['Placement']['Constraints']))
+
+
+class NodeSlotsTests(TestCase):
+    def test_capacity_label_wins(self):
+        node = make_node('n1', slots=8, labels={NODE_CAPACITY_LABEL: '3'})
+        self.assertEqual(get_node_slots(node, [make_task_info(1)]), (3, 2))
+
+    def test_counts_slots_from_resources(self):
+        node = make_node('n1', slots=8)
+        self.assertEqual(get_node_slots(node, []), (8, 8))
+        self.assertEqual(get_node_slots(node, [make_task_info(1), make_task_info(4)]), (8, 3))
+
+    def test_free_slots_never_negative(self):
+        node = make_node('n1', slots=2)
+        self.assertEqual(get_node_slots(node, [make_task_info(4)]), (2, 0))
+
+    def test_unknown_resources_fall_back_to_accepted_count(self):
+        from config import accepted_containers_count
+
+        node = make_node('n1')
+        self.assertEqual(get_node_slots(node, [make_task_info(1)]), (accepted_containers_count, accepted_containers_count - 1))
+
+
+class SwarmMirrorTests(TestCase):
+    def setUp(self):
+        self.client = FakeSwarmClient(
+            nodes=[make_node('n1', slots=8), make_node('n2', slots=4)],
+            tasks=[
+                make_task('t1', 's1', 'n1'),
+                make_task('t2', 's1', 'n1', slots=2),
+                make_task('t3', 's2', 'n2', slots=4),
+            ],
+        )
+        self.mirror = SwarmStateMirror(api_client=self.client)
+        self.mirror.resync()
+
+    def test_resync_counts_free_slots(self):
+        self.assertEqual(self.mirror.available_capacity(), 5)
+
+    def test_service_remove_event_frees_its_slots(self):
+        self.mirror.handle_event({'Type': 'service', 'Action': 'remove', 'Actor': {'ID': 's1'}})
+        self.assertEqual(self.mirror.available_capacity(), 8)
+        self.assertEqual(self.mirror.stats()['tasks'], 1)
+
+    def test_refresh_service_replaces_tasks(self):
+        self.client.task_list = [task for task in self.client.task_list if task['ServiceID'] != 's2']
+        self.client.task_list.append(make_task('t4', 's2', 'n1', slots=3))
+        self.mirror.refresh_service('s2')
+
+        self.assertEqual(self.mirror.available_capacity(), 6)
+        free = {node['id']: node['free_slots'] for node in self.mirror.node_detail_list()}
+        self.assertEqual(free, {'n1': 2, 'n2': 4})
+
+    def test_drained_node_offers_no_slots(self):
+        self.client.nodes_by_id['n2'] = make_node('n2', slots=4, availability='drain')
+        self.client.task_list = [task for task in self.client.task_list if task['NodeID'] != 'n2']
+        self.mirror.handle_event({'Type': 'node', 'Action': 'update', 'Actor': {'ID': 'n2'}})
+        self.assertEqual(self.mirror.available_capacity(), 5)
+
+    def test_node_remove_event_drops_its_tasks(self):
+        del self.client.nodes_by_id['n2']
+        self.client.task_list = [task for task in self.client.task_list if task['NodeID'] != 'n2']
+        self.mirror.handle_event({'Type': 'node', 'Action': 'remove', 'Actor': {'ID': 'n2'}})
+
+        stats = self.mirror.stats()
+        self.assertEqual((stats['nodes'], stats['tasks'], stats['events']), (1, 2, 1))
+        self.assertEqual([node['id'] for node in self.mirror.node_detail_list()], ['n1'])
+        self.assertEqual(self.mirror.available_capacity(), 5)
+
+
+class ProvisioningJobTests(TestCase):
+    def test_active_job_is_returned(self):
+        with mock.patch.object(job_queue.executor, 'submit') as submit:
+            first = job_queue.enqueue_provisioning('alice')
+            second = job_queue.enqueue_provisioning('alice')
+        self.assertEqual(first.pk, second.pk)
+        submit.assert_called_once()
+
+    def test_duplicate_submission_shares_the_winning_job(self):
+        winner = ProvisioningJob.objects.create(username='alice')
+        lookups = [None]
+        real_lookup = job_queue.get_active_job
+
+        def racing_lookup(username):
+            # The first lookup runs before the winner's insert is visible
+            return lookups.pop() if lookups else real_lookup(username)
+
+        with mock.patch.object(job_queue, 'get_active_job', side_effect=racing_lookup), \
+                mock.patch.object(job_queue.executor, 'submit') as submit:
+            job = job_queue.enqueue_provisioning('alice')
+
+        self.assertEqual(job.pk, winner.pk)
+        submit.assert_not_called()
+        self.assertEqual(ProvisioningJob.objects.filter(username='alice').count(), 1)
+
+    def test_finished_jobs_do_not_block_a_new_one(self):
+        ProvisioningJob.objects.create(username='alice', state='failed')
+        ProvisioningJob.objects.create(username='alice', state='completed')
+        with mock.patch.object(job_queue.executor, 'submit') as submit:
+            job = job_queue.enqueue_provisioning('alice')
+        self.assertEqual(job.state, 'queued')
+        submit.assert_called_once()
+
+    def test_stale_job_is_failed_and_replaced(self):
+        stale = ProvisioningJob.objects.create(username='alice', state='scaling')
+        ProvisioningJob.objects.filter(pk=stale.pk).update(
+            updated_at=timezone.now() - timedelta(seconds=provisioning_job_timeout + 1))
+        CapacityReservation.objects.create(owner='alice', slots=1)
+
+        with mock.patch.object(job_queue.executor, 'submit'):
+            job = job_queue.enqueue_provisioning('alice')
+
+        stale.refresh_from_db()
+        self.assertEqual(stale.state, 'failed')
+        self.assertNotEqual(job.pk, stale.pk)
+        self.assertFalse(CapacityReservation.objects.filter(owner='alice').exists())
+
+    def test_failure_after_create_rolls_back_the_service(self):
+        job = ProvisioningJob.objects.create(username='alice')
+        # The test transaction must keep its connection
+        with mock.patch.object(job_queue, 'close_old_connections'), \
+                mock.patch.object(job_queue, 'check_and_scale_up', return_value=''), \
+                mock.patch.object(job_queue, 'wait_for_capacity', return_value=True), \
+                mock.patch.object(job_queue, 'create_code_server_service', return_value={'ID': 'svc1'}), \
+                mock.patch.object(job_queue, 'update_nginx_config', side_effect=OSError("disk full")), \
+                mock.patch.object(job_queue, 'remove_code_server_service') as remove_service, \
+                mock.patch.object(job_queue, 'remove_nginx_config', return_value=False):
+            job_queue.run_provisioning_job(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual(job.state, 'failed')
+        remove_service.assert_called_once_with('alice')
+        self.assertFalse(CodeSpace.objects.filter(username='alice').exists())
+
+
+class FakeServices:
+    """
+    `docker_client.services.get` over a set of existing service names.
+    Other names raise `errors`, NotFound by default.
+    """
+    def __init__(self, existing=(), errors=None):
+        self.existing = set(existing)
+        self.errors = errors or {}
+
+    def get(self, name):
+        if name in self.existing:
+            return mock.Mock(name=name)
+        raise self.errors.get(name, docker.errors.NotFound(f"service {name} not found"))
+
+
+class BulkCreateTests(TestCase):
+    def setUp(self):
+        previous = get_cloud_provider()
+        self.addCleanup(set_cloud_provider, previous)
+        self.provider = LocalProvider()
+        set_cloud_provider(self.provider)
+
+        services = FakeServices(existing={'bob-code-server'}, errors={'dave-code-server': OSError("manager down")})
+        real_enqueue = job_queue.enqueue_provisioning
+
+        def enqueue(username, *args, **kwargs):
+            if username == 'carol':
+                raise OSError("database is locked")
+            return real_enqueue(username, *args, **kwargs)
+
+        node = {'id': 'n1', 'ip': '10.0.0.1', 'availability': 'active', 'status': 'ready',
+                'total_slots': 8, 'free_slots': 8, 'tasks_count': 0, 'tasks': []}
+        for patcher in (
+            mock.patch.object(docker_utils, 'docker_client', mock.Mock(services=services)),
+            mock.patch.object(bulk_utils, 'enqueue_provisioning', side_effect=enqueue),
+            mock.patch.object(scale_up, 'get_node_snapshot', return_value=[node]),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(job_queue.executor, 'submit')
+        self.submit = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_each_user_gets_a_job_or_an_error(self):
+        results = bulk_utils.create_sessions_bulk(['alice', 'bob', 'carol', 'dave', 'erin'])
+
+        by_user = {result['username']: result for result in results}
+        self.assertEqual([result['username'] for result in results], ['alice', 'bob', 'carol', 'dave', 'erin'])
+        self.assertEqual({username for username, result in by_user.items() if result['status'] == 'success'}, {'alice', 'erin'})
+        self.assertIn("already exists", by_user['bob']['error'])
+        self.assertEqual(by_user['carol']['error'], "database is locked")
+        self.assertEqual(by_user['dave']['error'], "manager down")
+        self.assertEqual(bulk_utils.get_bulk_status_code(results, success_status=202), 207)
+
+        jobs = ProvisioningJob.objects.filter(username__in=['alice', 'erin'])
+        self.assertEqual({str(job.job_id) for job in jobs}, {by_user['alice']['job_id'], by_user['erin']['job_id']})
+        self.assertEqual(self.submit.call_count, 2)
+        self.assertTrue(all(call.args[2] is True for call in self.submit.call_args_list))
+        # Capacity stays reserved only for the queued users
+        self.assertEqual(set(CapacityReservation.objects.values_list('owner', flat=True)), {'alice', 'erin'})
+
+    def test_batch_scales_up_in_one_launch(self):
+        usernames = [f"user{i}" for i in range(20)]
+        results = bulk_utils.create_sessions_bulk(usernames)
+
+        self.assertEqual(bulk_utils.get_bulk_status_code(results, success_status=202), 202)
+        self.assertEqual(self.provider.calls['launch'], 1)
+        self.assertEqual(CapacityReservation.objects.count(), 20)
+
+    def test_all_failed_is_a_bad_request(self):
+        results = bulk_utils.create_sessions_bulk(['bob', 'dave'])
+        self.assertEqual(bulk_utils.get_bulk_status_code(results, success_status=202), 400)
+        self.assertFalse(CapacityReservation.objects.exists())
+        self.submit.assert_not_called()
+
+    def test_post_reports_partial_success(self):
+        response = self.client.post('/task', {'usernames': ['alice', 'bob']}, content_type='application/json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result['status'] for result in response.json()['data']], ['success', 'failed'])
+
+    def test_reserved_job_skips_its_own_scale_up(self):
+        job = ProvisioningJob.objects.create(username='alice')
+        with mock.patch.object(job_queue, 'close_old_connections'), \
+                mock.patch.object(job_queue, 'check_and_scale_up') as scale, \
+                mock.patch.object(job_queue, 'wait_for_capacity', return_value=False):
+            job_queue.run_provisioning_job(job.pk, capacity_reserved=True)
+        scale.assert_not_called()
+        job.refresh_from_db()
+        self.assertEqual(job.state, 'failed')
+
+
+class CodeSpaceListTests(TestCase):
+    def add_codespaces(self, *usernames):
+        for username in usernames:
+            codespace_utils.record_codespace(username, f"svc-{username}")
+
+    def test_parses_limit_cursor_and_fields(self):
+        params = {'limit': '2', 'cursor': 'bob-code-server', 'fields': 'name, owner'}
+        self.assertEqual(codespace_utils.parse_codespace_list_params(params), (2, 'bob-code-server', ('name', 'owner')))
+        self.assertEqual(codespace_utils.parse_codespace_list_params({}), (None, None, codespace_utils.CODESPACE_FIELDS))
+
+    def test_rejects_bad_limits_cursors_and_fields(self):
+        for params in ({'limit': '0'}, {'limit': '-3'}, {'limit': 'ten'}, {'limit': '2.5'},
+                       {'cursor': 'bob'}, {'fields': 'name,password'}):
+            with self.subTest(params=params), self.assertRaises(ValueError):
+                codespace_utils.parse_codespace_list_params(params)
+
+    def test_cursor_pages_are_sorted_and_stable(self):
+        self.add_codespaces('erin', 'alice', 'dave', 'bob', 'carol')
+        names, cursor, pages = [], None, 0
+        while True:
+            page, cursor = codespace_utils.list_codespaces(limit=2, cursor=cursor, fields=('name',))
+            names.extend(item['name'] for item in page)
+            pages += 1
+            if pages == 1:
+                # Created between pages, sorts before the cursor so it never shifts later pages
+                self.add_codespaces('aaron')
+            if cursor is None:
+                break
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(names, [f"{username}-code-server" for username in ('alice', 'bob', 'carol', 'dave', 'erin')])
+
+    def test_view_reports_bad_params(self):
+        response = self.client.get('/task', {'limit': 'x'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], "'limit' must be a positive integer.")
+
+
+class AsyncViewTests(TestCase):
+    """
+    Each async endpoint answers what its sync twin does.
+    """
+    def setUp(self):
+        # The offload pool's threads have their own connections and would not
+        # see this test's transaction; run the calls on the test's thread instead
+        patcher = mock.patch.object(async_views, 'run_blocking', lambda func, *args, **kwargs: sync_to_async(func)(*args, **kwargs))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for username in ('alice', 'bob', 'carol'):
+            codespace_utils.record_codespace(username, f"svc-{username}")
+        self.job = ProvisioningJob.objects.create(username='alice')
+
+    async def assertSamePayload(self, sync_path, async_path, params=None):
+        expected = await sync_to_async(self.client.get)(sync_path, params or {})
+        response = await self.async_client.get(async_path, params or {})
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.json(), expected.json())
+        return response
+
+    async def test_task_list(self):
+        response = await self.assertSamePayload('/task', '/async/task', {'limit': '2', 'fields': 'name,owner'})
+        self.assertEqual(len(response.json()['data']), 2)
+        await self.assertSamePayload('/task', '/async/task', {'limit': 'x'})
+
+    async def test_task_detail(self):
+        response = await self.assertSamePayload('/task/bob', '/async/task/bob')
+        self.assertEqual(response.json()['data']['service_name'], 'bob-code-server')
+        missing = await self.async_client.get('/async/task/nobody')
+        self.assertEqual(missing.status_code, 204)
+
+    async def test_job(self):
+        response = await self.assertSamePayload(f'/job/{self.job.job_id}', f'/async/job/{self.job.job_id}')
+        self.assertEqual(response.json()['data']['username'], 'alice')
+        await self.assertSamePayload('/job/00000000-0000-0000-0000-000000000000', '/async/job/00000000-0000-0000-0000-000000000000')
+
+    async def test_node_list(self):
+        nodes = {'status': 'success', 'data': [make_node_info('n1', 3)]}
+        with mock.patch.object(node_views, 'get_cached_node_detail_info', return_value=nodes), \
+                mock.patch.object(async_views, 'get_cached_node_detail_info', return_value=nodes):
+            response = await self.assertSamePayload('/node', '/async/node')
+        self.assertEqual(response.json()['data'][0]['id'], 'n1')
+
+        failed = {'status': 'failed', 'error': 'manager down'}
+        with mock.patch.object(node_views, 'get_cached_node_detail_info', return_value=failed), \
+                mock.patch.object(async_views, 'get_cached_node_detail_info', return_value=failed):
+            response = await self.assertSamePayload('/node', '/async/node')
+        self.assertEqual(response.status_code, 400)
+
+
+class FakeTaskClient:
+    """
+    `tasks()` over a fixed task list, filtered by a list of service ids.
+    """
+    def __init__(self, tasks=()):
+        self.task_list = list(tasks)
+
+    def tasks(self, filters=None):
+        return [task for task in self.task_list if task['ServiceID'] in filters['service']]
+
+
+def make_readiness_task(service_id, state, created_at="2025-01-01T00:00:00Z", err=None):
+    return {'ServiceID': service_id, 'CreatedAt': created_at, 'Status': {'State': state, 'Err': err, 'Message': state}}
+
+
+class ReadinessStateTests(TestCase):
+    def setUp(self):
+        self.reload_on_change = False
+        strategy = mock.Mock()
+        type(strategy).reload_on_change = mock.PropertyMock(side_effect=lambda: self.reload_on_change)
+        self.last_reload = None
+        for name, value in (('get_routing_strategy', mock.Mock(return_value=strategy)),
+                            ('get_last_nginx_reload', mock.Mock(side_effect=lambda: self.last_reload))):
+            patcher = mock.patch.object(readiness, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def state_of(self, username, *tasks):
+        return readiness.get_readiness([username], FakeTaskClient(tasks))[username]['state']
+
+    def test_job_states_before_a_task_exists(self):
+        job = ProvisioningJob.objects.create(username='alice')
+        for job_state, expected in (('queued', 'queued'), ('scaling', 'scaling'), ('creating', 'scheduled'),
+                                    ('routing', 'scheduled')):
+            ProvisioningJob.objects.filter(pk=job.pk).update(state=job_state)
+            with self.subTest(job_state=job_state):
+                self.assertEqual(self.state_of('alice'), expected)
+
+    def test_task_states_follow_the_newest_task(self):
+        ProvisioningJob.objects.create(username='alice', state='completed')
+        codespace_utils.record_codespace('alice', 'svc-alice')
+        for task_state, expected in (('pending', 'scheduled'), ('preparing', 'pulling'), ('starting', 'pulling'),
+                                     ('running', 'running'), ('rejected', 'scheduled')):
+            with self.subTest(task_state=task_state):
+                self.assertEqual(self.state_of('alice', make_readiness_task('svc-alice', task_state)), expected)
+
+        old = make_readiness_task('svc-alice', 'failed', created_at="2025-01-01T00:00:00Z")
+        new = make_readiness_task('svc-alice', 'running', created_at="2025-01-01T00:01:00Z")
+        self.assertEqual(self.state_of('alice', new, old), 'running')
+
+    def test_running_is_routable_once_nginx_serves_the_route(self):
+        codespace_utils.record_codespace('alice', 'svc-alice')
+        running = make_readiness_task('svc-alice', 'running')
+        self.assertEqual(self.state_of('alice', running), 'running')
+
+        route = NginxRoute.objects.create(username='alice')
+        self.assertEqual(self.state_of('alice', running), 'routable')
+
+        # With reloads, only after one that picked up the route
+        self.reload_on_change = True
+        self.last_reload = route.updated_at - timedelta(seconds=1)
+        self.assertEqual(self.state_of('alice', running), 'running')
+        self.last_reload = route.updated_at + timedelta(seconds=1)
+        self.assertEqual(self.state_of('alice', running), 'routable')
+
+    def test_failed_job_and_unknown_user(self):
+        ProvisioningJob.objects.create(username='alice', state='failed', message="No capacity.")
+        result = readiness.get_readiness(['alice', 'nobody'], FakeTaskClient())
+        self.assertEqual(result['alice'], {'state': 'failed', 'task_state': None, 'message': "No capacity."})
+        self.assertIsNone(result['nobody']['state'])
+
+
+class ReadinessWatcherTests(TestCase):
+    def setUp(self):
+        self.watcher = readiness.ReadinessWatcher(interval=60)
+        # Watched without starting the poll thread, polls are driven by the test
+        self.watcher._watch_counts['alice'] = 1
+        self.states = iter([{'alice': {'state': 'queued', 'task_state': None, 'message': ''}},
+                            {'alice': {'state': 'scaling', 'task_state': None, 'message': ''}}])
+        patcher = mock.patch.object(readiness, 'get_readiness', side_effect=lambda usernames, api_client: next(self.states))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_thread_waiters_wake_on_a_change(self):
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(self.watcher.wait('alice', None, 5)))
+        waiter.start()
+        started = time.monotonic()
+        self.watcher.poll()
+        waiter.join(5)
+        self.assertEqual(results[0]['state'], 'queued')
+        self.assertLess(time.monotonic() - started, 5)
+
+        # An unchanged poll does not wake it, the timeout does
+        self.assertEqual(self.watcher.wait('alice', results[0], 0.05), results[0])
+
+    async def test_async_waiters_wake_on_a_change(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.watcher.poll)
+        known = self.watcher.get('alice')
+        waiter = asyncio.ensure_future(self.watcher.async_wait('alice', known, 5))
+        await asyncio.sleep(0)
+        await loop.run_in_executor(None, self.watcher.poll)
+        current = await asyncio.wait_for(waiter, 1)
+        self.assertEqual(current['state'], 'scaling')
+
+    def test_failed_poll_wakes_waiters_without_readiness(self):
+        readiness.get_readiness.side_effect = docker.errors.APIError("manager down")
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(self.watcher.wait('alice', None, 5)))
+        waiter.start()
+        self.watcher.poll()
+        waiter.join(5)
+        self.assertEqual(results, [None])
+        self.assertIn("manager down", self.watcher.get_error())
+        self.assertEqual(self.watcher.stats()['errors'], 1)
+
+
+class ReadinessViewTests(TestCase):
+    def setUp(self):
+        self.watcher = readiness.ReadinessWatcher(interval=60)
+        patcher = mock.patch.object(readiness_views, 'readiness_watcher', self.watcher)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_poll_error_is_a_503(self):
+        started = time.monotonic()
+        with mock.patch.object(readiness, 'get_readiness', side_effect=docker.errors.APIError("manager down")):
+            response = await self.async_client.get('/task/alice/readiness')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['status'], 'failed')
+        self.assertIn("manager down", response.json()['error'])
+        # Answered on the failed poll, not after the keepalive
+        self.assertLess(time.monotonic() - started, readiness_views.readiness_keepalive)
+
+    async def test_unknown_user_is_a_404(self):
+        unknown = {'alice': {'state': None, 'task_state': None, 'message': ''}}
+        with mock.patch.object(readiness, 'get_readiness', return_value=unknown):
+            response = await self.async_client.get('/task/alice/readiness')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_long_poll_returns_the_state(self):
+        queued = {'alice': {'state': 'queued', 'task_state': None, 'message': ''}}
+        with mock.patch.object(readiness, 'get_readiness', return_value=queued):
+            response = await self.async_client.get('/task/alice/readiness')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['state'], 'queued')
+
+
+class FakeService:
+    def __init__(self, service_id, name, labels=None, constraints=()):
+        self.id = service_id
+        self.name = name
+        self.version = 1
+        self.attrs = {'ID': service_id, 'CreatedAt': "2025-01-01T00:00:00Z", 'Spec': {
+            'Name': name, 'Labels': labels or {}, 'TaskTemplate': {'Placement': {'Constraints': list(constraints)}},
+        }}
+
+
+def make_session_service(username, service_id=None):
+    return FakeService(service_id or f"svc-{username}", f"{username}-code-server", labels={OWNER_LABEL: username, PORT_LABEL: '8080'})
+
+
+class ServiceLabelTests(TestCase):
+    def test_new_services_carry_the_listing_labels(self):
+        labels = docker_utils.get_service_labels('alice', 'large')
+        self.assertEqual(labels[OWNER_LABEL], 'alice')
+        self.assertEqual(labels[PORT_LABEL], str(docker_utils.CODE_SERVER_PORT))
+
+    def test_only_unlabelled_code_servers_are_labelled(self):
+        services = [
+            FakeService('s1', 'alice-code-server'),
+            FakeService('s2', 'bob-code-server', labels={OWNER_LABEL: 'bob'}),
+            FakeService('s3', 'postgres'),
+        ]
+        client = mock.Mock()
+        client.services.list.return_value = services
+        with mock.patch.object(docker_utils, 'docker_client', client):
+            self.assertEqual(docker_utils.label_legacy_services(), 1)
+
+        client.api.update_service.assert_called_once()
+        (service_id, version), kwargs = client.api.update_service.call_args
+        self.assertEqual(service_id, 's1')
+        self.assertEqual(kwargs['labels'][OWNER_LABEL], 'alice')
+        # Keeps its real creation time, not the time it was labelled
+        self.assertEqual(kwargs['labels'][CREATED_AT_LABEL], "2025-01-01T00:00:00Z")
+        self.assertTrue(kwargs['fetch_current_spec'])
+
+
+class ReconcileCodeSpacesTests(TestCase):
+    def reconcile(self, services, tasks, during_listing=None):
+        client = mock.Mock()
+
+        def list_services(filters=None):
+            if during_listing:
+                during_listing()
+            return services
+
+        client.services.list.side_effect = list_services
+        with mock.patch.object(codespace_utils, 'docker_client', client), \
+                mock.patch.object(codespace_utils, 'ensure_services_labelled'), \
+                mock.patch.object(codespace_utils, 'get_api_client', return_value=FakeSwarmClient([], tasks)):
+            result = codespace_utils.reconcile_codespaces()
+        client.services.list.assert_called_once_with(filters={'label': OWNER_LABEL})
+        return result
+
+    def test_registry_follows_docker(self):
+        codespace_utils.record_codespace('alice', 'svc-alice')
+        codespace_utils.record_codespace('gone', 'svc-gone')
+        CodeSpace.objects.filter(username='gone').update(updated_at=timezone.now() - timedelta(seconds=60))
+
+        result = self.reconcile(
+            services=[make_session_service('alice'), make_session_service('bob')],
+            tasks=[make_task('t1', 'svc-alice', 'n1')],
+        )
+
+        self.assertEqual(result, {'created': 1, 'updated': 1, 'removed': 1})
+        alice = CodeSpace.objects.get(username='alice')
+        self.assertEqual((alice.node_id, alice.state), ('n1', 'running'))
+        self.assertIsNotNone(alice.ready_at)
+        bob = CodeSpace.objects.get(username='bob')
+        self.assertEqual((bob.state, bob.port, bob.node_id), ('pending', 8080, None))
+        self.assertFalse(CodeSpace.objects.filter(username='gone').exists())
+
+    def test_session_created_during_the_listing_is_kept(self):
+        # The listing was taken before carol's service existed
+        result = self.reconcile(services=[], tasks=[], during_listing=lambda: codespace_utils.record_codespace('carol', 'svc-carol'))
+        self.assertEqual(result['removed'], 0)
+        self.assertTrue(CodeSpace.objects.filter(username='carol').exists())
+
+    def test_unchanged_rows_are_not_written(self):
+        self.reconcile(services=[make_session_service('alice')], tasks=[make_task('t1', 'svc-alice', 'n1')])
+        result = self.reconcile(services=[make_session_service('alice')], tasks=[make_task('t1', 'svc-alice', 'n1')])
+        self.assertEqual(result, {'created': 0, 'updated': 0, 'removed': 0})
+
+
+class ScaleDownOccupancyTests(TestCase):
+    def test_nodes_with_registered_sessions_are_kept(self):
+        nodes = [make_node_info(node_id, free_slots=8) | {'tasks_count': 0} for node_id in ('n1', 'n2', 'n3')]
+        nodes.append(make_node_info('n4', free_slots=4, tasks=['dave']) | {'tasks_count': 1})
+        # Bob's task is restarting: no running task, still in the registry on n2
+        CodeSpace.objects.create(username='bob', service_name='bob-code-server', node_id='n2', state='running')
+        self.assertEqual(codespace_utils.get_node_occupancy(), {'n2': 1})
+
+        with mock.patch.object(custom_utils.swarm_mirror, 'get_node_detail_info', return_value={'status': 'success', 'data': nodes}), \
+                mock.patch.object(custom_utils.warm_pool, 'select_standby', return_value=[]), \
+                mock.patch.object(custom_utils, 'scale_down_nodes', return_value={'status': 'success', 'data': {}}) as scale_down:
+            custom_utils.schedule_scale_down()
+
+        removed = scale_down.call_args.args[0]
+        self.assertNotIn('n2', removed)
+        self.assertIn('n1', removed)
+
+
+class ScaleDownNodesTests(TestCase):
+    def setUp(self):
+        self.provider = LocalProvider()
+        previous = set_cloud_provider(self.provider)
+        self.addCleanup(set_cloud_provider, previous)
+        self.instances = {}
+        for node_id in ('n1', 'n2', 'n3'):
+            instance = self.provider.launch_instances(1)[0]
+            NodeInstance.objects.create(instance_id=instance['instance_id'], private_ip=instance['private_ip'],
+                                        node_id=node_id, status='active')
+            self.instances[node_id] = instance['instance_id']
+        # n2 is refused by the manager, n3 already left the swarm
+        self.client = FakeNodeClient([make_node('n1'), make_node('n2')],
+                                     errors={'n2': docker.errors.APIError("node n2 is not down")})
+        patcher = mock.patch.object(node_utils, 'get_api_client', return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_remove_reports_every_node(self):
+        removal = node_utils.remove_node_from_swarm(['n1', 'n2', 'n3'])
+
+        self.assertEqual(removal['status'], 'partial')
+        self.assertEqual(sorted(removal['removed']), ['n1', 'n3'])
+        self.assertEqual(removal['data']['n1'], {'removed': True, 'error': None})
+        self.assertEqual(removal['data']['n3'], {'removed': True, 'error': None})
+        self.assertFalse(removal['data']['n2']['removed'])
+        self.assertIn("Docker API error", removal['data']['n2']['error'])
+        self.assertEqual(dict(NodeInstance.objects.values_list('node_id', 'status')),
+                         {'n1': 'removed', 'n2': 'active', 'n3': 'removed'})
+
+    def test_scale_down_terminates_removed_nodes_in_one_call(self):
+        report = custom_utils.scale_down_nodes(['n1', 'n2', 'n3'])
+
+        self.assertEqual(report['status'], 'partial')
+        for node_id in ('n1', 'n3'):
+            self.assertEqual(report['data'][node_id], {'removed': True, 'error': None,
+                                                       'instance_id': self.instances[node_id], 'terminated': True})
+        self.assertEqual(report['data']['n2']['instance_id'], self.instances['n2'])
+        self.assertFalse(report['data']['n2']['terminated'])
+        self.assertIsNotNone(report['data']['n2']['error'])
+
+        self.assertEqual(self.provider.calls['terminate'], 1)
+        self.assertEqual(self.provider.instances[self.instances['n2']]['state'], 'running')
+        self.assertEqual(list(NodeInstance.objects.values_list('node_id', flat=True)), ['n2'])
+
+    def test_failed_termination_keeps_the_rows(self):
+        with mock.patch.object(self.provider, 'terminate_instances', side_effect=Exception("throttled")):
+            report = custom_utils.scale_down_nodes(['n1'])
+
+        self.assertEqual(report['status'], 'partial')
+        self.assertTrue(report['data']['n1']['removed'])
+        self.assertFalse(report['data']['n1']['terminated'])
+        self.assertIn("throttled", report['data']['n1']['error'])
+        self.assertEqual(NodeInstance.objects.get(node_id='n1').status, 'removed')
+
+
+NGINX_CONF = """events {}
+http {
+    server {
+        listen 80;
+    }
+}
+"""
+
+
+class NginxRoutingTests(TestCase):
+    def setUp(self):
+        self.routes_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.routes_dir.cleanup)
+        conf_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(conf_dir.cleanup)
+        self.conf_path = os.path.join(conf_dir.name, "nginx.conf")
+        with open(self.conf_path, "w") as conf_file:
+            conf_file.write(NGINX_CONF)
+
+        for name, value in (('nginx_conf_path', self.conf_path), ('nginx_routes_dir', self.routes_dir.name),
+                            ('_include_ready', False)):
+            patcher = mock.patch.object(nginx_utils, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def use_strategy(self, name):
+        patcher = mock.patch.object(nginx_utils, 'nginx_routing_strategy', name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_resolver_reloads_only_when_the_include_is_written(self):
+        self.use_strategy('resolver')
+        self.assertTrue(nginx_utils.update_nginx_config('alice'))
+        self.assertFalse(nginx_utils.update_nginx_config('bob'))
+
+    def test_include_unchanged_needs_no_reload(self):
+        self.use_strategy('resolver')
+        self.assertTrue(nginx_utils.ensure_nginx_include())
+        nginx_utils._include_ready = False
+        self.assertFalse(nginx_utils.ensure_nginx_include())
+
+    def test_map_follows_the_registry(self):
+        self.use_strategy('map')
+        nginx_utils.update_nginx_config('alice')
+        nginx_utils.update_nginx_config('bob')
+        nginx_utils.remove_nginx_config('alice')
+
+        with open(os.path.join(self.routes_dir.name, nginx_utils.MAP_FILE)) as map_file:
+            content = map_file.read()
+        self.assertIn("bob bob-code-server;", content)
+        self.assertNotIn("alice", content)
+
+
+class NginxReloadTests(TestCase):
+    def test_reload_time_is_shared_and_monotonic(self):
+        self.assertIsNone(nginx_utils.get_last_nginx_reload())
+        coalescer = nginx_utils.NginxReloadCoalescer(debounce=0, apply=lambda: 'exec')
+        coalescer.request()
+        coalescer.flush()
+
+        reloaded_at = nginx_utils.get_last_nginx_reload()
+        self.assertIsNotNone(reloaded_at)
+        nginx_utils.record_nginx_reload(reloaded_at - timedelta(seconds=5))
+        self.assertEqual(nginx_utils.get_last_nginx_reload(), reloaded_at)
+
+    def test_failed_reload_is_not_recorded(self):
+        def fail():
+            raise OSError("nginx is down")
+
+        coalescer = nginx_utils.NginxReloadCoalescer(debounce=0, apply=fail)
+        coalescer.request()
+        coalescer.flush()
+        self.assertIsNone(nginx_utils.get_last_nginx_reload())
+
+
+class NginxExecReloadTests(TestCase):
+    def apply(self, local_containers, running_tasks):
+        container = mock.Mock()
+        container.exec_run.return_value = (0, b'')
+        client = mock.Mock()
+        client.containers.list.return_value = [container] * local_containers
+        client.api.tasks.return_value = [{'Status': {'State': 'running'}}] * running_tasks
+        with mock.patch.object(nginx_utils, 'docker_client', client), \
+                mock.patch.object(nginx_utils, 'nginx_reload_mode', 'exec'), \
+                mock.patch.object(nginx_utils, 'restart_nginx') as restart:
+            mode = nginx_utils.apply_nginx_reload()
+        return mode, restart
+
+    def test_every_task_reloaded_in_place(self):
+        mode, restart = self.apply(local_containers=1, running_tasks=1)
+        self.assertEqual(mode, 'exec')
+        restart.assert_not_called()
+
+    def test_tasks_on_other_nodes_force_a_restart(self):
+        mode, restart = self.apply(local_containers=1, running_tasks=3)
+        self.assertEqual(mode, 'force_update')
+        restart.assert_called_once()
+
+
+def make_ec2_instance(instance_id, private_ip, instance_type='t3.medium'):
+    return {'InstanceId': instance_id, 'PrivateIpAddress': private_ip, 'State': {'Name': 'pending'}, 'InstanceType': instance_type}
+
+
+class EC2ProviderTests(TestCase):
+    def setUp(self):
+        self.provider = EC2Provider(template_id='lt-0123456789abcdef0')
+        self.provider._client = boto3.client('ec2', region_name='us-east-1', aws_access_key_id='test', aws_secret_access_key='test')
+        self.stubber = Stubber(self.provider._client)
+        self.stubber.activate()
+        self.addCleanup(self.stubber.deactivate)
+
+    def test_client_is_shared_and_retries_adaptively(self):
+        provider = EC2Provider(template_id='lt-1')
+        with mock.patch.object(cloud_provider, 'region', 'us-east-1'), \
+                mock.patch.object(cloud_provider, 'ec2_max_attempts', 7):
+            client = provider.client
+            self.assertIs(provider.client, client)
+        # botocore counts the first call on top of `max_attempts` retries
+        self.assertEqual(client.meta.config.retries, {'total_max_attempts': 8, 'mode': 'adaptive'})
+
+    def test_launch_is_one_run_instances_call(self):
+        self.stubber.add_response('run_instances', {'Instances': [
+            make_ec2_instance('i-1', '10.0.0.1'), make_ec2_instance('i-2', '10.0.0.2'),
+        ]}, {'LaunchTemplate': {'LaunchTemplateId': 'lt-0123456789abcdef0', 'Version': '$Latest'}, 'MinCount': 1, 'MaxCount': 3})
+
+        instances = self.provider.launch_instances(3)
+        self.stubber.assert_no_pending_responses()
+        self.assertEqual(instances, [
+            {'instance_id': 'i-1', 'private_ip': '10.0.0.1', 'state': 'pending', 'instance_type': 't3.medium'},
+            {'instance_id': 'i-2', 'private_ip': '10.0.0.2', 'state': 'pending', 'instance_type': 't3.medium'},
+        ])
+
+    def test_terminate_is_batched_by_a_thousand(self):
+        instance_ids = [f"i-{i:05d}" for i in range(1500)]
+        for batch in (instance_ids[:1000], instance_ids[1000:]):
+            self.stubber.add_response('terminate_instances', {'TerminatingInstances': [
+                {'InstanceId': instance_id} for instance_id in batch
+            ]}, {'InstanceIds': batch})
+
+        self.assertEqual(self.provider.terminate_instances(instance_ids), instance_ids)
+        self.stubber.assert_no_pending_responses()
+
+    def test_launch_type_and_its_resources_are_described_once(self):
+        self.stubber.add_response('describe_launch_template_versions', {'LaunchTemplateVersions': [
+            {'LaunchTemplateData': {'InstanceType': 'c5.4xlarge'}},
+        ]}, {'LaunchTemplateId': 'lt-0123456789abcdef0', 'Versions': ['$Latest']})
+        self.stubber.add_response('describe_instance_types', {'InstanceTypes': [
+            {'VCpuInfo': {'DefaultVCpus': 16}, 'MemoryInfo': {'SizeInMiB': 32768}},
+        ]}, {'InstanceTypes': ['c5.4xlarge']})
+
+        for _ in range(2):
+            self.assertEqual(self.provider.get_launch_instance_type(), 'c5.4xlarge')
+            self.assertEqual(self.provider.get_instance_resources('c5.4xlarge'),
+                             {'nano_cpus': 16 * 10 ** 9, 'memory_bytes': 32 * 1024 ** 3})
+        self.stubber.assert_no_pending_responses()
+
+    def test_unknown_instance_type_has_no_resources(self):
+        self.stubber.add_client_error('describe_instance_types', 'InvalidInstanceType')
+        self.assertIsNone(self.provider.get_instance_resources('z9.huge'))
+        self.assertIsNone(self.provider.get_instance_resources(''))
+
+
+    def test_failed_lookups_are_not_repeated_until_the_retry_interval(self):
+        clock = VirtualClock()
+        self.provider.clock = clock
+        self.stubber.add_client_error('describe_launch_template_versions', 'UnauthorizedOperation')
+        self.stubber.add_client_error('describe_instance_types', 'RequestLimitExceeded')
+        for _ in range(3):
+            self.assertEqual(self.provider.get_launch_instance_type(), '')
+            self.assertIsNone(self.provider.get_instance_resources('c5.4xlarge'))
+        self.stubber.assert_no_pending_responses()
+
+        clock.now += cloud_provider.EC2_LOOKUP_RETRY_INTERVAL
+        self.stubber.add_response('describe_launch_template_versions', {'LaunchTemplateVersions': [
+            {'LaunchTemplateData': {'InstanceType': 'c5.4xlarge'}},
+        ]}, {'LaunchTemplateId': 'lt-0123456789abcdef0', 'Versions': ['$Latest']})
+        self.assertEqual(self.provider.get_launch_instance_type(), 'c5.4xlarge')
+        self.stubber.assert_no_pending_responses()
+
+
+class LaunchCapacityTests(TestCase):
+    def use_provider(self, instance_type, cpus, memory_gib):
+        provider = LocalProvider(instance_type=instance_type,
+                                 resources={'nano_cpus': cpus * 10 ** 9, 'memory_bytes': memory_gib * 1024 ** 3})
+        previous = set_cloud_provider(provider)
+        self.addCleanup(set_cloud_provider, previous)
+        return provider
+
+    def test_capacity_follows_the_instance_type(self):
+        self.use_provider('c5.4xlarge', 16, 32)
+        slot_cpu, slot_memory = get_slot_size()
+        expected = min(16 * 10 ** 9 // slot_cpu, 32 * 1024 ** 3 // slot_memory)
+        self.assertEqual(scale_up.get_expected_capacity('c5.4xlarge'), expected)
+        self.assertEqual(scale_up.get_launch_capacity(), expected)
+
+    def test_unknown_types_use_the_measured_capacity(self):
+        self.use_provider('c5.4xlarge', 16, 32)
+        self.assertEqual(scale_up.get_expected_capacity('m5.large'), scale_up.accepted_containers_count)
+        NodeInstance.objects.create(instance_id='i-1', private_ip='10.0.0.1', instance_type='m5.large', capacity=3, status='active')
+        self.assertEqual(scale_up.get_expected_capacity('m5.large'), 3)
+
+    def test_bigger_nodes_mean_fewer_launches(self):
+        launched = {}
+        for instance_type, cpus, memory_gib in (('c5.4xlarge', 16, 32), ('t3.medium', 2, 4)):
+            provider = self.use_provider(instance_type, cpus, memory_gib)
+            NodeInstance.objects.all().delete()
+            CapacityReservation.objects.all().delete()
+            ScalingState.objects.update_or_create(key=scale_up.DEFAULT_KEY, defaults={'pending_capacity': 0})
+            with mock.patch.object(scale_up, 'get_node_snapshot', return_value=[]):
+                scale_up.reserve_capacity([f"user-{i}" for i in range(40)], policy=ThresholdPolicy())
+            launched[instance_type] = len(provider.instances)
+        # 40 sessions plus the spare buffer: one c5.4xlarge (64 slots) or six t3.medium (8 slots)
+        self.assertEqual(scale_up.get_expected_capacity('t3.medium'), 8)
+        self.assertEqual(launched, {'c5.4xlarge': 1, 't3.medium': math.ceil((40 + scale_up.min_capacity_required) / 8)})
+
+
+class SimulatedProviderTests(TestCase):
+    def boot(self, seed, count=20, failure_rate=0.3):
+        clock = VirtualClock()
+        provider = SimulatedProvider(boot_latency=100, failure_rate=failure_rate, jitter=0.2, clock=clock, seed=seed)
+        instance_ids = [instance['instance_id'] for instance in provider.launch_instances(count)]
+        started_at = {}
+        for _ in range(130):
+            clock.now += 1
+            for instance_id in provider.refresh():
+                started_at[instance_id] = clock.now
+        return provider, instance_ids, started_at
+
+    def test_instances_boot_within_the_jitter(self):
+        provider, instance_ids, started_at = self.boot(seed=1, failure_rate=0.0)
+        self.assertEqual(set(started_at), set(instance_ids))
+        self.assertTrue(all(1080 <= at <= 1121 for at in started_at.values()))
+        self.assertEqual({provider.instances[instance_id]['state'] for instance_id in instance_ids}, {'running'})
+
+    def test_nothing_runs_before_the_boot_latency(self):
+        clock = VirtualClock()
+        provider = SimulatedProvider(boot_latency=100, jitter=0.2, clock=clock, seed=1)
+        instance_ids = [instance['instance_id'] for instance in provider.launch_instances(5)]
+        clock.now += 79
+        self.assertEqual(provider.refresh(), [])
+        self.assertEqual({provider.instances[instance_id]['state'] for instance_id in instance_ids}, {'pending'})
+
+    def test_same_seed_same_boots_and_failures(self):
+        provider, instance_ids, started_at = self.boot(seed=7)
+        again, _, started_again = self.boot(seed=7)
+        self.assertEqual(started_at, started_again)
+        failed = [instance_id for instance_id in instance_ids if provider.instances[instance_id]['state'] == 'failed']
+        self.assertEqual(failed, [instance_id for instance_id in instance_ids if again.instances[instance_id]['state'] == 'failed'])
+        # 30% failure rate over 20 instances
+        self.assertTrue(0 < len(failed) < 20)
+        self.assertEqual(len(failed) + len(started_at), 20)
+
+    def test_terminated_while_booting_never_runs(self):
+        clock = VirtualClock()
+        provider = SimulatedProvider(boot_latency=10, clock=clock, seed=1)
+        instance_id = provider.launch_instances(1)[0]['instance_id']
+        self.assertEqual(provider.terminate_instances([instance_id]), [instance_id])
+        clock.now += 20
+        self.assertEqual(provider.refresh(), [])
+        self.assertEqual(provider.instances[instance_id]['state'], 'terminated')
+
+
+class AutoscalerSimulationTests(TestCase):
+    def test_drives_reserve_capacity_and_leaves_no_rows(self):
+        with mock.patch.object(autoscale_sim, 'reserve_capacity', wraps=autoscale_sim.reserve_capacity) as reserve:
+            report = autoscale_sim.run_autoscaler_simulation(session_count=30, arrival_rate=1, boot_latency=60,
+                                                             capacity_per_node=5, seed=3)
+        self.assertEqual(reserve.call_count, 30)
+        self.assertEqual(report['placed'], 30)
+        self.assertGreater(report['nodes_launched'], 0)
+        self.assertFalse(NodeInstance.objects.exists())
+        self.assertFalse(CapacityReservation.objects.exists())
+
+    def test_is_deterministic(self):
+        runs = [autoscale_sim.run_autoscaler_simulation(session_count=40, arrival_rate=2, boot_latency=60, failure_rate=0.2,
+                                                        capacity_per_node=5, seed=5, policy='rate') for _ in range(2)]
+        self.assertEqual(runs[0], runs[1])
+
+    def test_runs_the_real_ledger(self):
+        baseline = autoscale_sim.run_autoscaler_simulation(session_count=30, arrival_rate=1, boot_latency=60, capacity_per_node=5)
+        # Without the reservations of waiting sessions the ledger sees free slots that are taken
+        with mock.patch.object(scale_up, 'get_reserved_capacity', return_value=0):
+            unreserved = autoscale_sim.run_autoscaler_simulation(session_count=30, arrival_rate=1, boot_latency=60, capacity_per_node=5)
+        self.assertLess(unreserved['nodes_launched'], baseline['nodes_launched'])
+
+
+class ReserveCapacityConcurrencyTests(TransactionTestCase):
+    """
+    Requests run in threads with their own connections, so the rows must be
+    committed for them to see each other: a TransactionTestCase.
+    """
+    REQUESTS = 24
+
+    def setUp(self):
+        previous = get_cloud_provider()
+        self.addCleanup(set_cloud_provider, previous)
+        # One worker with two free slots and no sessions
+        node = {'id': 'n1', 'ip': '10.0.0.1', 'availability': 'active', 'status': 'ready',
+                'total_slots': 2, 'free_slots': 2, 'tasks_count': 0, 'tasks': []}
+        patcher = mock.patch.object(scale_up, 'get_node_snapshot', return_value=[node])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def launch_for(self, owners, concurrent):
+        provider = LocalProvider()
+        set_cloud_provider(provider)
+        CapacityReservation.objects.all().delete()
+        NodeInstance.objects.all().delete()
+        ScalingState.objects.all().delete()
+
+        def request(owner):
+            try:
+                scale_up.reserve_capacity([owner])
+            finally:
+                connection.close()
+
+        if not concurrent:
+            for owner in owners:
+                scale_up.reserve_capacity([owner])
+            return len(provider.instances)
+
+        threads = [threading.Thread(target=request, args=(owner,)) for owner in owners]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return len(provider.instances)
+
+    def test_concurrent_requests_launch_like_serial_ones(self):
+        owners = [f"user{i}" for i in range(self.REQUESTS)]
+        serial = self.launch_for(owners, concurrent=False)
+        concurrent = self.launch_for(owners, concurrent=True)
+
+        self.assertGreater(serial, 0)
+        self.assertEqual(concurrent, serial)
+        self.assertEqual(CapacityReservation.objects.count(), self.REQUESTS)
+        self.assertEqual(ScalingState.objects.get().pending_capacity, NodeInstance.objects.count() * NodeInstance.objects.first().capacity)
+
+
+class DuplicateProvisioningTests(TransactionTestCase):
+    SUBMISSIONS = 8
+
+    def test_concurrent_submissions_queue_one_job(self):
+        barrier = threading.Barrier(self.SUBMISSIONS)
+        jobs = []
+
+        def submit():
+            try:
+                barrier.wait(5)
+                jobs.append(job_queue.enqueue_provisioning('alice').pk)
+            finally:
+                connection.close()
+
+        with mock.patch.object(job_queue.executor, 'submit') as executor_submit:
+            threads = [threading.Thread(target=submit) for _ in range(self.SUBMISSIONS)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(jobs), self.SUBMISSIONS)
+        self.assertEqual(len(set(jobs)), 1)
+        executor_submit.assert_called_once()
+        self.assertEqual(ProvisioningJob.objects.filter(username='alice').count(), 1)
+
+
+class ReconcileSwarmStateTests(TestCase):
+    def add_instances(self, count, joined):
+        created_before = timezone.now() - timedelta(seconds=scale_up.node_provisioning_timeout + 1)
+        instances = NodeInstance.objects.bulk_create([
+            NodeInstance(instance_id=f"i-{joined}-{i}", private_ip=f"10.{int(joined)}.{i // 250}.{i % 250}", capacity=5)
+            for i in range(count)
+        ])
+        if not joined:
+            # Half of the instances that never joined are past the provisioning timeout
+            stale = [instance.pk for instance in instances[:count // 2]]
+            NodeInstance.objects.filter(pk__in=stale).update(created_at=created_before)
+        return [
+            {'id': f"node-{instance.instance_id}", 'ip': instance.private_ip, 'total_slots': 8}
+            for instance in instances
+        ] if joined else []
+
+    def reconcile_queries(self, count):
+        NodeInstance.objects.all().delete()
+        ScalingState.objects.get_or_create(key=scale_up.DEFAULT_KEY)
+        node_data = self.add_instances(count, joined=True)
+        self.add_instances(count, joined=False)
+        # savepoint, ledger lock (2), joined read, bulk update, timeout update, failed read,
+        # pending aggregate, pending update, release
+        with self.assertNumQueries(10):
+            scale_up.reconcile_swarm_state(node_data)
+
+    def test_query_count_does_not_grow_with_instances(self):
+        # Both sizes fit one SQLite bulk_update batch (about 166 rows)
+        self.reconcile_queries(10)
+        self.reconcile_queries(100)
+
+    def test_joined_stale_and_pending_instances(self):
+        node_data = self.add_instances(4, joined=True)
+        self.add_instances(4, joined=False)
+        scale_up.reconcile_swarm_state(node_data)
+
+        self.assertEqual(NodeInstance.objects.filter(status='active', capacity=8).count(), 4)
+        self.assertEqual(NodeInstance.objects.filter(status='failed').count(), 2)
+        self.assertEqual(ScalingState.objects.get(key=scale_up.DEFAULT_KEY).pending_capacity, 10)
+
+    def use_provider(self):
+        provider = LocalProvider()
+        previous = set_cloud_provider(provider)
+        self.addCleanup(set_cloud_provider, previous)
+        return provider
+
+    def add_launched(self, provider, count, stale):
+        instances = provider.launch_instances(count)
+        NodeInstance.objects.bulk_create([
+            NodeInstance(instance_id=instance['instance_id'], private_ip=instance['private_ip'], capacity=5)
+            for instance in instances
+        ])
+        if stale:
+            NodeInstance.objects.update(created_at=timezone.now() - timedelta(seconds=scale_up.node_provisioning_timeout + 1))
+        return instances
+
+    def test_timed_out_instances_are_terminated_after_commit(self):
+        provider = self.use_provider()
+        stale = self.add_launched(provider, 2, stale=True)
+        with self.captureOnCommitCallbacks() as callbacks:
+            scale_up.reconcile_swarm_state([])
+            # Nothing leaves the process while the ledger is locked
+            self.assertEqual(provider.calls['terminate'], 0)
+            self.assertEqual(NodeInstance.objects.filter(status='failed').count(), 2)
+        for callback in callbacks:
+            callback()
+
+        self.assertEqual(provider.calls['terminate'], 1)
+        self.assertEqual({provider.instances[instance['instance_id']]['state'] for instance in stale}, {'terminated'})
+        self.assertFalse(NodeInstance.objects.exists())
+
+    def test_failed_termination_keeps_the_rows_matchable(self):
+        provider = self.use_provider()
+        late = self.add_launched(provider, 1, stale=True)[0]
+        with mock.patch.object(provider, 'terminate_instances', side_effect=Exception("throttled")):
+            with self.captureOnCommitCallbacks(execute=True):
+                scale_up.reconcile_swarm_state([])
+        self.assertEqual(NodeInstance.objects.get().status, 'failed')
+
+        # The slow boot joins after all
+        scale_up.reconcile_swarm_state([{'id': 'n-late', 'ip': late['private_ip'], 'total_slots': 8}])
+        node_instance = NodeInstance.objects.get()
+        self.assertEqual((node_instance.status, node_instance.node_id, node_instance.capacity), ('active', 'n-late', 8))
+
+
+class SwarmStateCacheTests(TestCase):
+    def wait_for_misses(self, cache, count):
+        deadline = time.monotonic() + 5
+        while cache.stats()['misses'] < count:
+            self.assertLess(time.monotonic(), deadline, "callers never reached the cache")
+            time.sleep(0.01)
+
+    def test_concurrent_misses_share_one_load(self):
+        cache = SwarmStateCache(ttl=60)
+        release = threading.Event()
+        calls = []
+
+        def loader():
+            calls.append(1)
+            release.wait(5)
+            return {'nodes': 3}
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get('nodes', loader))) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        self.wait_for_misses(cache, 10)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'nodes': 3}] * 10)
+        self.assertEqual(cache.get('nodes', loader), {'nodes': 3})
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_errors_are_shared_but_not_cached(self):
+        cache = SwarmStateCache(ttl=60)
+        loader = mock.Mock(side_effect=[OSError("manager down"), 'ok'])
+        with self.assertRaises(OSError):
+            cache.get('nodes', loader)
+        self.assertEqual(cache.get('nodes', loader), 'ok')
+        self.assertEqual(loader.call_count, 2)
+
+    def test_invalidation_during_a_load_drops_its_result(self):
+        cache = SwarmStateCache(ttl=60)
+
+        def loader():
+            cache.invalidate('nodes')
+            return 'stale'
+
+        self.assertEqual(cache.get('nodes', loader), 'stale')
+        self.assertEqual(cache.get('nodes', lambda: 'fresh'), 'fresh')
+
+
+class VirtualClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class ScalingPolicyTests(TestCase):
+    def test_threshold_launches_one_node_below_the_minimum(self):
+        policy = ThresholdPolicy(min_capacity=2)
+        self.assertEqual(policy.plan(1, 0), 1)
+        self.assertEqual(policy.plan(1, 1), 0)
+        self.assertEqual(policy.plan(-3, 0), 1)
+
+    def test_rate_covers_demand_over_one_boot(self):
+        clock = VirtualClock()
+        policy = RatePolicy(windows=[60], boot_latency=100, min_capacity=2, max_nodes_per_launch=20,
+                            capacity_per_node=5, batch_interval=0, clock=clock)
+        policy.record_requests(30)
+        # 0.5 sessions/s over 100 s plus 2 spare: 52 slots, 15 on hand or booting
+        self.assertEqual(policy.plan(10, 5), 8)
+        self.assertEqual(policy.plan(50, 5), 0)
+        # The next 20 s of demand ride along: 37 + 10 slots
+        policy.batch_interval = 20
+        self.assertEqual(policy.plan(10, 5), 10)
+        self.assertEqual(policy.plan(50, 5), 0)
+
+    def test_rate_is_capped_per_launch(self):
+        policy = RatePolicy(windows=[60], boot_latency=100, min_capacity=2, max_nodes_per_launch=3,
+                            capacity_per_node=5, clock=VirtualClock())
+        policy.record_requests(30)
+        self.assertEqual(policy.plan(0, 0), 3)
+
+    def burst(self, batch_interval, requests=60):
+        """
+        Single-session requests every half second, each launch turning
+        into pending capacity. Returns the node count of every launch.
+        """
+        clock = VirtualClock()
+        policy = RatePolicy(windows=[60], boot_latency=100, min_capacity=2, max_nodes_per_launch=10,
+                            capacity_per_node=5, batch_interval=batch_interval, clock=clock)
+        available, pending, launches = 2, 0, []
+        for _ in range(requests):
+            clock.now += 0.5
+            policy.record_requests()
+            available -= 1
+            node_count = policy.plan(available, pending)
+            if node_count:
+                launches.append(node_count)
+                pending += node_count * policy.capacity_per_node
+        return launches
+
+    def test_rate_batches_launches_under_a_burst(self):
+        launches = self.burst(batch_interval=60)
+        self.assertLessEqual(len(launches), 10)
+        self.assertGreater(sum(launches), 2 * len(launches))
+        # Launches grow with the measured rate up to the cap
+        self.assertEqual(launches, sorted(launches))
+        self.assertEqual(launches[-1], 10)
+
+    def test_rate_without_batching_launches_a_node_per_request(self):
+        launches = self.burst(batch_interval=0)
+        self.assertEqual(set(launches), {1})
+        self.assertGreater(len(launches), 30)
+
+    def test_rate_forgets_requests_outside_the_windows(self):
+        clock = VirtualClock()
+        policy = RatePolicy(windows=[10, 60], boot_latency=100, min_capacity=2, capacity_per_node=5, clock=clock)
+        policy.record_requests(60)
+        clock.now += 30
+        # Only the 60 s window still sees the burst
+        self.assertEqual(policy.current_rate(), 1.0)
+        clock.now += 31
+        self.assertEqual(policy.current_rate(), 0.0)
+        self.assertEqual(policy.plan(2, 0), 0)
+
+    def test_build_rejects_unknown_policies_and_params(self):
+        with self.assertRaises(ValueError):
+            build_scaling_policy('nope')
+        with self.assertRaises(ValueError):
+            build_scaling_policy('threshold', {'speed': 3})
+        with self.assertRaises(ValueError):
+            build_scaling_policy('rate', {'windows': []})
+        with self.assertRaises(ValueError):
+            build_scaling_policy('rate', {'batch_interval': -1})
+
+
+class ConsolidationTests(TestCase):
+    def setUp(self):
+        self.provider = LocalProvider()
+        previous = set_cloud_provider(self.provider)
+        self.addCleanup(set_cloud_provider, previous)
+        for name, value in (('placement_engine', PlacementEngine('pack')), ('min_capacity_required', 2)):
+            patcher = mock.patch.object(consolidation, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def add_node(self, node_id, status='active'):
+        instance = self.provider.launch_instances(1)[0]
+        return NodeInstance.objects.create(instance_id=instance['instance_id'], private_ip=instance['private_ip'],
+                                           node_id=node_id, status=status)
+
+    def node_info(self, node_id, sessions=(), total_slots=5, availability='active'):
+        return {'id': node_id, 'ip': '10.0.0.1', 'status': 'ready', 'availability': availability,
+                'total_slots': total_slots, 'free_slots': total_slots - len(sessions), 'tasks_count': len(sessions),
+                'tasks': [{'name': name, **make_task_info(1)} for name in sessions]}
+
+    def consolidate(self, nodes, errors=None, **kwargs):
+        self.client = FakeNodeClient([make_node(node['id'], availability=node['availability']) for node in nodes], errors)
+        with mock.patch.object(consolidation.swarm_mirror, 'get_node_detail_info',
+                               return_value={'status': 'success', 'data': nodes}), \
+                mock.patch.object(consolidation, 'get_api_client', return_value=self.client), \
+                mock.patch.object(node_utils, 'get_api_client', return_value=self.client):
+            return consolidation.consolidate_nodes(**{'max_occupancy': 2, 'max_draining': 1, 'disruption_budget': 5,
+                                                      'migrate_sessions': False, **kwargs})
+
+    def test_empty_draining_node_is_removed_and_terminated(self):
+        instance_id = self.add_node('n1', status='draining').instance_id
+        self.add_node('n2')
+        report = self.consolidate([self.node_info('n1'), self.node_info('n2', ['alice', 'bob', 'carol'])])
+
+        self.assertEqual(report['status'], 'success')
+        self.assertEqual(report['data']['removed'], ['n1'])
+        self.assertEqual(self.client.node_updates, [('n1', 'drain')])
+        self.assertEqual(self.client.removed, ['n1'])
+        self.assertEqual(self.provider.calls['terminate'], 1)
+        self.assertEqual(self.provider.instances[instance_id]['state'], 'terminated')
+        self.assertEqual(list(NodeInstance.objects.values_list('node_id', flat=True)), ['n2'])
+
+    def test_failed_removal_keeps_the_node_draining(self):
+        self.add_node('n1', status='draining')
+        report = self.consolidate([self.node_info('n1'), self.node_info('n2', ['alice'])],
+                                  errors={'n1': docker.errors.APIError("node is busy")})
+
+        self.assertEqual(report['status'], 'failed')
+        self.assertIn('n1', report['data']['errors'])
+        self.assertEqual(self.provider.calls['terminate'], 0)
+        self.assertEqual(NodeInstance.objects.get(node_id='n1').status, 'draining')
+
+    def test_draining_nodes_are_reactivated_below_the_minimum(self):
+        self.add_node('n1', status='draining')
+        self.add_node('n2')
+        report = self.consolidate([self.node_info('n1', ['alice'], availability='pause'), self.node_info('n2', ['bob'] * 4)])
+
+        # n2 has 1 free slot left, below MIN_CAPACITY_REQUIRED
+        self.assertEqual(report['data']['reactivated'], ['n1'])
+        self.assertEqual(self.client.node_updates, [('n1', 'active')])
+        self.assertEqual(NodeInstance.objects.get(node_id='n1').status, 'active')
+        self.assertEqual(report['data']['cordoned'], [])
+
+    def test_max_draining_is_respected(self):
+        for node_id in ('n1', 'n2', 'n3'):
+            self.add_node(node_id)
+        report = self.consolidate([self.node_info('n1', ['alice']), self.node_info('n2', ['bob']),
+                                   self.node_info('n3', ['carol'], total_slots=20)], max_draining=1)
+
+        self.assertEqual(report['data']['cordoned'], ['n1'])
+        self.assertEqual(self.client.node_updates, [('n1', 'pause')])
+        self.assertEqual(set(NodeInstance.objects.filter(status='draining').values_list('node_id', flat=True)), {'n1'})
+
+    def test_disruption_budget_is_respected(self):
+        for node_id in ('n1', 'n2', 'n3'):
+            self.add_node(node_id)
+        report = self.consolidate([self.node_info('n1', ['alice']), self.node_info('n2', ['bob', 'carol']),
+                                   self.node_info('n3', ['dave'], total_slots=20)],
+                                  max_draining=3, disruption_budget=2, migrate_sessions=True)
+
+        # Moving alice leaves a budget of 1, too little for n2's two sessions
+        self.assertEqual(report['data']['cordoned'], ['n1'])
+        self.assertEqual(report['data']['moved'], [{'username': 'alice', 'from': 'n1', 'to': 'n2'}])
+        self.assertEqual(self.client.service_updates, [('alice-code-server', ['node.role == worker', 'node.id == n2'])])
+        self.assertEqual(NodeInstance.objects.get(node_id='n2').status, 'active')
+
+    def test_sessions_stay_put_without_migration(self):
+        for node_id in ('n1', 'n2', 'n3'):
+            self.add_node(node_id)
+        report = self.consolidate([self.node_info('n1', ['alice']), self.node_info('n2', ['bob']),
+                                   self.node_info('n3', ['carol'], total_slots=20)], max_draining=2)
+
+        self.assertEqual(report['data']['cordoned'], ['n1', 'n2'])
+        self.assertEqual(report['data']['moved'], [])
+        self.assertEqual(self.client.service_updates, [])
+
+    def test_failed_pause_puts_the_node_back_in_service(self):
+        self.add_node('n1')
+        self.add_node('n2')
+        report = self.consolidate([self.node_info('n1', ['alice']), self.node_info('n2', ['bob'], total_slots=20)],
+                                  errors={'n1': docker.errors.APIError("update out of sequence")})
+
+        self.assertEqual(report['status'], 'failed')
+        self.assertEqual(report['data']['cordoned'], [])
+        self.assertEqual(NodeInstance.objects.get(node_id='n1').status, 'active')
+
+    def test_unreadable_nodes_return_the_error(self):
+        with mock.patch.object(consolidation.swarm_mirror, 'get_node_detail_info',
+                               return_value={'status': 'failed', 'error': 'boom'}):
+            self.assertEqual(consolidation.consolidate_nodes(), {'status': 'failed', 'error': 'boom'})
+
+
+class WarmPoolTests(TestCase):
+    def setUp(self):
+        self.pool = warm_pool.WarmPool(size=3)
+
+    def nodes(self, *tasks_counts):
+        return {'status': 'success', 'data': [{'id': f"n{i}", 'status': 'ready', 'availability': 'active',
+                                               'free_slots': 5 - count, 'tasks_count': count}
+                                              for i, count in enumerate(tasks_counts)]}
+
+    def ensure_standby(self, nodes):
+        with mock.patch.object(warm_pool.swarm_mirror, 'get_node_detail_info', return_value=nodes), \
+                mock.patch.object(warm_pool, 'lunch_template') as launch:
+            launched = self.pool.ensure_standby()
+        return launched, launch
+
+    def test_standby_tops_up_to_the_pool_size(self):
+        launched, launch = self.ensure_standby(self.nodes(0, 2, 5))
+        self.assertEqual(launched, 2)
+        launch.assert_called_once_with(max_count=2)
+        self.assertEqual(self.pool.stats()['launched'], 2)
+
+    def test_booting_nodes_count_toward_the_pool(self):
+        NodeInstance.objects.create(instance_id='i-1', private_ip='10.0.0.1', status='provisioning')
+        NodeInstance.objects.create(instance_id='i-2', private_ip='10.0.0.2', status='active')
+        launched, launch = self.ensure_standby(self.nodes(0, 1))
+        self.assertEqual(launched, 1)
+        launch.assert_called_once_with(max_count=1)
+
+    def test_full_pool_and_zero_size_launch_nothing(self):
+        launched, launch = self.ensure_standby(self.nodes(0, 0, 0, 4))
+        self.assertEqual(launched, 0)
+        launch.assert_not_called()
+
+        self.pool.size = 0
+        launched, launch = self.ensure_standby(self.nodes(4))
+        self.assertEqual(launched, 0)
+        launch.assert_not_called()
+
+    def test_unreadable_nodes_launch_nothing(self):
+        launched, launch = self.ensure_standby({'status': 'failed', 'error': 'boom'})
+        self.assertEqual(launched, 0)
+        launch.assert_not_called()
+
+    def test_standby_keeps_warm_idle_nodes_first(self):
+        self.pool.size = 2
+        self.pool._warm_nodes = {'n3', 'n4'}
+        self.assertEqual(self.pool.select_standby(['n1', 'n2', 'n3', 'n4']), ['n3', 'n4'])
+        self.pool._warm_nodes = {'n2'}
+        self.assertEqual(self.pool.select_standby(['n1', 'n2', 'n3']), ['n2', 'n1'])
+        self.pool.size = 0
+        self.assertEqual(self.pool.select_standby(['n1', 'n2']), [])
+
+    def test_prepull_is_skipped_when_disabled(self):
+        with mock.patch.object(warm_pool, 'image_prepull_enabled', False), \
+                mock.patch.object(warm_pool.warm_pool, 'ensure_prepull_service') as prepull, \
+                mock.patch.object(warm_pool.warm_pool, 'refresh') as refresh, \
+                mock.patch.object(warm_pool.warm_pool, 'ensure_standby') as standby:
+            warm_pool.maintain_warm_pool()
+        prepull.assert_not_called()
+        refresh.assert_not_called()
+        standby.assert_called_once_with()
+
+
+def make_node_info(node_id, free_slots, total_slots=8, tasks=(), status='ready', availability='active'):
+    return {'id': node_id, 'status': status, 'availability': availability, 'total_slots': total_slots,
+            'free_slots': free_slots, 'tasks': [{'name': name} for name in tasks]}
+
+
+class PlacementEngineTests(TestCase):
+    def setUp(self):
+        self.nodes = [make_node_info('n1', 1), make_node_info('n2', 4), make_node_info('n3', 7)]
+
+    def test_pack_picks_the_fullest_node_with_room(self):
+        self.assertEqual(PlacementEngine('pack').select_node('alice', self.nodes), 'n1')
+        self.assertEqual(PlacementEngine('pack').select_node('alice', self.nodes, slots=2), 'n2')
+
+    def test_spread_picks_the_emptiest_node(self):
+        self.assertEqual(PlacementEngine('spread').select_node('alice', self.nodes), 'n3')
+
+    def test_warm_nodes_win(self):
+        self.assertEqual(PlacementEngine('pack').select_node('alice', self.nodes, warm_nodes={'n3'}), 'n3')
+        self.assertEqual(PlacementEngine('spread').select_node('alice', self.nodes, warm_nodes={'n1'}), 'n1')
+
+    def test_unschedulable_nodes_are_skipped(self):
+        nodes = [make_node_info('n1', 5, availability='pause'), make_node_info('n2', 5, status='down'),
+                 make_node_info('n3', 5)]
+        self.assertEqual(PlacementEngine('pack').select_node('alice', nodes), 'n3')
+        self.assertIsNone(PlacementEngine('pack').select_node('alice', nodes[:2]))
+
+    def test_reservations_hold_slots_until_the_task_shows_up(self):
+        engine = PlacementEngine('pack')
+        self.assertEqual(engine.select_node('alice', self.nodes), 'n1')
+        # n1's only slot is reserved for alice
+        self.assertEqual(engine.select_node('bob', self.nodes), 'n2')
+
+        placed = [make_node_info('n1', 1, tasks=['alice']), make_node_info('n2', 4), make_node_info('n3', 7)]
+        self.assertEqual(engine.select_node('carol', placed), 'n1')
+
+    def test_expired_reservations_are_dropped(self):
+        engine = PlacementEngine('pack', reservation_ttl=0)
+        self.assertEqual(engine.select_node('alice', self.nodes), 'n1')
+        self.assertEqual(engine.select_node('bob', self.nodes), 'n1')
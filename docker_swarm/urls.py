@@ -1,14 +1,20 @@
 from django.urls import path
-from docker_swarm.views import docker_views, node_views
+from docker_swarm.views import docker_views, node_views, job_views, stats_views, scaling_views, async_views, readiness_views
 
 urlpatterns = []
 
 docker_urls = [
     path('task', docker_views.ContainerCollection.as_view(), name='task_collection'),
-    path('task/<username>', docker_views.ContainerResource.as_view(), name='task_resource')
+    path('task/<username>', docker_views.ContainerResource.as_view(), name='task_resource'),
+    path('task/<username>/readiness', readiness_views.SessionReadiness.as_view(), name='task_readiness'),
 ]
 urlpatterns.extend(docker_urls)
 
+job_urls = [
+    path('job/<uuid:job_id>', job_views.ProvisioningJobResource.as_view(), name='job_resource'),
+]
+urlpatterns.extend(job_urls)
+
 node_urls = [
     path('node', node_views.NodeCollection.as_view(), name='node_list'),
     path('node/<int:count>', node_views.ScaleUpNodes.as_view(), name='scale_up_nodes'),
@@ -16,3 +22,22 @@ node_urls = [
     path('schedule_autoscaledown/<int:scale_down_schedule_time>', node_views.ScheduleNodeScaleDown.as_view(), name='schedule_autoscaledown'),
 ]
 urlpatterns.extend(node_urls)
+
+scaling_urls = [
+    path('scaling/policy', scaling_views.ScalingPolicyResource.as_view(), name='scaling_policy'),
+]
+urlpatterns.extend(scaling_urls)
+
+# Async variants of the status endpoints, for ASGI deployments
+async_urls = [
+    path('async/task', async_views.AsyncContainerCollection.as_view(), name='async_task_collection'),
+    path('async/task/<username>', async_views.AsyncContainerResource.as_view(), name='async_task_resource'),
+    path('async/job/<uuid:job_id>', async_views.AsyncProvisioningJobResource.as_view(), name='async_job_resource'),
+    path('async/node', async_views.AsyncNodeCollection.as_view(), name='async_node_list'),
+]
+urlpatterns.extend(async_urls)
+
+stats_urls = [
+    path('stats', stats_views.SwarmStats.as_view(), name='swarm_stats'),
+]
+urlpatterns.extend(stats_urls)
@@ -0,0 +1,222 @@
+import math
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from config import accepted_containers_count, capacity_wait_timeout, logger
+from docker_swarm.models import CapacityReservation, NodeInstance, ScalingState
+from docker_swarm.utils.cloud_provider import SimulatedProvider, set_cloud_provider
+from docker_swarm.utils.scale_up import DEFAULT_KEY, reserve_capacity, release_capacity
+from docker_swarm.utils.scaling_policy import build_scaling_policy
+from docker_swarm.utils.session_profiles import get_slot_size
+
+
+class VirtualClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def percentile(values: list, pct: float):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+class SimulatedSwarm:
+    """
+    Worker nodes of a simulation, reported in the `get_node_snapshot` shape.
+    Sessions fill nodes in join order, the way pack placement would.
+    """
+    def __init__(self, capacity_per_node: int):
+        self.capacity_per_node = capacity_per_node
+        self.nodes = {}  # node_id -> {'ip': str, 'owners': set}
+
+    def join(self, node_id: str, ip: str):
+        self.nodes[node_id] = {'ip': ip, 'owners': set()}
+
+    def place(self, owner: str):
+        """
+        Put `owner` on the first node with a free slot; None when all are full.
+        """
+        for node_id, node in self.nodes.items():
+            if len(node['owners']) < self.capacity_per_node:
+                node['owners'].add(owner)
+                return node_id
+        return None
+
+    def leave(self, node_id: str, owner: str):
+        self.nodes[node_id]['owners'].discard(owner)
+
+    def used_slots(self):
+        return sum(len(node['owners']) for node in self.nodes.values())
+
+    def node_detail_list(self):
+        return [{
+            'id': node_id, 'ip': node['ip'], 'status': 'ready', 'availability': 'active',
+            'total_slots': self.capacity_per_node, 'free_slots': self.capacity_per_node - len(node['owners']),
+            'tasks_count': len(node['owners']), 'tasks': [{'name': owner} for owner in node['owners']],
+        } for node_id, node in self.nodes.items()]
+
+
+@contextmanager
+def simulated_environment(clock, provider):
+    """
+    Run the real scale-up code against `provider`, in one transaction that
+    is rolled back, with `timezone.now` following `clock` so reservation
+    TTLs and the provisioning timeout elapse in simulated time. Its
+    per-request logging is muted.
+    """
+    started_at = timezone.now()
+    real_now, logger_disabled = timezone.now, logger.disabled
+    previous = set_cloud_provider(provider)
+    timezone.now = lambda: started_at + timedelta(seconds=clock())
+    logger.disabled = True
+    try:
+        with transaction.atomic():
+            # Start from an empty ledger, whatever the database holds
+            CapacityReservation.objects.all().delete()
+            NodeInstance.objects.all().delete()
+            ScalingState.objects.update_or_create(key=DEFAULT_KEY, defaults={'pending_capacity': 0})
+            yield
+            transaction.set_rollback(True)
+    finally:
+        timezone.now = real_now
+        logger.disabled = logger_disabled
+        set_cloud_provider(previous)
+
+
+def run_autoscaler_simulation(session_count: int = 1000, arrival_rate: float = 1.0, boot_latency: float = 180,
+                              failure_rate: float = 0.0, session_duration: float = None, initial_nodes: int = 1,
+                              capacity_per_node: int = accepted_containers_count, tick: float = 1.0,
+                              wait_timeout: float = capacity_wait_timeout, seed: int = 0,
+                              policy: str = "threshold", policy_params: dict = None):
+    """
+    Replay a synthetic login workload against the real scale-up path in
+    virtual time, with no Docker or cloud involved.
+
+    Sessions arrive as a Poisson process of `arrival_rate` per second. Each
+    arrival calls `reserve_capacity` with the named scaling policy, as a
+    POST does through check_and_scale_up: the ledger is locked, the
+    reservations and pending capacity are read from the database and the
+    nodes are launched on a SimulatedProvider, whose instances join the
+    swarm after their boot latency. Sessions wait FIFO for a free slot,
+    give up after `wait_timeout` like wait_for_capacity (releasing their
+    reservation) and, when `session_duration` is set, leave after an
+    exponential lifetime of that mean. Database writes are rolled back.
+
+    Returns:
+        dict: wait-time percentiles, time-to-capacity, launches and
+        overprovisioning (share of paid slot-seconds left idle).
+    """
+    rng = random.Random(seed)
+    clock = VirtualClock()
+    slot_cpu, slot_memory = get_slot_size()
+    provider = SimulatedProvider(boot_latency=boot_latency, failure_rate=failure_rate, clock=clock, seed=seed,
+                                 instance_type="simulated",
+                                 resources={'nano_cpus': slot_cpu * capacity_per_node, 'memory_bytes': slot_memory * capacity_per_node})
+    planner = build_scaling_policy(policy, policy_params, capacity_per_node=capacity_per_node, clock=clock)
+
+    arrivals = []
+    at = 0.0
+    for _ in range(session_count):
+        at += rng.expovariate(arrival_rate)
+        arrivals.append(at)
+
+    # Workers already in the swarm when the run starts
+    swarm = SimulatedSwarm(capacity_per_node)
+    for i in range(initial_nodes):
+        swarm.join(f"initial-{i}", f"10.255.{i // 250}.{i % 250 + 1}")
+    booting = set()
+
+    queue = []        # (arrived_at, owner) of sessions waiting for a slot
+    departures = []   # (leave_at, node_id, owner)
+    waits = []
+    timed_out = 0
+    shortfalls = []   # durations of periods with sessions queued
+    shortfall_started = None
+    failed_nodes = peak_nodes = 0
+    slot_seconds = idle_slot_seconds = 0.0
+    next_arrival = 0
+
+    with simulated_environment(clock, provider):
+        while next_arrival < session_count or queue:
+            clock.now += tick
+
+            for instance_id in provider.refresh():
+                booting.discard(instance_id)
+                swarm.join(instance_id, provider.instances[instance_id]['private_ip'])
+            for instance_id in [instance_id for instance_id in booting if provider.instances[instance_id]['state'] == 'failed']:
+                booting.discard(instance_id)
+                failed_nodes += 1
+
+            if departures:
+                still_running = []
+                for leave_at, node_id, owner in departures:
+                    if leave_at <= clock.now:
+                        swarm.leave(node_id, owner)
+                    else:
+                        still_running.append((leave_at, node_id, owner))
+                departures = still_running
+
+            while next_arrival < session_count and arrivals[next_arrival] <= clock.now:
+                owner = f"sim-{next_arrival:06d}"
+                launched_before = set(provider.instances)
+                reserve_capacity([owner], policy=planner, get_nodes=swarm.node_detail_list)
+                booting.update(set(provider.instances) - launched_before)
+                queue.append((arrivals[next_arrival], owner))
+                next_arrival += 1
+
+            while queue:
+                node_id = swarm.place(queue[0][1])
+                if node_id is None:
+                    break
+                arrived_at, owner = queue.pop(0)
+                waits.append(clock.now - arrived_at)
+                if session_duration:
+                    departures.append((clock.now + rng.expovariate(1 / session_duration), node_id, owner))
+
+            while queue and clock.now - queue[0][0] >= wait_timeout:
+                release_capacity([queue.pop(0)[1]])
+                timed_out += 1
+
+            if queue and shortfall_started is None:
+                shortfall_started = clock.now
+            elif not queue and shortfall_started is not None:
+                shortfalls.append(clock.now - shortfall_started)
+                shortfall_started = None
+
+            peak_nodes = max(peak_nodes, len(swarm.nodes) + len(booting))
+            paid_slots = (len(swarm.nodes) + len(booting)) * capacity_per_node
+            slot_seconds += paid_slots * tick
+            idle_slot_seconds += (paid_slots - swarm.used_slots()) * tick
+
+    if shortfall_started is not None:
+        shortfalls.append(clock.now - shortfall_started)
+
+    return {
+        'policy': planner.stats(),
+        'sessions': session_count,
+        'placed': len(waits),
+        'timed_out': timed_out,
+        'simulated_seconds': round(clock.now, 1),
+        'wait_p50': round(percentile(waits, 50), 1),
+        'wait_p95': round(percentile(waits, 95), 1),
+        'wait_max': round(max(waits, default=0.0), 1),
+        'waited_sessions': sum(1 for wait in waits if wait > tick),
+        'time_to_capacity_mean': round(sum(shortfalls) / len(shortfalls), 1) if shortfalls else 0.0,
+        'time_to_capacity_max': round(max(shortfalls, default=0.0), 1),
+        'launch_calls': provider.calls['launch'],
+        'nodes_launched': len(provider.instances),
+        'failed_nodes': failed_nodes,
+        'peak_nodes': peak_nodes,
+        'final_nodes': len(swarm.nodes),
+        'overprovisioning': round(idle_slot_seconds / slot_seconds, 4) if slot_seconds else 0.0,
+    }
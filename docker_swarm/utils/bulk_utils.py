@@ -0,0 +1,123 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import docker
+
+from config import bulk_workers, base_url, logger
+from docker_swarm.utils.codespace_utils import remove_codespace
+from docker_swarm.utils.docker_utils import remove_code_server_service, get_service_name, ensure_service_absent
+from docker_swarm.utils.job_queue import enqueue_provisioning
+from docker_swarm.utils.nginx_utils import remove_nginx_config, request_nginx_reload
+from docker_swarm.utils.scale_up import ensure_capacity_for, release_capacity
+
+
+def validate_usernames(usernames):
+    if not isinstance(usernames, list) or not usernames:
+        raise ValueError("'usernames' must be a non-empty list.")
+    if not all(isinstance(username, str) and username for username in usernames):
+        raise ValueError("Every username must be a non-empty string.")
+    if len(set(usernames)) != len(usernames):
+        raise ValueError("'usernames' contains duplicates.")
+    return usernames
+
+
+def _run_concurrently(function, usernames):
+    """
+    Call `function(username)` for every user on a bounded pool.
+    Returns {username: (result, error)}.
+    """
+    def call(username):
+        try:
+            return username, function(username), None
+        except Exception as e:
+            return username, None, e
+
+    with ThreadPoolExecutor(max_workers=max(1, min(bulk_workers, len(usernames)))) as pool:
+        return {username: (result, error) for username, result, error in pool.map(call, usernames)}
+
+
+def create_sessions_bulk(usernames: list, profile: str = None):
+    """
+    Queue code-servers of the resource `profile` for many users at once:
+    one capacity reservation and scale-up for the whole batch, then one
+    provisioning job per user, as POST task/<username> would queue it.
+    Users that already have a service fail right away.
+
+    Returns:
+        list: One result dict per username, in request order.
+    """
+    checks = _run_concurrently(ensure_service_absent, usernames)
+    accepted = [username for username in usernames if checks[username][1] is None]
+    if accepted:
+        logger.error(ensure_capacity_for(accepted, profile))
+
+    results = []
+    failed = []
+    for username in usernames:
+        _, error = checks[username]
+        if error is None:
+            try:
+                job = enqueue_provisioning(username, profile, capacity_reserved=True)
+            except Exception as e:
+                failed.append(username)
+                error = e
+
+        if error is not None:
+            results.append({"username": username, "status": "failed", "error": str(error)})
+            continue
+
+        results.append({
+            "username": username,
+            "status": "success",
+            "job_id": str(job.job_id),
+            "state": job.state,
+            "status_url": f"{base_url}/job/{job.job_id}",
+        })
+
+    if failed:
+        release_capacity(failed)
+    return results
+
+
+def delete_sessions_bulk(usernames: list):
+    """
+    Remove the code-servers of many users concurrently and apply all route
+    removals with one nginx reload.
+
+    Returns:
+        list: One result dict per username, in request order.
+    """
+    outcomes = _run_concurrently(remove_code_server_service, usernames)
+
+    results = []
+    reload_required = False
+    for username in usernames:
+        _, error = outcomes[username]
+        if error is None:
+            try:
+                remove_codespace(username)
+                reload_required = remove_nginx_config(username) or reload_required
+            except Exception as e:
+                error = e
+
+        if isinstance(error, docker.errors.NotFound):
+            results.append({"username": username, "status": "failed", "error": f"Service '{get_service_name(username)}' not found."})
+        elif error is not None:
+            results.append({"username": username, "status": "failed", "error": str(error)})
+        else:
+            results.append({"username": username, "status": "success"})
+
+    if reload_required:
+        request_nginx_reload()
+    return results
+
+
+def get_bulk_status_code(results: list, success_status: int = 200):
+    """
+    `success_status` if every user succeeded, 400 if none did, 207 otherwise.
+    """
+    failed = sum(1 for result in results if result["status"] == "failed")
+    if failed == 0:
+        return success_status
+    if failed == len(results):
+        return 400
+    return 207
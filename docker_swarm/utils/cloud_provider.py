@@ -0,0 +1,279 @@
+import ipaddress
+import itertools
+import random
+import threading
+import time
+
+import boto3
+from botocore.config import Config
+
+from config import (
+    access_key, secret_access_key, region, launch_template_id, cloud_provider_name, ec2_max_attempts,
+    sim_boot_latency, sim_failure_rate, logger
+)
+
+# EC2 accepts at most 1000 instance ids per terminate call
+EC2_BATCH_SIZE = 1000
+# A failed describe call is not repeated for this many seconds; the
+# lookups run under the capacity ledger lock
+EC2_LOOKUP_RETRY_INTERVAL = 300
+
+
+def chunks(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class CloudProvider:
+    """
+    What the autoscaler needs from a cloud. Instances are reported as
+    {'instance_id': str, 'private_ip': str, 'state': str, 'instance_type': str}.
+    """
+    name = None
+
+    def get_instance_resources(self, instance_type: str):
+        """
+        {'nano_cpus': int, 'memory_bytes': int} of an instance type, or None when unknown.
+        """
+        return None
+
+    def get_launch_instance_type(self):
+        """
+        Instance type `launch_instances` starts, or '' when unknown.
+        """
+        return ''
+
+    def launch_instances(self, count: int):
+        """
+        Launch up to `count` worker instances in one call and return them.
+        """
+        raise NotImplementedError
+
+    def terminate_instances(self, instance_ids: list):
+        """
+        Terminate the given instances and return the ids accepted for termination.
+        """
+        raise NotImplementedError
+
+
+class EC2Provider(CloudProvider):
+    """
+    EC2 through one process-wide boto3 client, created on first use and
+    configured with adaptive retries. boto3 clients are thread-safe, so
+    every thread shares it. Launch template and instance type lookups are
+    cached, failures for EC2_LOOKUP_RETRY_INTERVAL seconds.
+    """
+    name = "ec2"
+
+    def __init__(self, template_id: str = launch_template_id, clock=time.monotonic):
+        self.template_id = template_id
+        self.clock = clock
+        self._client = None
+        self._lock = threading.Lock()
+        self._instance_resources = {}  # instance_type -> resources, they never change
+        self._launch_instance_type = None
+        self._failed_lookups = {}      # lookup key -> time it may be retried
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = boto3.client(
+                        'ec2',
+                        aws_access_key_id=access_key,
+                        aws_secret_access_key=secret_access_key,
+                        region_name=region,
+                        config=Config(retries={'max_attempts': ec2_max_attempts, 'mode': 'adaptive'})
+                    )
+        return self._client
+
+    def launch_instances(self, count: int):
+        # Launch instances using the launch template
+        response = self.client.run_instances(
+            LaunchTemplate={
+                'LaunchTemplateId': self.template_id,
+                'Version': '$Latest'
+            },
+            MinCount=1,
+            MaxCount=count
+        )
+        return [
+            {
+                'instance_id': instance['InstanceId'], 'private_ip': instance['PrivateIpAddress'],
+                'state': instance['State']['Name'], 'instance_type': instance.get('InstanceType', ''),
+            }
+            for instance in response['Instances']
+        ]
+
+    def _lookup_failed_recently(self, key: str):
+        return self.clock() < self._failed_lookups.get(key, 0)
+
+    def _lookup_failed(self, key: str):
+        self._failed_lookups[key] = self.clock() + EC2_LOOKUP_RETRY_INTERVAL
+
+    def get_launch_instance_type(self):
+        if self._launch_instance_type is None:
+            if self._lookup_failed_recently(self.template_id):
+                return ''
+            try:
+                versions = self.client.describe_launch_template_versions(LaunchTemplateId=self.template_id, Versions=['$Latest'])
+                self._launch_instance_type = versions['LaunchTemplateVersions'][0]['LaunchTemplateData'].get('InstanceType', '')
+            except Exception as e:
+                logger.error(f"Could not read the instance type of launch template '{self.template_id}': {e}")
+                self._lookup_failed(self.template_id)
+                return ''
+        return self._launch_instance_type
+
+    def get_instance_resources(self, instance_type: str):
+        if not instance_type:
+            return None
+        if instance_type not in self._instance_resources:
+            if self._lookup_failed_recently(instance_type):
+                return None
+            try:
+                info = self.client.describe_instance_types(InstanceTypes=[instance_type])['InstanceTypes'][0]
+            except Exception as e:
+                logger.error(f"Could not describe instance type '{instance_type}': {e}")
+                self._lookup_failed(instance_type)
+                return None
+            self._instance_resources[instance_type] = {
+                'nano_cpus': info['VCpuInfo']['DefaultVCpus'] * 10 ** 9,
+                'memory_bytes': info['MemoryInfo']['SizeInMiB'] * 1024 * 1024,
+            }
+        return self._instance_resources[instance_type]
+
+    def terminate_instances(self, instance_ids: list):
+        terminated = []
+        for batch in chunks(list(instance_ids), EC2_BATCH_SIZE):
+            response = self.client.terminate_instances(InstanceIds=batch)
+            terminated.extend(instance['InstanceId'] for instance in response['TerminatingInstances'])
+        return terminated
+
+
+class LocalProvider(CloudProvider):
+    """
+    In-memory provider for tests and benchmarks: instances get ids and
+    private IPs immediately and nothing leaves the process.
+    """
+    name = "local"
+
+    def __init__(self, network: str = "10.99.0.0/16", instance_type: str = "local", resources: dict = None):
+        self.instance_type = instance_type
+        self.resources = resources
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._ips = ipaddress.ip_network(network).hosts()
+        self.instances = {}
+        self.calls = {'launch': 0, 'terminate': 0}
+
+    def launch_instances(self, count: int):
+        with self._lock:
+            self.calls['launch'] += 1
+            launched = []
+            for _ in range(count):
+                instance = {
+                    'instance_id': f"i-local{next(self._ids):08d}", 'private_ip': str(next(self._ips)),
+                    'state': 'running', 'instance_type': self.instance_type,
+                }
+                self.instances[instance['instance_id']] = instance
+                launched.append(dict(instance))
+            return launched
+
+    def get_instance_resources(self, instance_type: str):
+        return self.resources if instance_type == self.instance_type else None
+
+    def get_launch_instance_type(self):
+        return self.instance_type
+
+    def terminate_instances(self, instance_ids: list):
+        with self._lock:
+            self.calls['terminate'] += 1
+            terminated = []
+            for instance_id in instance_ids:
+                if instance_id in self.instances:
+                    self.instances[instance_id]['state'] = 'terminated'
+                    terminated.append(instance_id)
+            return terminated
+
+
+class SimulatedProvider(LocalProvider):
+    """
+    LocalProvider with realistic timing: instances stay "pending" for
+    `boot_latency` seconds (± `jitter`) and then either run or, with
+    probability `failure_rate`, fail. `clock` can be a virtual clock so
+    simulations run faster than real time.
+    """
+    name = "simulated"
+
+    def __init__(self, boot_latency: float = sim_boot_latency, failure_rate: float = sim_failure_rate,
+                 jitter: float = 0.2, clock=time.monotonic, seed=None, **kwargs):
+        super().__init__(**kwargs)
+        self.boot_latency = boot_latency
+        self.failure_rate = failure_rate
+        self.jitter = jitter
+        self.clock = clock
+        self._random = random.Random(seed)
+        self._boot = {}  # instance_id -> (ready_at, fails)
+
+    def launch_instances(self, count: int):
+        launched = super().launch_instances(count)
+        now = self.clock()
+        with self._lock:
+            for instance in launched:
+                latency = self.boot_latency * (1 + self._random.uniform(-self.jitter, self.jitter))
+                self._boot[instance['instance_id']] = (now + latency, self._random.random() < self.failure_rate)
+                self.instances[instance['instance_id']]['state'] = 'pending'
+                instance['state'] = 'pending'
+        return launched
+
+    def refresh(self):
+        """
+        Move booted instances to "running" or "failed".
+        Returns the ids that became running.
+        """
+        now = self.clock()
+        started = []
+        with self._lock:
+            for instance_id, (ready_at, fails) in list(self._boot.items()):
+                if ready_at > now:
+                    continue
+                del self._boot[instance_id]
+                if self.instances[instance_id]['state'] != 'pending':
+                    continue
+                self.instances[instance_id]['state'] = 'failed' if fails else 'running'
+                if not fails:
+                    started.append(instance_id)
+        return started
+
+
+CLOUD_PROVIDERS = {provider.name: provider for provider in (EC2Provider, LocalProvider, SimulatedProvider)}
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_cloud_provider():
+    """
+    The process-wide provider selected by CLOUD_PROVIDER.
+    """
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                if cloud_provider_name not in CLOUD_PROVIDERS:
+                    raise Exception(f"Unknown CLOUD_PROVIDER '{cloud_provider_name}', expected one of {sorted(CLOUD_PROVIDERS)}.")
+                _provider = CLOUD_PROVIDERS[cloud_provider_name]()
+                logger.error(f"Using cloud provider: {cloud_provider_name}")
+    return _provider
+
+
+def set_cloud_provider(provider: CloudProvider):
+    """
+    Swap the process-wide provider, e.g. for a LocalProvider in tests.
+    Returns the previous one (None if none was built yet).
+    """
+    global _provider
+    with _provider_lock:
+        previous, _provider = _provider, provider
+    return previous
@@ -0,0 +1,221 @@
+import math
+
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from config import logger
+from docker_swarm.models import CodeSpace
+from docker_swarm.utils.docker_client import docker_client
+from docker_swarm.utils.docker_utils import CODE_SERVER_IMAGE, CODE_SERVER_PORT, get_service_name, ensure_services_labelled
+from docker_swarm.utils.labels import OWNER_LABEL, IMAGE_LABEL, PORT_LABEL
+from docker_swarm.utils.node_utils import get_api_client
+from docker_swarm.utils.warm_pool import WARM_CONSTRAINT
+
+CODESPACE_FIELDS = ("id", "name", "status", "owner", "created_at", "image", "port", "node_id", "time_to_ready", "warm_start")
+
+
+def record_codespace(username: str, service_id: str, requested_at=None):
+    """
+    Register a freshly created service. Its node, state and readiness are
+    filled in by `reconcile_codespaces` once swarm has placed the task.
+    `requested_at` is when the user asked for it, now by default.
+    """
+    codespace, _ = CodeSpace.objects.update_or_create(
+        username=username,
+        defaults={
+            'service_id': service_id,
+            'service_name': get_service_name(username),
+            'image': CODE_SERVER_IMAGE,
+            'port': CODE_SERVER_PORT,
+            'state': 'pending',
+            'node_id': None,
+            'requested_at': requested_at or timezone.now(),
+            'ready_at': None,
+            'warm_start': None,
+        }
+    )
+    return codespace
+
+
+def remove_codespace(username: str):
+    CodeSpace.objects.filter(username=username).delete()
+
+
+def get_codespace_info(codespace: CodeSpace, fields=CODESPACE_FIELDS):
+    info = {
+        "id": codespace.service_id,
+        "name": codespace.service_name,
+        "status": codespace.state,
+        "owner": codespace.username,
+        "created_at": codespace.created_at,
+        "image": codespace.image,
+        "port": codespace.port,
+        "node_id": codespace.node_id,
+        "time_to_ready": codespace.time_to_ready,
+        "warm_start": codespace.warm_start,
+    }
+    return {field: info[field] for field in fields}
+
+
+def parse_codespace_list_params(query_params):
+    """
+    Read `limit`, `cursor` and `fields` of a code-space listing.
+    Raises ValueError on a bad limit or cursor, or an unknown field.
+    """
+    limit = query_params.get("limit")
+    try:
+        limit = int(limit) if limit else None
+    except ValueError:
+        limit = 0
+    if limit is not None and limit <= 0:
+        raise ValueError("'limit' must be a positive integer.")
+    cursor = query_params.get("cursor")
+    # A cursor is the service name that ended the previous page
+    if cursor and not cursor.endswith(get_service_name("")):
+        raise ValueError("'cursor' must be the next_cursor of a previous page.")
+    fields = query_params.get("fields")
+    fields = tuple(field.strip() for field in fields.split(",") if field.strip()) if fields else CODESPACE_FIELDS
+    unknown_fields = set(fields) - set(CODESPACE_FIELDS)
+    if unknown_fields:
+        raise ValueError(f"Unknown fields: {sorted(unknown_fields)}")
+    return limit, cursor, fields
+
+
+def list_codespaces(limit: int = None, cursor: str = None, fields=CODESPACE_FIELDS):
+    """
+    One page of code-spaces sorted by service name, and the cursor of the
+    next page (None on the last one).
+    """
+    codespaces = CodeSpace.objects.order_by('service_name')
+    if cursor:
+        codespaces = codespaces.filter(service_name__gt=cursor)
+    if limit is not None:
+        codespaces = list(codespaces[:limit + 1])
+
+    next_cursor = None
+    if limit is not None and len(codespaces) > limit:
+        codespaces = codespaces[:limit]
+        next_cursor = codespaces[-1].service_name
+
+    return [get_codespace_info(codespace, fields) for codespace in codespaces], next_cursor
+
+
+def get_codespace_detail(username: str):
+    """
+    Raises CodeSpace.DoesNotExist if the user has no code-space.
+    """
+    codespace = CodeSpace.objects.get(username=username)
+    return {
+        "service_id": codespace.service_id,
+        "service_name": get_service_name(username),
+        "status": codespace.state,
+        "node_id": codespace.node_id,
+        "created_at": codespace.created_at,
+    }
+
+
+def get_node_occupancy():
+    """
+    Number of code-spaces placed on each node, {node_id: count}, from one
+    grouped query.
+    """
+    rows = CodeSpace.objects.exclude(node_id=None).values('node_id').annotate(count=Count('id'))
+    return {row['node_id']: row['count'] for row in rows}
+
+
+def get_time_to_ready_stats():
+    """
+    Time from request to a running task, in seconds, for warm and cold starts.
+    """
+    buckets = {'warm': [], 'cold': []}
+    for requested_at, ready_at, warm_start in CodeSpace.objects.exclude(requested_at=None).exclude(ready_at=None).values_list(
+        'requested_at', 'ready_at', 'warm_start'
+    ):
+        buckets['warm' if warm_start else 'cold'].append((ready_at - requested_at).total_seconds())
+
+    stats = {}
+    for name, values in buckets.items():
+        values.sort()
+        stats[name] = {
+            'count': len(values),
+            'mean': round(sum(values) / len(values), 3) if values else None,
+            'p50': round(values[(len(values) - 1) // 2], 3) if values else None,
+            'p95': round(values[math.ceil(0.95 * len(values)) - 1], 3) if values else None,
+        }
+    return stats
+
+
+def get_task_started_at(task: dict):
+    """
+    When a running task reached that state, from its status timestamp.
+    """
+    return parse_datetime(task['Status'].get('Timestamp') or '') or timezone.now()
+
+
+def reconcile_codespaces():
+    """
+    Bring the CodeSpace table in line with Docker using one service listing
+    and one tasks() call: fill in node, state and readiness, add services
+    created outside this controller and drop rows whose service is gone.
+    """
+    ensure_services_labelled()
+    # Rows updated after this instant may belong to a service the listing below misses
+    started_at = timezone.now()
+    # Uncached: a listing older than `started_at` would drop newly created services
+    services = docker_client.services.list(filters={'label': OWNER_LABEL})
+    tasks = get_api_client().tasks(filters={'desired-state': ['running']})
+
+    task_by_service = {}
+    for task in tasks:
+        task_by_service[task.get('ServiceID')] = task
+
+    existing = {codespace.username: codespace for codespace in CodeSpace.objects.all()}
+    to_create, to_update = [], []
+    seen = set()
+
+    for service in services:
+        labels = service.attrs.get('Spec', {}).get('Labels') or {}
+        username = labels.get(OWNER_LABEL)
+        if not username:
+            continue
+        seen.add(username)
+
+        task = task_by_service.get(service.id)
+        node_id = (task.get('NodeID') or None) if task else None
+        state = 'running' if task and task['Status']['State'] == 'running' else 'pending'
+        constraints = service.attrs.get('Spec', {}).get('TaskTemplate', {}).get('Placement', {}).get('Constraints') or []
+
+        codespace = existing.get(username)
+        # Decided by the first placement, a later move must not change it
+        warm_start = codespace.warm_start if codespace and codespace.warm_start is not None else WARM_CONSTRAINT in constraints
+        ready_at = codespace.ready_at if codespace else None
+        if state == 'running' and ready_at is None:
+            ready_at = get_task_started_at(task)
+        if codespace is None:
+            to_create.append(CodeSpace(
+                username=username,
+                service_id=service.id,
+                service_name=service.name,
+                node_id=node_id,
+                image=labels.get(IMAGE_LABEL, ''),
+                port=int(labels[PORT_LABEL]) if labels.get(PORT_LABEL) else None,
+                state=state,
+                ready_at=ready_at,
+                warm_start=warm_start,
+            ))
+        elif (codespace.service_id, codespace.node_id, codespace.state, codespace.ready_at, codespace.warm_start) != (service.id, node_id, state, ready_at, warm_start):
+            codespace.service_id, codespace.node_id, codespace.state = service.id, node_id, state
+            codespace.ready_at, codespace.warm_start = ready_at, warm_start
+            codespace.updated_at = timezone.now()
+            to_update.append(codespace)
+
+    with transaction.atomic():
+        CodeSpace.objects.bulk_create(to_create, ignore_conflicts=True)
+        CodeSpace.objects.bulk_update(to_update, ['service_id', 'node_id', 'state', 'ready_at', 'warm_start', 'updated_at'])
+        removed, _ = CodeSpace.objects.exclude(username__in=seen).filter(updated_at__lt=started_at).delete()
+
+    result = {'created': len(to_create), 'updated': len(to_update), 'removed': removed}
+    logger.error(f"Reconciled code-spaces: {result}")
+    return result
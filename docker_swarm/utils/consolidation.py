@@ -0,0 +1,202 @@
+from django.db import transaction
+
+from config import (
+    min_capacity_required, consolidation_max_occupancy, consolidation_max_draining,
+    consolidation_disruption_budget, consolidation_migrate_sessions, logger
+)
+from docker_swarm.models import NodeInstance
+from docker_swarm.utils.custom_utils import scale_down_nodes
+from docker_swarm.utils.docker_utils import get_service_name
+from docker_swarm.utils.node_utils import get_api_client
+from docker_swarm.utils.placement import placement_engine
+from docker_swarm.utils.scale_up import lock_scaling_state
+from docker_swarm.utils.session_profiles import get_reservation_slots
+from docker_swarm.utils.swarm_cache import swarm_cache, NODES_KEY
+from docker_swarm.utils.swarm_mirror import swarm_mirror
+from docker_swarm.utils.warm_pool import warm_pool
+
+
+def set_node_availability(node_id: str, availability: str):
+    """
+    Set a node to active, pause or drain.
+    """
+    api_client = get_api_client()
+    attrs = api_client.inspect_node(node_id)
+    spec = attrs['Spec']
+    if spec.get('Availability') != availability:
+        spec['Availability'] = availability
+        api_client.update_node(node_id, attrs['Version']['Index'], spec)
+
+
+def move_session(username: str, node_id: str):
+    """
+    Re-pin a session's service to `node_id`. Swarm replaces the task there;
+    the session restarts from its bind-mounted home folder.
+    """
+    api_client = get_api_client()
+    service = api_client.inspect_service(get_service_name(username))
+    placement = service['Spec']['TaskTemplate'].get('Placement') or {}
+    constraints = [constraint for constraint in placement.get('Constraints') or [] if not constraint.startswith("node.id")]
+    constraints.append(f"node.id == {node_id}")
+    api_client.update_service(
+        service['ID'], service['Version']['Index'],
+        task_template={'Placement': {**placement, 'Constraints': constraints}},
+        fetch_current_spec=True
+    )
+
+
+def consolidate_nodes(max_occupancy: int = consolidation_max_occupancy, max_draining: int = consolidation_max_draining,
+                      disruption_budget: int = consolidation_disruption_budget,
+                      migrate_sessions: bool = consolidation_migrate_sessions):
+    """
+    Empty under-used workers so they can be removed and terminated.
+
+    A worker holding at most `max_occupancy` sessions is paused, so it
+    takes no new sessions, and recorded as "draining". With
+    `migrate_sessions` its sessions are re-pinned to fuller nodes right
+    away, at most `disruption_budget` per run; without it they are left
+    to end on their own. Draining nodes that are empty are drained,
+    removed from the swarm and terminated. No more than `max_draining`
+    nodes drain at once, a node is only picked when the rest of the
+    cluster can absorb its sessions plus MIN_CAPACITY_REQUIRED, and every
+    draining node goes back into service if free capacity falls below
+    that buffer.
+
+    The decisions are made and recorded on NodeInstance under the capacity
+    ledger lock, so workers of several processes never spend the
+    disruption budget twice or cordon nodes a concurrent scale-up is
+    counting on. The Docker and cloud calls run after the commit; a node
+    whose call fails is put back to its previous state.
+
+    Returns:
+        dict: 'status' (success, partial or failed) and 'data' with the
+        node and session ids acted on and the errors per node or session.
+    """
+    with transaction.atomic():
+        lock_scaling_state()
+        response = swarm_mirror.get_node_detail_info()
+        if response['status'] == 'failed':
+            logger.error(f"Consolidation: could not read nodes: {response.get('error')}")
+            return response
+        plan = _plan_consolidation(response['data'], max_occupancy, max_draining, disruption_budget, migrate_sessions)
+
+    report = _apply_consolidation(plan)
+    logger.error(f"Consolidation: {report}")
+    return report
+
+
+def _plan_consolidation(nodes_list: list, max_occupancy: int, max_draining: int, disruption_budget: int,
+                        migrate_sessions: bool):
+    """
+    Decide one consolidation run and record it on NodeInstance. The caller
+    holds the ledger lock; no Docker call is made here.
+    """
+    nodes = {node['id']: node for node in nodes_list}
+    draining = set(NodeInstance.objects.filter(status='draining').exclude(node_id=None).values_list('node_id', flat=True))
+    plan = {'remove': [], 'drain': [], 'reactivate': [], 'cordon': [], 'moves': []}
+
+    # Step 1: Remove draining nodes that are empty (or already gone from the swarm)
+    plan['remove'] = sorted(node_id for node_id in draining if node_id not in nodes or nodes[node_id]['tasks_count'] == 0)
+    plan['drain'] = [node_id for node_id in plan['remove'] if node_id in nodes]
+    NodeInstance.objects.filter(node_id__in=plan['remove']).update(status='removed')
+    draining -= set(plan['remove'])
+
+    in_service = [
+        node for node in nodes.values()
+        if node['id'] not in draining and node['id'] not in plan['remove']
+        and node['status'] == 'ready' and node['availability'] == 'active'
+    ]
+    free_slots = sum(node['free_slots'] for node in in_service)
+
+    # Step 2: Give draining nodes back when the rest of the cluster runs short
+    if draining and free_slots < min_capacity_required:
+        plan['reactivate'] = sorted(draining)
+        NodeInstance.objects.filter(node_id__in=draining).update(status='active')
+        logger.error(f"Consolidation: free capacity {free_slots} below {min_capacity_required}, reactivating {plan['reactivate']}")
+        return plan
+
+    # Step 3: Cordon the emptiest nodes the cluster can absorb, within the budget
+    managed = set(NodeInstance.objects.filter(status='active', node_id__in=[node['id'] for node in in_service]).values_list('node_id', flat=True))
+    candidates = sorted(
+        (node for node in in_service if node['id'] in managed and 0 < node['tasks_count'] <= max_occupancy),
+        key=lambda node: (node['tasks_count'], node['id'])
+    )
+    for node in candidates:
+        if len(draining) >= max_draining:
+            break
+        # The node's free slots go away and its sessions need room elsewhere
+        if free_slots - node['total_slots'] < min_capacity_required:
+            break
+        if migrate_sessions and node['tasks_count'] > disruption_budget:
+            continue
+
+        draining.add(node['id'])
+        free_slots -= node['total_slots']
+        plan['cordon'].append(node['id'])
+
+        if not migrate_sessions:
+            continue
+
+        targets = [target for target in in_service if target['id'] not in draining]
+        for task in node['tasks']:
+            slots = get_reservation_slots(task['cpu_reservation'], task['memory_reservation'])
+            target_id = placement_engine.select_node(task['name'], targets, warm_pool.warm_nodes(), slots)
+            if target_id is None:
+                break
+            disruption_budget -= 1
+            plan['moves'].append({'username': task['name'], 'from': node['id'], 'to': target_id})
+
+    NodeInstance.objects.filter(node_id__in=plan['cordon']).update(status='draining')
+    return plan
+
+
+def _apply_consolidation(plan: dict):
+    """
+    Make the Docker and cloud calls of a recorded plan. A node whose call
+    fails goes back to its previous state, to be picked up next run.
+    """
+    result = {'removed': [], 'reactivated': [], 'cordoned': [], 'moved': []}
+    errors = {}
+
+    def call(key, func, *args):
+        try:
+            func(*args)
+            return True
+        except Exception as e:
+            errors[key] = str(e)
+            return False
+
+    # Step 1: Drain, remove and terminate the emptied nodes
+    drained = [node_id for node_id in plan['drain'] if call(node_id, set_node_availability, node_id, 'drain')]
+    to_remove = [node_id for node_id in plan['remove'] if node_id in drained or node_id not in plan['drain']]
+    if to_remove:
+        scale_down_report = scale_down_nodes(to_remove)
+        for node_id, outcome in scale_down_report['data'].items():
+            if outcome['removed']:
+                result['removed'].append(node_id)
+            if outcome['error']:
+                errors[node_id] = outcome['error']
+    NodeInstance.objects.filter(node_id__in=set(plan['remove']) - set(result['removed'])).update(status='draining')
+
+    # Step 2: Put draining nodes back into service
+    result['reactivated'] = [node_id for node_id in plan['reactivate'] if call(node_id, set_node_availability, node_id, 'active')]
+    NodeInstance.objects.filter(node_id__in=set(plan['reactivate']) - set(result['reactivated'])).update(status='draining')
+
+    # Step 3: Pause the cordoned nodes and move their sessions
+    result['cordoned'] = [node_id for node_id in plan['cordon'] if call(node_id, set_node_availability, node_id, 'pause')]
+    NodeInstance.objects.filter(node_id__in=set(plan['cordon']) - set(result['cordoned'])).update(status='active')
+    result['moved'] = [
+        move for move in plan['moves']
+        if move['from'] in result['cordoned'] and call(move['username'], move_session, move['username'], move['to'])
+    ]
+
+    if any(result.values()):
+        swarm_cache.invalidate(NODES_KEY)
+
+    if not errors:
+        status = 'success'
+    elif any(result.values()):
+        status = 'partial'
+    else:
+        status = 'failed'
+    return {'status': status, 'data': {**result, 'errors': errors}}
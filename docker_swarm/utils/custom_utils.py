@@ -1,11 +1,14 @@
-import boto3
-
-from docker_swarm.utils.node_utils import get_docker_node_detail_info, get_idle_nodes_to_remove, remove_node_from_swarm
+from docker_swarm.utils.codespace_utils import get_node_occupancy
+from docker_swarm.utils.node_utils import get_idle_nodes_to_remove, remove_node_from_swarm
+from docker_swarm.utils.swarm_cache import swarm_cache, NODES_KEY
+from docker_swarm.utils.swarm_mirror import swarm_mirror
 from docker_swarm.models import NodeInstance
-from config import logger, access_key, secret_access_key, region
+from docker_swarm.utils.cloud_provider import get_cloud_provider
+from docker_swarm.utils.warm_pool import warm_pool
+from config import logger
 
 def schedule_scale_down():
-    nodes_list_response = get_docker_node_detail_info()
+    nodes_list_response = swarm_mirror.get_node_detail_info()
 
     if nodes_list_response['status'] == 'failed':
         logger.error(nodes_list_response)
@@ -18,33 +21,78 @@ def schedule_scale_down():
         logger.error(idel_node_ids_response)
         raise Exception(idel_node_ids_response)
     
-    idel_node_ids = idel_node_ids_response['data']
-    logger.error(f"Idle node ID's: {idel_node_ids}")
+    # Idle standby nodes of the warm pool are never scaled down, nor nodes
+    # the CodeSpace registry still places a session on (e.g. a restarting task)
+    standby_node_ids = warm_pool.select_standby([node['id'] for node in nodes_list if node['tasks_count'] == 0])
+    occupancy = get_node_occupancy()
+    occupied_node_ids = [node_id for node_id in idel_node_ids_response['data'] if occupancy.get(node_id)]
+    idel_node_ids = [node_id for node_id in idel_node_ids_response['data'] if node_id not in standby_node_ids and node_id not in occupied_node_ids]
+    logger.error(f"Idle node ID's: {idel_node_ids} | Standby: {standby_node_ids} | Occupied in registry: {occupied_node_ids}")
 
 
     if idel_node_ids != []:
-        remove_node_from_swarm_response = remove_node_from_swarm(idel_node_ids)
+        scale_down_report = scale_down_nodes(idel_node_ids)
+        logger.error(f"Scale-down report: {scale_down_report}")
 
-        if remove_node_from_swarm_response['status'] == 'failed':
-            logger.error(remove_node_from_swarm_response)
-            raise Exception(remove_node_from_swarm_response)
-        
-        terminate_aws_vm(idel_node_ids)
+        if scale_down_report['status'] == 'failed':
+            raise Exception(scale_down_report)
+        return scale_down_report
 
     return "Done"
 
 
+def scale_down_nodes(node_ids: list):
+    """
+    Remove nodes from the swarm concurrently, then terminate the VMs of
+    every node that was actually removed in one cloud call. A node that
+    could not be removed keeps its VM.
+
+    Returns:
+        dict: 'status' (success, partial or failed) and 'data' with, per
+        node, {'removed', 'error', 'instance_id', 'terminated'}.
+    """
+    removal = remove_node_from_swarm(node_ids)
+    swarm_cache.invalidate(NODES_KEY)
+
+    instance_by_node = dict(NodeInstance.objects.filter(node_id__in=list(removal['data'])).values_list('node_id', 'instance_id'))
+    terminated, terminate_error = set(), None
+    try:
+        terminated = set(terminate_aws_vm(removal['removed']))
+    except Exception as e:
+        terminate_error = f"Termination failed: {e}"
+        logger.error(terminate_error)
+
+    report = {}
+    for node_id, outcome in removal['data'].items():
+        instance_id = instance_by_node.get(node_id)
+        report[node_id] = {
+            **outcome,
+            'instance_id': instance_id,
+            'terminated': instance_id in terminated,
+        }
+        if outcome['removed'] and instance_id and instance_id not in terminated:
+            report[node_id]['error'] = terminate_error or f"Instance '{instance_id}' was not terminated."
+
+    if all(outcome['error'] is None for outcome in report.values()):
+        status = 'success'
+    elif any(outcome['removed'] for outcome in report.values()):
+        status = 'partial'
+    else:
+        status = 'failed'
+    return {'status': status, 'data': report}
+
+
 def terminate_aws_vm(idel_node_ids):
     logger.error(f"Terminating AWS VMs for idle nodes: {idel_node_ids}")
 
     instance_ids = list(NodeInstance.objects.filter(node_id__in=idel_node_ids).values_list('instance_id', flat=True))
 
-    # Create an EC2 client
-    ec2 = boto3.client('ec2', aws_access_key_id=access_key, aws_secret_access_key=secret_access_key, region_name=region)
+    if not instance_ids:
+        return []
 
-    # Terminate the instances
-    response = ec2.terminate_instances(InstanceIds=instance_ids)
+    # Terminate all instances in batched calls
+    response = get_cloud_provider().terminate_instances(instance_ids)
 
-    NodeInstance.objects.filter(instance_id__in=instance_ids).delete()
+    NodeInstance.objects.filter(instance_id__in=response).delete()
 
     return response
@@ -0,0 +1,53 @@
+import threading
+
+import docker
+
+from config import docker_api_version, docker_max_pool_size, docker_timeout, logger
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_docker_client():
+    """
+    The process-wide DockerClient, created on first use.
+
+    One client means one connection pool (DOCKER_MAX_POOL_SIZE connections)
+    shared by every thread. A failed construction is not cached, so the
+    next call retries once the daemon is reachable.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = docker.from_env(
+                    version=docker_api_version,
+                    timeout=docker_timeout,
+                    max_pool_size=docker_max_pool_size,
+                )
+                logger.error(f"Connected to Docker API {_client.api.api_version}")
+    return _client
+
+
+def reset_docker_client():
+    """
+    Close and drop the shared client; the next call builds a fresh one.
+    """
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+
+
+class LazyDockerClient:
+    """
+    Stands in for the DockerClient at import time and forwards every
+    attribute to `get_docker_client()`, so importing a module never
+    touches the Docker socket.
+    """
+    def __getattr__(self, name):
+        return getattr(get_docker_client(), name)
+
+
+docker_client = LazyDockerClient()
@@ -1,30 +1,143 @@
-import random
-from config import docker_client
+import os
+from datetime import datetime, timezone
 
+import docker
+from docker.types import TaskTemplate, ContainerSpec, Mount, RestartPolicy, Placement
 
-def find_available_port():
+from config import mapping_path, code_server_image, default_session_profile, logger
+from docker_swarm.utils.docker_client import docker_client
+from docker_swarm.utils.labels import OWNER_LABEL, CREATED_AT_LABEL, IMAGE_LABEL, PORT_LABEL, PROFILE_LABEL
+from docker_swarm.utils.swarm_cache import swarm_cache
+from docker_swarm.utils.placement import placement_engine
+from docker_swarm.utils.session_profiles import get_session_resources, get_profile_slots
+
+if mapping_path[-1] == "/":
+    mapping_path = mapping_path[:-1]
+
+CODE_SERVER_IMAGE = code_server_image
+CODE_SERVER_PORT = 8080
+
+
+def get_service_name(username: str):
+    return f"{username}-code-server"
+
+
+def get_service_labels(username: str, profile: str = None):
+    return {
+        OWNER_LABEL: username,
+        CREATED_AT_LABEL: datetime.now(timezone.utc).isoformat(),
+        IMAGE_LABEL: CODE_SERVER_IMAGE,
+        PORT_LABEL: str(CODE_SERVER_PORT),
+        PROFILE_LABEL: profile or default_session_profile,
+    }
+
+
+def label_legacy_services():
     """
-    Find an available port in the ephemeral range (49152–65535).
-    Ensure the port is not already assigned to any running container.
+    Add the ownership labels to code-server services created before they
+    existed, so the label-filtered listing finds them. Only the service
+    spec labels change, running tasks are not redeployed.
     """
-    while True:
-        port = random.randint(49152, 65535)  # Use ephemeral port range
-        if not is_port_in_use(port):
-            return port
+    labelled = 0
+    for service in docker_client.services.list():
+        labels = service.attrs.get('Spec', {}).get('Labels') or {}
+        if not service.name.endswith("-code-server") or OWNER_LABEL in labels:
+            continue
+        username = service.name[:-len("-code-server")]
+        new_labels = {**get_service_labels(username), **labels, CREATED_AT_LABEL: service.attrs.get('CreatedAt', '')}
+        # Merge into the current spec, `service.update` would rebuild the task template
+        docker_client.api.update_service(service.id, service.version, labels=new_labels, fetch_current_spec=True)
+        labelled += 1
+    if labelled:
+        swarm_cache.invalidate()
+    return labelled
 
-def is_port_in_use(port):
+
+_legacy_services_labelled = False
+
+
+def ensure_services_labelled():
+    """
+    Run `label_legacy_services` once per process.
     """
-    Check if a specific port is already assigned to a running container.
+    global _legacy_services_labelled
+    if not _legacy_services_labelled:
+        labelled = label_legacy_services()
+        if labelled:
+            logger.error(f"Labelled {labelled} legacy code-server service(s).")
+        _legacy_services_labelled = True
+
+
+def ensure_service_absent(username: str):
+    """
+    Raise ValueError if the user already has a code-server service.
     """
     try:
-        containers = docker_client.containers.list()
-        for container in containers:
-            ports = container.attrs['HostConfig']['PortBindings']
-            if ports:
-                for bindings in ports.values():
-                    for binding in bindings:
-                        if binding['HostPort'] == str(port):
-                            return True
-        return False
-    except Exception as e:
-        raise Exception(f"Error checking port usage: {str(e)}")
+        docker_client.services.get(get_service_name(username))
+    except docker.errors.NotFound:
+        return
+    raise ValueError(f"A service with the name '{username}' already exists.")
+
+
+def create_code_server_service(username: str, profile: str = None):
+    """
+    Create the code-server service of a user in Docker Swarm, with the
+    reservations and limits of the resource `profile` (default one when
+    empty). The user folder is created first and an existing service is
+    an error.
+
+    Returns:
+        dict: The low-level `create_service` response (contains "ID").
+    """
+    # Ensure the folder for the user exists in mapping_path
+    container_mount_path = os.path.join(mapping_path, username)
+    user_folder_path = os.path.join("/code-spaces-mapping", username)
+    logger.error(f"User folder path: {user_folder_path}")
+
+    if not os.path.exists(user_folder_path):
+        logger.error(f"Creating user folder: {user_folder_path}")
+        os.makedirs(user_folder_path)
+
+    # Check if a service with the same name already exists
+    ensure_service_absent(username)
+
+    container_spec = ContainerSpec(
+        image=CODE_SERVER_IMAGE,
+        user="root",
+        mounts=[Mount(type="bind", source=container_mount_path, target="/home/coder")],
+        tty=True,
+        command=["code-server", "--bind-addr", f"0.0.0.0:{CODE_SERVER_PORT}", "--auth", "none"]
+    )
+
+    # Define task template with placement on the node chosen by the placement engine
+    task_template = TaskTemplate(
+        container_spec=container_spec,
+        restart_policy=RestartPolicy(condition="any"),
+        placement=Placement(constraints=placement_engine.get_placement_constraints(username, get_profile_slots(profile))),
+        resources=get_session_resources(profile)
+    )
+
+    # Create the service using low-level API
+    try:
+        service = docker_client.api.create_service(
+            task_template=task_template,
+            name=get_service_name(username),
+            labels=get_service_labels(username, profile),
+            networks=["code-spaces"]
+        )
+    except Exception:
+        placement_engine.release(username)
+        raise
+    swarm_cache.invalidate()
+    return service
+
+
+def remove_code_server_service(username: str):
+    """
+    Remove the code-server service of a user.
+    Raises docker.errors.NotFound if the user has no service.
+    """
+    service = docker_client.services.get(get_service_name(username))
+    service.remove()
+    swarm_cache.invalidate()
+
@@ -0,0 +1,148 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import close_old_connections, transaction, IntegrityError
+from django.utils import timezone
+
+from config import provisioning_workers, provisioning_job_timeout, base_url, logger
+from docker_swarm.models import ProvisioningJob
+from docker_swarm.utils.codespace_utils import record_codespace, remove_codespace
+from docker_swarm.utils.docker_utils import create_code_server_service, remove_code_server_service, get_service_name
+from docker_swarm.utils.nginx_utils import update_nginx_config, remove_nginx_config, request_nginx_reload
+from docker_swarm.utils.scale_up import check_and_scale_up, wait_for_capacity, release_capacity
+from docker_swarm.utils.session_profiles import get_profile_slots
+
+executor = ThreadPoolExecutor(max_workers=provisioning_workers, thread_name_prefix="provisioning")
+
+
+def set_job_state(job: ProvisioningJob, state: str, message: str = '', result: dict = None):
+    job.state = state
+    job.message = message
+    if result is not None:
+        job.result = result
+    job.save(update_fields=['state', 'message', 'result', 'updated_at'])
+
+
+def fail_stale_jobs(username: str = None):
+    """
+    Fail the active jobs that made no progress for PROVISIONING_JOB_TIMEOUT
+    seconds, left behind by a worker that was restarted or killed.
+    Returns the number of jobs failed.
+    """
+    cutoff = timezone.now() - timedelta(seconds=provisioning_job_timeout)
+    jobs = ProvisioningJob.objects.filter(state__in=ProvisioningJob.ACTIVE_STATES, updated_at__lt=cutoff)
+    if username:
+        jobs = jobs.filter(username=username)
+    usernames = list(jobs.values_list('username', flat=True))
+    if not usernames:
+        return 0
+
+    # One conditional UPDATE, a job that moved on in the meantime is left alone
+    count = jobs.update(
+        state='failed',
+        message=f"Abandoned after {int(provisioning_job_timeout)} seconds without progress.",
+        updated_at=timezone.now(),
+    )
+    release_capacity(usernames)
+    logger.error(f"Failed {count} stale provisioning job(s).")
+    return count
+
+
+def get_active_job(username: str):
+    return ProvisioningJob.objects.filter(username=username, state__in=ProvisioningJob.ACTIVE_STATES).first()
+
+
+def enqueue_provisioning(username: str, profile: str = '', capacity_reserved: bool = False):
+    """
+    Queue the creation of a user's code-server with the resource `profile`
+    and return its job. A user that already has an active job gets that
+    job back, unless the job is stale. With `capacity_reserved`, the
+    caller already reserved the session's capacity and the job skips its
+    own scale-up check.
+    """
+    fail_stale_jobs(username)
+    job = get_active_job(username)
+    if job:
+        return job
+
+    try:
+        with transaction.atomic():
+            job = ProvisioningJob.objects.create(username=username, profile=profile or '')
+    except IntegrityError:
+        # A concurrent request queued the user's job first, share it
+        job = get_active_job(username)
+        if job is None:
+            raise
+        return job
+    executor.submit(run_provisioning_job, job.pk, capacity_reserved)
+    return job
+
+
+def run_provisioning_job(job_pk: int, capacity_reserved: bool = False):
+    """
+    Drive one job through scale-up, service creation and nginx update.
+    A failure after the service was created removes it again, so a retry
+    starts from a clean slate.
+    """
+    close_old_connections()
+    job = ProvisioningJob.objects.get(pk=job_pk)
+    service = None
+    try:
+        if capacity_reserved:
+            set_job_state(job, 'scaling', "Capacity reserved with the batch.")
+        else:
+            set_job_state(job, 'scaling', check_and_scale_up(job.username, job.profile))
+        if not wait_for_capacity(slots=get_profile_slots(job.profile)):
+            raise Exception("Timed out waiting for free capacity in the swarm.")
+
+        set_job_state(job, 'creating')
+        service = create_code_server_service(job.username, job.profile)
+        record_codespace(job.username, service["ID"], job.created_at)
+
+        set_job_state(job, 'routing')
+        if update_nginx_config(job.username):
+            request_nginx_reload()
+
+        set_job_state(job, 'completed', "Service created successfully!", {
+            "service_id": service["ID"],
+            "service_name": get_service_name(job.username),
+            "access_url": f"{base_url}/{job.username}/?folder=/home/coder",
+        })
+    except Exception as e:
+        logger.error(f"Provisioning job {job.job_id} for '{job.username}' failed: {e}")
+        if service is not None:
+            rollback_provisioning(job.username)
+        release_capacity([job.username])
+        set_job_state(job, 'failed', str(e))
+    finally:
+        close_old_connections()
+
+
+def rollback_provisioning(username: str):
+    """
+    Undo a partly provisioned code-server: its service, CodeSpace record and
+    nginx route. Errors are logged, the job fails either way.
+    """
+    try:
+        remove_code_server_service(username)
+    except Exception as e:
+        logger.error(f"Rollback: removing the service of '{username}' failed: {e}")
+    remove_codespace(username)
+    try:
+        if remove_nginx_config(username):
+            request_nginx_reload()
+    except Exception as e:
+        logger.error(f"Rollback: removing the nginx route of '{username}' failed: {e}")
+
+
+def get_job_info(job: ProvisioningJob):
+    return {
+        "job_id": str(job.job_id),
+        "username": job.username,
+        "profile": job.profile,
+        "state": job.state,
+        "message": job.message,
+        "result": job.result,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+    }
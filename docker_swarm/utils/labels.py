@@ -0,0 +1,15 @@
+# Labels put on every service this controller creates. Listing filters on
+# OWNER_LABEL server side, so unrelated services on the swarm are never fetched.
+OWNER_LABEL = "code-server.owner"
+CREATED_AT_LABEL = "code-server.created_at"
+IMAGE_LABEL = "code-server.image"
+PORT_LABEL = "code-server.port"
+PROFILE_LABEL = "code-server.profile"
+
+# Container label of the image pre-pull tasks. They are not sessions and
+# never count against a node's capacity.
+PREPULL_LABEL = "code-server.prepull"
+# Node label set on workers that already have the code-server image.
+WARM_NODE_LABEL = "code-server.warm"
+# Node label overriding the capacity slots derived from a worker's CPUs and memory.
+NODE_CAPACITY_LABEL = "code-server.capacity"
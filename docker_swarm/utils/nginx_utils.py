@@ -1,57 +1,489 @@
+import os
+import re
+import tempfile
+import threading
+import time
+
 import docker
-from config import nginx_conf_path, docker_client, logger
+from django.db import transaction, connections
+from django.db.models import Q
+from django.utils import timezone
 
+from config import (
+    nginx_conf_path, nginx_routes_dir, nginx_routes_include_dir, nginx_routing_strategy, nginx_resolver,
+    nginx_reload_debounce, nginx_reload_mode, logger
+)
+from docker_swarm.models import NginxRoute, NginxState
+from docker_swarm.utils.docker_client import docker_client
 
-def update_nginx_config(username: str):
+NGINX_SERVICE_NAME = "code_server_nginx"
+
+
+PROXY_DIRECTIVES = """    proxy_http_version 1.1;
+    proxy_set_header Upgrade $http_upgrade;
+    proxy_set_header Connection "Upgrade";
+    proxy_set_header Host $host;
+    proxy_set_header X-Real-IP $remote_addr;
+    proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+    proxy_set_header X-Forwarded-Proto $scheme;
+    proxy_redirect off;
+    add_header X-Frame-Options SAMEORIGIN;
+    add_header Content-Security-Policy "frame-ancestors 'self' *;";
+"""
+
+NGINX_STATE_KEY = "global"
+
+GENERIC_ROUTE_FILE = "_code_spaces.conf"
+MAP_FILE = os.path.join("http", "code_spaces_map.conf")
+
+
+def render_location_block(username: str):
+    """
+    The nginx location block that routes /<username>/ to its code-server.
+    """
+    return f"""location /{username}/ {{
+    proxy_pass http://{username}-code-server:8080/;
+{PROXY_DIRECTIVES}}}
+"""
+
+
+def render_generic_location(upstream: str, guard: str = ""):
+    """
+    One regex location for every session; `upstream` is resolved per
+    request through the swarm DNS resolver.
+    """
+    return f"""resolver {nginx_resolver} valid=10s ipv6=off;
+
+location ~ ^/(?<code_space>[A-Za-z0-9_.-]+)/(?<code_space_path>.*)$ {{
+{guard}    proxy_pass http://{upstream}:8080/$code_space_path$is_args$args;
+{PROXY_DIRECTIVES}}}
+"""
+
+
+class LocationRouting:
     """
-    Update Nginx configuration to route traffic for the new container.
-    Ensures the new location block is added inside the server block.
+    One `location /<username>/` block per session, one include file each.
+    """
+    name = "location"
+    reload_on_change = True
+    http_context = False
+
+    def render(self, usernames: list):
+        return {f"{username}.conf": render_location_block(username) for username in usernames}
+
+    def add_route(self, username: str):
+        write_atomic(get_route_file_path(username), render_location_block(username))
+
+    def remove_route(self, username: str):
+        route_file_path = get_route_file_path(username)
+        if os.path.exists(route_file_path):
+            os.remove(route_file_path)
+
+
+class MapRouting:
     """
+    One generic location plus a `map` from username to upstream generated
+    from the registry. A session change rewrites only the map file.
+    """
+    name = "map"
+    reload_on_change = True
+    http_context = True
+
+    def render_map(self, usernames: list):
+        entries = "".join(f"    {username} {username}-code-server;\n" for username in usernames)
+        return f"""map $code_space $code_space_upstream {{
+    default "";
+{entries}}}
+"""
+
+    def render(self, usernames: list):
+        guard = '    if ($code_space_upstream = "") {\n        return 404;\n    }\n'
+        return {
+            GENERIC_ROUTE_FILE: render_generic_location("$code_space_upstream", guard),
+            MAP_FILE: self.render_map(usernames),
+        }
+
+    def add_route(self, username: str):
+        self.write_map()
+
+    def remove_route(self, username: str):
+        self.write_map()
+
+    def write_map(self):
+        # Read and written under the lock, so the last writer renders the latest registry
+        with _render_lock, transaction.atomic():
+            lock_nginx_state()
+            usernames = sorted(NginxRoute.objects.values_list('username', flat=True))
+            write_if_changed(os.path.join(nginx_routes_dir, MAP_FILE), self.render_map(usernames))
+
+
+class ResolverRouting:
+    """
+    One generic location resolving `<username>-code-server` through the
+    swarm DNS resolver. Sessions come and go without any config change.
+    """
+    name = "resolver"
+    reload_on_change = False
+    http_context = False
+
+    def render(self, usernames: list):
+        return {GENERIC_ROUTE_FILE: render_generic_location("$code_space-code-server")}
+
+    def add_route(self, username: str):
+        pass
+
+    def remove_route(self, username: str):
+        pass
+
+
+ROUTING_STRATEGIES = {strategy.name: strategy for strategy in (LocationRouting(), MapRouting(), ResolverRouting())}
+
+
+def get_routing_strategy():
+    if nginx_routing_strategy not in ROUTING_STRATEGIES:
+        raise Exception(f"Unknown NGINX_ROUTING_STRATEGY '{nginx_routing_strategy}', expected one of {sorted(ROUTING_STRATEGIES)}.")
+    return ROUTING_STRATEGIES[nginx_routing_strategy]
+
+
+def write_atomic(path: str, content: str):
+    """
+    Write a file with write-temp-then-rename so nginx never reads a partial file.
+    """
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
     try:
+        with os.fdopen(fd, "w") as tmp_file:
+            tmp_file.write(content)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_if_changed(path: str, content: str):
+    """
+    `write_atomic` unless the file already holds `content`. Returns whether it wrote.
+    """
+    try:
+        with open(path, "r") as current_file:
+            if current_file.read() == content:
+                return False
+    except FileNotFoundError:
+        pass
+    write_atomic(path, content)
+    return True
+
+
+def lock_nginx_state():
+    """
+    Lock the nginx state row until the surrounding transaction ends, so
+    route files are rendered by one thread or process at a time.
+    """
+    NginxState.objects.get_or_create(key=NGINX_STATE_KEY)
+    return NginxState.objects.select_for_update().get(key=NGINX_STATE_KEY)
+
+
+def record_nginx_reload(reloaded_at):
+    """
+    Store when the latest reload started, for every process to see. Config
+    written before that instant is live. Never moves the time backwards.
+    """
+    NginxState.objects.get_or_create(key=NGINX_STATE_KEY)
+    NginxState.objects.filter(key=NGINX_STATE_KEY).filter(
+        Q(last_reload_at=None) | Q(last_reload_at__lt=reloaded_at)
+    ).update(last_reload_at=reloaded_at, updated_at=timezone.now())
+
+
+def get_last_nginx_reload():
+    """
+    Start of the latest applied reload by any process, None if none yet.
+    """
+    return NginxState.objects.filter(key=NGINX_STATE_KEY).values_list('last_reload_at', flat=True).first()
+
+
+def get_route_file_path(username: str):
+    if not username or os.path.basename(username) != username or username.startswith((".", "_")):
+        raise ValueError(f"Invalid username for an nginx route: '{username}'")
+    return os.path.join(nginx_routes_dir, f"{username}.conf")
+
+
+_include_lock = threading.Lock()
+_include_ready = False
+_render_lock = threading.Lock()
+
+LEGACY_LOCATION_PATTERN = re.compile(
+    r"\n[ \t]*location /(?P<username>[^/\s]+)/ \{\s*\n\s*proxy_pass http://(?P=username)-code-server:8080/;.*?\n[ \t]*\}[ \t]*(?=\n)",
+    re.DOTALL
+)
+
+
+def insert_include(lines: list, include_line: str, http_context: bool):
+    if http_context:
+        # Before the server block, i.e. in the http context
+        for i, line in enumerate(lines):
+            if line.strip().startswith("server") and line.strip().endswith("{"):
+                lines.insert(i, f"{include_line}\n")
+                return
+    # Insert before the last closing '}' of the server block
+    for i in range(len(lines) - 1, -1, -1):
+        if lines[i].strip() == "}":
+            lines.insert(i, f"    {include_line}\n")
+            return
+
+
+def ensure_nginx_include():
+    """
+    Make nginx.conf include the generated route files. Runs once per process:
+    location blocks written by older versions are moved into the route
+    registry, then the route files are rendered for the configured strategy.
+
+    Returns:
+        bool: Whether nginx.conf or a route file changed, i.e. nginx has to be reloaded.
+    """
+    global _include_ready
+    if _include_ready:
+        return False
+
+    with _include_lock:
+        if _include_ready:
+            return False
+
+        strategy = get_routing_strategy()
+        os.makedirs(os.path.join(nginx_routes_dir, "http"), exist_ok=True)
+        include_line = f"include {nginx_routes_include_dir}/*.conf;"
+        http_include_line = f"include {nginx_routes_include_dir}/http/*.conf;"
+
         with open(nginx_conf_path, "r") as conf_file:
-            lines = conf_file.readlines()
-
-        new_location_block = f"""
-    location /{username}/ {{
-        proxy_pass http://{username}-code-server:8080/;
-        proxy_http_version 1.1;
-        proxy_set_header Upgrade $http_upgrade;
-        proxy_set_header Connection "Upgrade";
-        proxy_set_header Host $host;
-        proxy_set_header X-Real-IP $remote_addr;
-        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
-        proxy_set_header X-Forwarded-Proto $scheme;
-        proxy_redirect off;
-        add_header X-Frame-Options SAMEORIGIN;
-        add_header Content-Security-Policy "frame-ancestors 'self' *;";
-    }}
-"""
+            nginx_conf = conf_file.read()
+
+        legacy_usernames = [match.group('username') for match in LEGACY_LOCATION_PATTERN.finditer(nginx_conf)]
+        updated_conf = LEGACY_LOCATION_PATTERN.sub("", nginx_conf)
+        for username in legacy_usernames:
+            NginxRoute.objects.get_or_create(username=username)
+
+        lines = updated_conf.splitlines(keepends=True)
+        if include_line not in updated_conf:
+            insert_include(lines, include_line, http_context=False)
+        if strategy.http_context and http_include_line not in updated_conf:
+            insert_include(lines, http_include_line, http_context=True)
+        updated_conf = "".join(lines)
+
+        changed = render_nginx_routes()
 
-        # Insert before the last closing '}' of the server block
-        for i in range(len(lines) - 1, -1, -1):
-            if lines[i].strip() == "}":
-                lines.insert(i, new_location_block)
-                break
+        if updated_conf != nginx_conf:
+            changed = True
+            # nginx.conf is usually a bind-mounted file, so it is rewritten in place
+            with open(nginx_conf_path, "w") as conf_file:
+                conf_file.write(updated_conf)
+            logger.error(f"Nginx config now includes {nginx_routes_include_dir}, moved {len(legacy_usernames)} legacy route(s).")
 
-        # Write the updated content back to the file
-        with open(nginx_conf_path, "w") as conf_file:
-            conf_file.writelines(lines)
+        _include_ready = True
+        return changed
 
+
+def render_nginx_routes():
+    """
+    Rebuild the route files of the configured strategy from the registry and
+    drop every other generated file. The output only depends on the registry
+    and the strategy, so it is deterministic.
+
+    Returns:
+        bool: Whether any route file was written or removed.
+    """
+    with _render_lock, transaction.atomic():
+        lock_nginx_state()
+        usernames = sorted(NginxRoute.objects.values_list('username', flat=True))
+        files = get_routing_strategy().render(usernames)
+        changed = False
+        for relative_path, content in sorted(files.items()):
+            changed = write_if_changed(os.path.join(nginx_routes_dir, relative_path), content) or changed
+
+        for directory in (nginx_routes_dir, os.path.join(nginx_routes_dir, "http")):
+            for file_name in os.listdir(directory):
+                relative_path = os.path.relpath(os.path.join(directory, file_name), nginx_routes_dir)
+                if file_name.endswith(".conf") and relative_path not in files:
+                    os.remove(os.path.join(directory, file_name))
+                    changed = True
+    return changed
+
+
+def update_nginx_config(username: str):
+    """
+    Register the route of a new container and apply it with the configured
+    routing strategy. Never rewrites the config of other sessions.
+
+    Returns:
+        bool: Whether nginx has to be reloaded for the route to be live.
+    """
+    try:
+        include_changed = ensure_nginx_include()
+        strategy = get_routing_strategy()
+        NginxRoute.objects.update_or_create(username=username)
+        strategy.add_route(username)
         logger.error(f"Nginx config updated for user: {username}")
+        return strategy.reload_on_change or include_changed
 
     except Exception as e:
         raise Exception(f"Error updating Nginx config: {str(e)}")
 
+
+def remove_nginx_config(username: str):
+    """
+    Unregister the route of a removed container.
+
+    Returns:
+        bool: Whether nginx has to be reloaded for the removal to apply.
+    """
+    try:
+        include_changed = ensure_nginx_include()
+        strategy = get_routing_strategy()
+        NginxRoute.objects.filter(username=username).delete()
+        strategy.remove_route(username)
+        logger.error(f"Nginx config removed for user: {username}")
+        return strategy.reload_on_change or include_changed
+
+    except Exception as e:
+        raise Exception(f"Error removing Nginx config: {str(e)}")
+
 def restart_nginx():
     """
     Restart the Nginx service in Docker Swarm to apply new configuration.
     """
     try:
         # Use Docker Swarm service update to force a restart
-        nginx_service = docker_client.services.get("code_server_nginx")
+        nginx_service = docker_client.services.get(NGINX_SERVICE_NAME)
         nginx_service.update(force_update=True)
         logger.error("Nginx service restarted successfully in Docker Swarm.")
     except docker.errors.NotFound:
         raise Exception("Nginx service not found in Docker Swarm. Ensure it's deployed.")
     except Exception as e:
         raise Exception(f"Error restarting Nginx service: {str(e)}")
+
+
+def exec_nginx_reload():
+    """
+    Reload nginx in place with `nginx -s reload` in every running nginx
+    container on this daemon. Live websockets are kept, unlike a restart.
+
+    Returns:
+        int: Number of containers reloaded (0 if none run on this node).
+    """
+    containers = docker_client.containers.list(
+        filters={'label': f'com.docker.swarm.service.name={NGINX_SERVICE_NAME}'}
+    )
+    for container in containers:
+        exit_code, output = container.exec_run(["nginx", "-s", "reload"])
+        if exit_code != 0:
+            raise Exception(f"nginx reload failed in {container.name}: {output.decode(errors='replace')}")
+    return len(containers)
+
+
+def count_running_nginx_tasks():
+    """
+    Number of running tasks of the nginx service across the swarm.
+    """
+    tasks = docker_client.api.tasks(filters={'service': NGINX_SERVICE_NAME, 'desired-state': 'running'})
+    return sum(1 for task in tasks if task['Status']['State'] == 'running')
+
+
+def apply_nginx_reload():
+    """
+    Apply the current nginx config using the configured NGINX_RELOAD_MODE.
+    "exec" only reaches the nginx containers on this node, so it falls back
+    to a service restart when it reloaded fewer containers than the service
+    runs tasks, or when the in-place reload fails.
+    """
+    if nginx_reload_mode == "exec":
+        try:
+            reloaded = exec_nginx_reload()
+            running = count_running_nginx_tasks()
+            if reloaded > 0 and reloaded >= running:
+                logger.error("Nginx reloaded in place.")
+                return "exec"
+            logger.error(f"Reloaded {reloaded} of {running} nginx task(s) in place, restarting the service instead.")
+        except Exception as e:
+            logger.error(f"In-place nginx reload failed, restarting the service instead: {e}")
+    restart_nginx()
+    return "force_update"
+
+
+class NginxReloadCoalescer:
+    """
+    Batches reload requests. The first request opens a window of `debounce`
+    seconds; every request arriving inside it is served by the single reload
+    applied when the window closes.
+    """
+    def __init__(self, debounce: float, apply=apply_nginx_reload):
+        self.debounce = debounce
+        self._apply = apply
+        self._lock = threading.Lock()
+        self._timer = None
+        self._pending = 0
+        self._stats = {'requests': 0, 'reloads': 0, 'reloads_saved': 0, 'failures': 0, 'last_reload_at': None, 'last_mode': None}
+
+    def request(self):
+        with self._lock:
+            self._stats['requests'] += 1
+            self._pending += 1
+            if self._timer is None:
+                self._timer = threading.Timer(self.debounce, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            batch, self._pending = self._pending, 0
+        if batch == 0:
+            return
+
+        started_at = timezone.now()
+        try:
+            mode = self._apply()
+            with self._lock:
+                self._stats['reloads'] += 1
+                self._stats['reloads_saved'] += batch - 1
+                self._stats['last_reload_at'] = time.time()
+                self._stats['last_mode'] = mode
+        except Exception as e:
+            logger.error(f"Coalesced nginx reload of {batch} change(s) failed: {e}")
+            with self._lock:
+                self._stats['failures'] += 1
+            return
+
+        try:
+            record_nginx_reload(started_at)
+        except Exception as e:
+            logger.error(f"Recording the nginx reload time failed: {e}")
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        finally:
+            # The timer thread ends here, its database connection with it
+            connections.close_all()
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'pending': self._pending, 'debounce_seconds': self.debounce, 'mode': nginx_reload_mode}
+
+
+nginx_reload_coalescer = NginxReloadCoalescer(debounce=nginx_reload_debounce)
+
+
+def request_nginx_reload():
+    """
+    Ask for nginx to pick up config changes. Returns immediately; the
+    reload is applied once per debounce window.
+    """
+    if nginx_reload_debounce <= 0:
+        nginx_reload_coalescer.request()
+        nginx_reload_coalescer.flush()
+        return
+    nginx_reload_coalescer.request()
@@ -1,17 +1,94 @@
-from config import docker_client, accepted_containers_count, min_capacity_required, logger
+from concurrent.futures import ThreadPoolExecutor
+
+from django.utils import timezone
+
+from config import min_capacity_required, scale_down_workers, logger
 from docker_swarm.models import NodeInstance
+from docker_swarm.utils.docker_client import docker_client
+from docker_swarm.utils.labels import PREPULL_LABEL
+from docker_swarm.utils.session_profiles import get_task_reservation, get_node_slots
 import docker
 
+def get_api_client():
+    """
+    Return the low-level API client shared with `docker_client`, so every
+    caller reuses the same pooled connection to the manager socket.
+    """
+    return docker_client.api
+
+
+def is_session_task(task: dict):
+    """
+    False for the image pre-pull tasks, which run on every worker but hold no session.
+    """
+    labels = task.get('Spec', {}).get('ContainerSpec', {}).get('Labels') or {}
+    return PREPULL_LABEL not in labels
+
+
+def get_task_info(task: dict):
+    """
+    Summarize a swarm task the way it is reported in `node_detail_list`.
+    """
+    container_spec = task.get('Spec', {}).get('ContainerSpec', {})
+    mounts = container_spec.get('Mounts') or [{}]
+    cpu_reservation, memory_reservation = get_task_reservation(task)
+    return {
+        'id': task.get('ID'),
+        'name': mounts[0].get('Source', task.get('ServiceID', '')).split("/")[-1],
+        'image': container_spec.get('Image'),
+        'State': task['Status']['State'],
+        'cpu_reservation': cpu_reservation,
+        'memory_reservation': memory_reservation,
+    }
+
+
+def get_node_info(node_attrs: dict, task_info: list):
+    """
+    Build one `node_detail_list` entry from raw node attrs and its tasks.
+    Capacity is counted in slots, see `get_node_slots`.
+    """
+    total_slots, free_slots = get_node_slots(node_attrs, task_info)
+    return {
+        'id': node_attrs.get('ID'),
+        'availability': node_attrs['Spec']['Availability'],
+        'hostname': node_attrs['Description']['Hostname'],
+        'ip': node_attrs.get('Status', {}).get('Addr', 'N/A'),
+        'status': node_attrs.get('Status', {}).get('State', 'N/A'),
+        'tasks_count': len(task_info),
+        'total_slots': total_slots,
+        'free_slots': free_slots,
+        'tasks': task_info
+    }
+
+
+def group_tasks_by_node(tasks: list):
+    """
+    Group a flat list of swarm tasks into {node_id: [task_info, ...]}.
+    Tasks that are not yet assigned to a node and pre-pull tasks are skipped.
+    """
+    tasks_by_node = {}
+    for task in tasks:
+        node_id = task.get('NodeID')
+        if not node_id or not is_session_task(task):
+            continue
+
+        tasks_by_node.setdefault(node_id, []).append(get_task_info(task))
+    return tasks_by_node
+
+
 def get_docker_node_detail_info():
     """
     Fetch Docker Swarm worker node info and list of running tasks on each node.
+
+    The whole cluster is read with one `nodes.list()` and one `tasks()` call;
+    tasks are grouped by `NodeID` in memory instead of querying each node.
     """
     try:
-        api_client = docker.APIClient(base_url='unix://var/run/docker.sock')
+        api_client = get_api_client()
         node_detail_list = []
 
         try:
-            nodes = docker_client.nodes.list()
+            nodes = docker_client.nodes.list(filters={'role': 'worker'})
         except docker.errors.APIError as e:
             if "This node is not a swarm manager" in str(e):
                 msg = "Docker is not running in Swarm mode."
@@ -20,34 +97,15 @@ def get_docker_node_detail_info():
                 msg = f"Error checking Swarm status: {e}"
                 return {'status': 'failed', 'error': msg}
 
+        tasks_by_node = group_tasks_by_node(api_client.tasks(filters={'desired-state': ['running']}))
+
         for node in nodes:
             if node.attrs['Spec']['Role'] != 'worker':
                 continue  # Skip managers
 
-            node_id = node.attrs.get('ID')
-
-            tasks = api_client.tasks(filters={'node': node_id, 'desired-state': ['running']})
-            task_info = []
-            for task in tasks:
-                container_spec = task.get('Spec', {}).get('ContainerSpec', {})
-                # for key, value in task.items():
-                #     logger.error(key, value)
-                task_info.append({
-                    'id': task.get('ID'),
-                    'name': container_spec['Mounts'][0]['Source'].split("/")[-1],
-                    'image': container_spec.get('Image'),
-                    'State': task['Status']['State'],
-                })
-
-            node_detail_list.append({
-                'id': node.attrs.get('ID'),
-                'availability': node.attrs['Spec']['Availability'],
-                'hostname': node.attrs['Description']['Hostname'],
-                'ip': node.attrs.get('Status', {}).get('Addr', 'N/A'),
-                'status': node.attrs.get('Status', {}).get('State', 'N/A'),
-                'tasks_count': len(task_info),
-                'tasks': task_info
-            })
+            task_info = tasks_by_node.get(node.attrs.get('ID'), [])
+
+            node_detail_list.append(get_node_info(node.attrs, task_info))
 
         return {'status': 'success', 'data': node_detail_list}
 
@@ -61,22 +119,19 @@ def get_idle_nodes_to_remove(nodes: list):
     only if the rest of the cluster can handle their potential container load.
 
     Args:
-        nodes (list): List of node details with 'tasks_count'.
-        accepted_containers_count (int): Max containers per node.
+        nodes (list): List of node details with 'tasks_count', 'total_slots' and 'free_slots'.
         min_capacity_required (int): Minimum buffer space to preserve (per idle node removed).
 
     Returns:
         List of idle node IDs that can be safely removed.
     """
     try:
-        idle_nodes = [node for node in nodes if node['tasks_count'] == 0]
+        # Largest first, so the backup kept below is the node holding the most sessions
+        idle_nodes = sorted((node for node in nodes if node['tasks_count'] == 0), key=lambda node: -node['total_slots'])
         active_nodes = [node for node in nodes if node['tasks_count'] > 0]
 
         # Start with total available capacity from active nodes
-        total_available_capacity = sum(
-            max(0, accepted_containers_count - node['tasks_count'])
-            for node in active_nodes
-        )
+        total_available_capacity = sum(node['free_slots'] for node in active_nodes)
 
         removable_idle_nodes = []
 
@@ -84,7 +139,7 @@ def get_idle_nodes_to_remove(nodes: list):
         if not active_nodes and len(idle_nodes) > 1:
             idle_to_keep = idle_nodes[0]  # Keep first idle node
             logger.error(f"Keeping idle node '{idle_to_keep['id']}' as backup.")
-            total_available_capacity += accepted_containers_count
+            total_available_capacity += idle_to_keep['total_slots']
             idle_nodes = idle_nodes[1:]  # Others can be considered for removal
 
         # Check if we can safely remove idle nodes
@@ -99,33 +154,56 @@ def get_idle_nodes_to_remove(nodes: list):
     except Exception as error:
         return {'status': 'failed', 'error': str(error)}
 
-def remove_node_from_swarm(node_ids_list, force=True):
+def remove_node_from_swarm(node_ids_list, force=True, max_workers: int = scale_down_workers):
     """
-    Removes a node from Docker Swarm.
+    Removes nodes from Docker Swarm concurrently over the shared client.
+    Every node is attempted, one failure does not stop the others, and the
+    `NodeInstance` rows of removed nodes are marked in one update.
+    A node the swarm no longer knows counts as removed.
 
     Args:
-        node_id (str): Node ID or hostname.
+        node_ids_list (list): Node IDs.
         force (bool): Whether to force the removal.
 
     Returns:
-        dict: Status and optional error message.
+        dict: 'status' (success, partial or failed), 'removed' (node ids)
+        and 'data' with {'removed': bool, 'error': str or None} per node.
     """
-    for node_id in node_ids_list:
+    api_client = get_api_client()
+
+    def remove(node_id):
         try:
-            client = docker.from_env()
-            node = client.nodes.get(node_id)
-            node.remove(force=force)
+            api_client.remove_node(node_id, force=force)
             logger.error(f"Node '{node_id}' removed successfully.")
-            node_db = NodeInstance.objects.get(node_id=node_id)
-            node_db.status = "removed"
-            node_db.save()
-
+            return node_id, None
         except docker.errors.NotFound:
-            return {'status': 'failed', 'error': f"Node '{node_id}' not found."}
+            logger.error(f"Node '{node_id}' already gone from the swarm.")
+            return node_id, None
         except docker.errors.APIError as e:
-            return {'status': 'failed', 'error': f"Docker API error: {e}"}
+            return node_id, f"Docker API error: {e}"
         except docker.errors.DockerException as e:
-            return {'status': 'failed', 'error': f"Docker error: {e}"}
+            return node_id, f"Docker error: {e}"
         except Exception as e:
-            return {'status': 'failed', 'error': f"Unexpected error: {e}"}
-    return {'status': 'success'}
+            return node_id, f"Unexpected error: {e}"
+
+    if not node_ids_list:
+        return {'status': 'success', 'removed': [], 'data': {}}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(node_ids_list)))) as pool:
+        outcomes = dict(pool.map(remove, node_ids_list))
+
+    removed = [node_id for node_id, error in outcomes.items() if error is None]
+    if removed:
+        NodeInstance.objects.filter(node_id__in=removed).update(status='removed', updated_at=timezone.now())
+
+    if len(removed) == len(outcomes):
+        status = 'success'
+    elif removed:
+        status = 'partial'
+    else:
+        status = 'failed'
+    return {
+        'status': status,
+        'removed': removed,
+        'data': {node_id: {'removed': error is None, 'error': error} for node_id, error in outcomes.items()},
+    }
@@ -0,0 +1,30 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections
+
+from config import async_offload_workers
+
+# Blocking Docker and database calls of the async views run here. The pool
+# is bounded, so concurrent polls queue for a thread instead of each
+# getting one, and at most `async_offload_workers` database connections
+# are open for them.
+offload_executor = ThreadPoolExecutor(max_workers=async_offload_workers, thread_name_prefix="async-offload")
+
+
+def _call(func, args, kwargs):
+    # Pool threads outlive requests, drop their connections like a request would
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Await `func(*args, **kwargs)` run on the offload pool.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(offload_executor, functools.partial(_call, func, args, kwargs))
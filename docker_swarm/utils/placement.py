@@ -0,0 +1,114 @@
+import threading
+import time
+
+from config import placement_strategy, placement_reservation_ttl, logger
+from docker_swarm.utils.swarm_mirror import swarm_mirror
+from docker_swarm.utils.warm_pool import warm_pool, WARM_CONSTRAINT
+
+PLACEMENT_STRATEGIES = ('pack', 'spread', 'swarm')
+
+
+class PlacementEngine:
+    """
+    Chooses the worker for each new session instead of leaving it to the
+    swarm scheduler, which spreads tasks regardless of how full nodes are.
+
+    "pack" fills the fullest node that still has room, so load
+    concentrates and whole nodes go idle for scale-down. "spread" picks
+    the emptiest node. "swarm" keeps the scheduler's own choice. Warm
+    nodes win over cold ones under either strategy.
+
+    A placement is held as a reservation until the session's task shows up
+    on the node (or `reservation_ttl` passes), so concurrent creations
+    see each other's choices before the swarm state catches up.
+    """
+    def __init__(self, strategy: str = placement_strategy, reservation_ttl: float = placement_reservation_ttl):
+        if strategy not in PLACEMENT_STRATEGIES:
+            raise Exception(f"Unknown PLACEMENT_STRATEGY '{strategy}', expected one of {list(PLACEMENT_STRATEGIES)}.")
+        self.strategy = strategy
+        self.reservation_ttl = reservation_ttl
+        self._lock = threading.Lock()
+        self._reservations = {}  # username -> (node_id, slots, expires_at)
+        self._stats = {'pinned': 0, 'unpinned': 0, 'warm': 0}
+
+    def _live_reservations(self, nodes):
+        """
+        Reserved slots per node, dropping reservations whose task is already
+        counted in `nodes` or that expired. Callers hold the lock.
+        """
+        placed = {(node['id'], task['name']) for node in nodes for task in node['tasks']}
+        now = time.monotonic()
+        for username, (node_id, _, expires_at) in list(self._reservations.items()):
+            if expires_at <= now or (node_id, username) in placed:
+                del self._reservations[username]
+
+        reserved = {}
+        for node_id, slots, _ in self._reservations.values():
+            reserved[node_id] = reserved.get(node_id, 0) + slots
+        return reserved
+
+    def select_node(self, username: str, nodes: list, warm_nodes: set = frozenset(), slots: int = 1):
+        """
+        Pick and reserve a node for a session of `username` taking `slots`
+        capacity slots, from `node_detail_list` entries. Returns None when
+        no schedulable node has room for it.
+        """
+        with self._lock:
+            reserved = self._live_reservations(nodes)
+            candidates = []
+            for node in nodes:
+                if node['status'] != 'ready' or node['availability'] != 'active':
+                    continue
+                free = node['free_slots'] - reserved.get(node['id'], 0)
+                if free >= slots:
+                    candidates.append((node['id'] in warm_nodes, -free, node['id']))
+            if not candidates:
+                return None
+
+            if self.strategy == 'pack':
+                _, _, node_id = max(candidates, key=lambda candidate: (candidate[0], candidate[1], candidate[2]))
+            else:
+                _, _, node_id = min(candidates, key=lambda candidate: (not candidate[0], candidate[1], candidate[2]))
+            self._reservations[username] = (node_id, slots, time.monotonic() + self.reservation_ttl)
+            return node_id
+
+    def release(self, username: str):
+        with self._lock:
+            self._reservations.pop(username, None)
+
+    def get_placement_constraints(self, username: str, slots: int = 1):
+        """
+        Placement constraints for a new session of `username` taking
+        `slots` capacity slots, pinned with
+        `node.id` to the chosen node. Falls back to the warm pool's
+        constraints when nothing is chosen.
+        """
+        if self.strategy == 'swarm':
+            return warm_pool.get_placement_constraints()
+
+        response = swarm_mirror.get_node_detail_info()
+        node_id = None
+        if response['status'] == 'success':
+            warm_nodes = warm_pool.warm_nodes()
+            node_id = self.select_node(username, response['data'], warm_nodes, slots)
+        else:
+            logger.error(f"Placement: could not read nodes, leaving it to swarm: {response.get('error')}")
+
+        if node_id is None:
+            self._stats['unpinned'] += 1
+            return warm_pool.get_placement_constraints()
+
+        self._stats['pinned'] += 1
+        constraints = ["node.role == worker", f"node.id == {node_id}"]
+        if node_id in warm_nodes:
+            # Redundant with the pin, recorded so reconcile can tell warm starts apart
+            constraints.append(WARM_CONSTRAINT)
+            self._stats['warm'] += 1
+        return constraints
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'strategy': self.strategy, 'reservations': len(self._reservations)}
+
+
+placement_engine = PlacementEngine()
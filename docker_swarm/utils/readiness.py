@@ -0,0 +1,223 @@
+import asyncio
+import threading
+
+from django.db import close_old_connections
+
+from config import readiness_poll_interval, logger
+from docker_swarm.models import ProvisioningJob, NginxRoute, CodeSpace
+from docker_swarm.utils.nginx_utils import get_routing_strategy, get_last_nginx_reload
+from docker_swarm.utils.node_utils import get_api_client
+
+# Readiness of a session, in order. "failed" and "routable" end a stream.
+READINESS_STATES = ('queued', 'scaling', 'scheduled', 'pulling', 'running', 'routable')
+TERMINAL_STATES = ('routable', 'failed')
+
+JOB_READINESS = {'queued': 'queued', 'scaling': 'scaling', 'creating': 'scheduled', 'routing': 'scheduled', 'completed': 'scheduled'}
+TASK_READINESS = {
+    'new': 'scheduled', 'pending': 'scheduled', 'allocated': 'scheduled', 'assigned': 'scheduled', 'accepted': 'scheduled',
+    'preparing': 'pulling', 'ready': 'pulling', 'starting': 'pulling',
+    'running': 'running',
+}
+
+
+def get_latest_tasks(api_client, service_ids: list):
+    """
+    The newest task of each service, {service_id: task}, from one tasks() call.
+    """
+    if not service_ids:
+        return {}
+    latest = {}
+    for task in api_client.tasks(filters={'service': service_ids}):
+        service_id = task.get('ServiceID')
+        if service_id not in latest or task.get('CreatedAt', '') > latest[service_id].get('CreatedAt', ''):
+            latest[service_id] = task
+    return latest
+
+
+def get_readiness(usernames: list, api_client=None):
+    """
+    Readiness of several sessions from four queries (jobs, code-spaces,
+    routes, last nginx reload) and one tasks() call.
+
+    Returns:
+        dict: {username: {'state', 'task_state', 'message'}}, with state
+        None for a user that has neither a job nor a service.
+    """
+    api_client = api_client or get_api_client()
+    jobs = {}
+    for job in ProvisioningJob.objects.filter(username__in=usernames).order_by('-created_at'):
+        jobs.setdefault(job.username, job)
+    service_ids = dict(CodeSpace.objects.filter(username__in=usernames).exclude(service_id=None).values_list('username', 'service_id'))
+    routes = dict(NginxRoute.objects.filter(username__in=usernames).values_list('username', 'updated_at'))
+    tasks = get_latest_tasks(api_client, list(service_ids.values()))
+
+    reload_needed = get_routing_strategy().reload_on_change
+    # Shared by all processes, the reload may have been applied by another one
+    last_reload_at = get_last_nginx_reload() if reload_needed else None
+
+    readiness = {}
+    for username in usernames:
+        job = jobs.get(username)
+        task = tasks.get(service_ids.get(username))
+        task_state = task['Status']['State'] if task else None
+        message = (task['Status'].get('Err') or task['Status'].get('Message', '')) if task else ''
+
+        if job and job.state == 'failed':
+            state, message = 'failed', job.message
+        elif task_state in TASK_READINESS:
+            state = TASK_READINESS[task_state]
+        elif task:
+            # failed, rejected, ... : swarm retries with a new task
+            state = 'scheduled'
+        elif job:
+            state = JOB_READINESS.get(job.state)
+        else:
+            state = None
+
+        # A running session is routable once nginx serves its route
+        if state == 'running' and username in routes:
+            if not reload_needed or (last_reload_at and last_reload_at >= routes[username]):
+                state = 'routable'
+
+        readiness[username] = {'state': state, 'task_state': task_state, 'message': message}
+    return readiness
+
+
+class ReadinessWatcher:
+    """
+    Tracks the readiness of the sessions clients are waiting on.
+
+    A single thread polls every `interval` seconds while anything is
+    watched, with one `get_readiness` call for all watched users, so the
+    Docker load does not grow with the number of clients. Waiters are woken
+    on a change: threads through a Condition, coroutines through their
+    event loop. A failed poll is kept as `get_error()` until the next one
+    succeeds and wakes the waiters that have no readiness yet, so they can
+    answer with the error instead of "not found".
+    """
+    def __init__(self, api_client=None, interval: float = readiness_poll_interval):
+        self._api_client = api_client
+        self.interval = interval
+
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._watch_counts = {}     # username -> number of subscribers
+        self._states = {}           # username -> latest readiness
+        self._async_waiters = {}    # username -> set of (loop, asyncio.Event)
+        self._error = None          # message of the last poll, if it failed
+
+        self._wake = threading.Event()
+        self._thread = None
+        self._stats = {'polls': 0, 'changes': 0, 'errors': 0}
+
+    def watch(self, username: str):
+        with self._lock:
+            self._watch_counts[username] = self._watch_counts.get(username, 0) + 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run, name="readiness-watcher", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def unwatch(self, username: str):
+        with self._lock:
+            self._watch_counts[username] -= 1
+            if self._watch_counts[username] <= 0:
+                del self._watch_counts[username]
+                self._states.pop(username, None)
+
+    def get(self, username: str):
+        with self._lock:
+            return self._states.get(username)
+
+    def get_error(self):
+        with self._lock:
+            return self._error
+
+    def _is_news(self, username: str, known: dict):
+        # The caller holds the lock
+        return self._states.get(username) != known or (username not in self._states and self._error is not None)
+
+    def wait(self, username: str, known: dict, timeout: float):
+        """
+        Block until the readiness of `username` differs from `known`.
+        Returns the latest readiness, unchanged on timeout.
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self._is_news(username, known), timeout)
+            return self._states.get(username)
+
+    async def async_wait(self, username: str, known: dict, timeout: float):
+        """
+        `wait` for coroutines, without holding a thread.
+        """
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        waiter = (loop, event)
+        with self._lock:
+            if self._is_news(username, known):
+                return self._states.get(username)
+            self._async_waiters.setdefault(username, set()).add(waiter)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                self._async_waiters.get(username, set()).discard(waiter)
+        return self.get(username)
+
+    def poll(self):
+        with self._lock:
+            usernames = list(self._watch_counts)
+        if not usernames:
+            return
+        try:
+            readiness = get_readiness(usernames, self._api_client)
+        except Exception as e:
+            logger.error(f"Readiness watcher: poll failed: {e}")
+            with self._lock:
+                self._stats['errors'] += 1
+                self._error = str(e)
+                for username in [username for username in self._async_waiters if username not in self._states]:
+                    self._wake_async_waiters(username)
+                self._changed.notify_all()
+            return
+
+        with self._lock:
+            self._stats['polls'] += 1
+            self._error = None
+            for username, current in readiness.items():
+                if username not in self._watch_counts or self._states.get(username) == current:
+                    continue
+                self._states[username] = current
+                self._stats['changes'] += 1
+                self._wake_async_waiters(username)
+            self._changed.notify_all()
+
+    def _wake_async_waiters(self, username: str):
+        # The caller holds the lock
+        for loop, event in self._async_waiters.pop(username, set()):
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(event.set)
+
+    def run(self):
+        while True:
+            with self._lock:
+                watching = bool(self._watch_counts)
+            if watching:
+                try:
+                    close_old_connections()
+                    self.poll()
+                except Exception as e:
+                    logger.error(f"Readiness watcher: {e}")
+                self._wake.wait(self.interval)
+            else:
+                self._wake.wait()
+            self._wake.clear()
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'watched': len(self._watch_counts)}
+
+
+readiness_watcher = ReadinessWatcher()
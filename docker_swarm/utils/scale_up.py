@@ -1,51 +1,92 @@
-import boto3
-from docker_swarm.models import ScalingState, NodeInstance
+from docker_swarm.models import ScalingState, NodeInstance, CapacityReservation
 from django.db import transaction
-from docker_swarm.utils.node_utils import get_docker_node_detail_info
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from docker_swarm.utils.swarm_cache import swarm_cache, get_cached_node_detail_info, NODES_KEY
+from docker_swarm.utils.swarm_mirror import swarm_mirror
+from docker_swarm.utils.cloud_provider import get_cloud_provider
+from docker_swarm.utils.scaling_policy import get_scaling_policy
+from docker_swarm.utils.session_profiles import get_profile_slots, get_resource_slots
 from config import *
+from datetime import timedelta
+import math
 import time
 
 DEFAULT_KEY = 'global'
 
 def get_pending_capacity():
-    try:
-        obj, _ = ScalingState.objects.get_or_create(key=DEFAULT_KEY)
-        return obj.pending_capacity
-    except:
-        return 0
+    obj, _ = ScalingState.objects.get_or_create(key=DEFAULT_KEY)
+    return obj.pending_capacity
 
 @transaction.atomic
 def set_pending_capacity(value):
-    obj, _ = ScalingState.objects.get_or_create(key=DEFAULT_KEY)
-    obj.pending_capacity = value
-    obj.save()
+    ScalingState.objects.get_or_create(key=DEFAULT_KEY)
+    ScalingState.objects.filter(key=DEFAULT_KEY).update(pending_capacity=value, updated_at=timezone.now())
 
 
-def lunch_template(max_count: int = 1):
-    # Initialize EC2 client
-    ec2 = boto3.client('ec2', aws_access_key_id=access_key, aws_secret_access_key=secret_access_key, region_name=region)
-
-    # Launch an instance using the launch template
-    response = ec2.run_instances(
-        LaunchTemplate={
-            'LaunchTemplateId': launch_template_id,
-            'Version': '$Latest'
-        },
-        MinCount=1,
-        MaxCount=max_count
-    )
+def lock_scaling_state():
+    """
+    Lock the ledger row until the surrounding transaction ends, so capacity
+    decisions of concurrent requests and processes run one at a time.
+    """
+    ScalingState.objects.get_or_create(key=DEFAULT_KEY)
+    return ScalingState.objects.select_for_update().get(key=DEFAULT_KEY)
+
+
+def get_expected_capacity(instance_type: str):
+    """
+    Slots a new instance of `instance_type` should hold: from the CPUs and
+    memory the provider reports for the type, else as measured on the
+    latest joined node of that type, else ACCEPTED_CONTAINERS_COUNT.
+    """
+    resources = get_cloud_provider().get_instance_resources(instance_type)
+    if resources:
+        slots = get_resource_slots(resources['nano_cpus'], resources['memory_bytes'])
+        if slots:
+            return slots
+    measured = NodeInstance.objects.filter(instance_type=instance_type, status='active').exclude(capacity=None) \
+        .order_by('-updated_at').values_list('capacity', flat=True).first()
+    return measured or accepted_containers_count
+
 
-    instances = response['Instances']
+def get_launch_capacity():
+    """
+    Slots the next launched node should hold: the expected capacity of the
+    launch template's instance type, else that of the latest launch,
+    else ACCEPTED_CONTAINERS_COUNT.
+    """
+    instance_type = get_cloud_provider().get_launch_instance_type()
+    if instance_type:
+        return get_expected_capacity(instance_type)
+    capacity = NodeInstance.objects.exclude(capacity=None).order_by('-created_at').values_list('capacity', flat=True).first()
+    return capacity or accepted_containers_count
+
+
+def lunch_template(max_count: int = 1):
+    # Launch up to max_count instances in one call
+    instances = get_cloud_provider().launch_instances(max_count)
+    capacities = {
+        instance_type: get_expected_capacity(instance_type)
+        for instance_type in {instance.get('instance_type', '') for instance in instances}
+    }
 
     with transaction.atomic():
-        for instance in instances:
-            instance_id = instance['InstanceId']
-            ip_address = instance['PrivateIpAddress']
-            NodeInstance.objects.create(instance_id=instance_id, private_ip=ip_address)
+        NodeInstance.objects.bulk_create([
+            NodeInstance(
+                instance_id=instance['instance_id'], private_ip=instance['private_ip'],
+                instance_type=instance.get('instance_type', ''), capacity=capacities[instance.get('instance_type', '')]
+            )
+            for instance in instances
+        ])
 
-        total_pending_capacity = get_pending_capacity() + (accepted_containers_count * len(instances))
-        set_pending_capacity(total_pending_capacity)
+        ScalingState.objects.get_or_create(key=DEFAULT_KEY)
+        ScalingState.objects.filter(key=DEFAULT_KEY).update(
+            pending_capacity=F('pending_capacity') + sum(capacities[instance.get('instance_type', '')] for instance in instances),
+            updated_at=timezone.now()
+        )
 
+    swarm_cache.invalidate(NODES_KEY)
     return None
 
 
@@ -54,26 +95,77 @@ def reconcile_swarm_state(node_data):
     Matches EC2 instances to Swarm nodes and resets pending capacity
     when provisioning is complete.
     """
-    matched_ips = {node['ip']: node['id'] for node in node_data}
+    nodes_by_ip = {node['ip']: node for node in node_data}
+
+    with transaction.atomic():
+        lock_scaling_state()
+        return _reconcile_swarm_state(nodes_by_ip)
+
+
+def _reconcile_swarm_state(nodes_by_ip):
+    """
+    Set-based reconcile, the caller holds the ledger lock. Instances whose
+    IP joined the swarm are read with one query and activated with one
+    `bulk_update`, with the capacity measured on the node; instances marked
+    failed are matched too, in case a slow boot joins after all. Those
+    provisioning for longer than NODE_PROVISIONING_TIMEOUT are failed in
+    one update and every failed instance is terminated once the ledger
+    commits. One aggregate stores the expected capacity of the rest as
+    pending.
+    """
+    now = timezone.now()
+    stuck_before = now - timedelta(seconds=node_provisioning_timeout)
 
-    for node_instance in NodeInstance.objects.filter(status='provisioning'):
-        if node_instance.private_ip in matched_ips:
-            node_instance.node_id = matched_ips[node_instance.private_ip]
-            node_instance.status = 'active'
-            node_instance.save()
+    joined = list(NodeInstance.objects.filter(status__in=['provisioning', 'failed'], private_ip__in=list(nodes_by_ip)))
+    for node_instance in joined:
+        node = nodes_by_ip[node_instance.private_ip]
+        node_instance.node_id = node['id']
+        node_instance.capacity = node['total_slots']
+        node_instance.status = 'active'
+        node_instance.updated_at = now
+    if joined:
+        NodeInstance.objects.bulk_update(joined, ['node_id', 'capacity', 'status', 'updated_at'])
 
-    if NodeInstance.objects.filter(status='provisioning').exists():
-        count = NodeInstance.objects.filter(status='provisioning').count()
-        set_pending_capacity(count*accepted_containers_count)
-    else:
-        set_pending_capacity(0)
+    timed_out = NodeInstance.objects.filter(status='provisioning', created_at__lt=stuck_before).update(status='failed', updated_at=now)
+    if timed_out:
+        logger.error(f"Marked {timed_out} instance(s) failed after {node_provisioning_timeout}s without joining the swarm.")
+    failed = list(NodeInstance.objects.filter(status='failed').values_list('instance_id', flat=True))
+    if failed:
+        transaction.on_commit(lambda: terminate_failed_instances(failed))
 
-    return "Reconciled nodes"
+    pending = NodeInstance.objects.filter(status='provisioning').aggregate(
+        count=Count('pk'), capacity=Sum(Coalesce('capacity', accepted_containers_count))
+    )
+    ScalingState.objects.filter(key=DEFAULT_KEY).update(pending_capacity=pending['capacity'] or 0, updated_at=now)
+    return f"Reconciled nodes: {len(joined)} joined, {timed_out} failed, {pending['count']} pending"
+
+
+def terminate_failed_instances(instance_ids: list):
+    """
+    Terminate instances that never joined the swarm and drop their rows.
+    Rows the provider did not terminate stay failed, so a late join still
+    matches them and the next reconcile tries again.
+    """
+    try:
+        terminated = get_cloud_provider().terminate_instances(instance_ids)
+    except Exception as e:
+        logger.error(f"Could not terminate failed instance(s) {instance_ids}: {e}")
+        return []
+    NodeInstance.objects.filter(instance_id__in=terminated, status='failed').delete()
+    logger.error(f"Terminated {len(terminated)} failed instance(s): {terminated}")
+    return terminated
 
 
 def get_total_available_capacity():
+    # Fast path: O(1) read from the event-driven mirror
+    if swarm_mirror.is_synced():
+        total_available_capacity = swarm_mirror.available_capacity()
+        if get_pending_capacity() > 0 and swarm_mirror.node_count() > 0:
+            logger.error(reconcile_swarm_state(swarm_mirror.node_detail_list()))
+        return total_available_capacity
+
     # Step 1: Get node info
-    nodes_response = get_docker_node_detail_info()
+    nodes_response = get_cached_node_detail_info()
 
     if nodes_response['status'] == 'failed':
         return f"❌ Failed to retrieve node information: {nodes_response.get('error', 'Unknown error')}"
@@ -81,10 +173,7 @@ def get_total_available_capacity():
     nodes = nodes_response['data']
 
     # Step 2: Calculate current + pending capacity
-    total_available_capacity = sum(
-        max(0, accepted_containers_count - node['tasks_count'])
-        for node in nodes
-    )
+    total_available_capacity = sum(node['free_slots'] for node in nodes if node['availability'] == 'active')
 
     pending_capacity = get_pending_capacity()
     if pending_capacity > 0 and nodes != []:
@@ -93,41 +182,146 @@ def get_total_available_capacity():
     return total_available_capacity
 
 
-def check_and_scale_up():
+def get_node_snapshot():
+    """
+    Worker nodes with their tasks, from the mirror when it is in sync.
+    """
+    if swarm_mirror.is_synced():
+        return swarm_mirror.node_detail_list()
+    nodes_response = get_cached_node_detail_info()
+    if nodes_response['status'] == 'failed':
+        raise Exception(f"Failed to retrieve node information: {nodes_response.get('error', 'Unknown error')}")
+    return nodes_response['data']
+
+
+def get_reserved_capacity(nodes: list):
+    """
+    Slots promised to requests whose session is not on a node yet.
+    Reservations whose session now shows up in `nodes`, or that are older
+    than CAPACITY_RESERVATION_TTL, are consumed (deleted) on the way.
+    """
+    placed = {task['name'] for node in nodes for task in node['tasks']}
+    expired_before = timezone.now() - timedelta(seconds=capacity_reservation_ttl)
+    consumed, reserved = [], 0
+    for pk, owner, slots, created_at in CapacityReservation.objects.values_list('pk', 'owner', 'slots', 'created_at'):
+        if owner in placed or created_at < expired_before:
+            consumed.append(pk)
+        else:
+            reserved += slots
+    if consumed:
+        CapacityReservation.objects.filter(pk__in=consumed).delete()
+    return reserved
+
+
+def release_capacity(owners: list):
+    """
+    Drop the reservations of requests that will never be placed.
+    """
+    CapacityReservation.objects.filter(owner__in=owners).delete()
+
+
+def reserve_capacity(owners: list, slots: int = 1, policy=None, get_nodes=None):
     """
-    Checks if the Swarm has enough free capacity for new containers.
-    If not, adds a new node to the Swarm and updates pending capacity in DB.
+    Reserve `slots` capacity slots per owner and scale up for them in a
+    single step. `policy` and `get_nodes` default to the active scaling
+    policy and `get_node_snapshot`; the simulator passes its own.
+
+    The decision runs with the ledger row locked: the node snapshot, the
+    outstanding reservations of other requests and the pending capacity
+    are read, the launch is made and the new reservations are written
+    before the next request may look. Concurrent requests therefore never
+    all see the same free slots and each launch a node.
 
     Returns:
         str: Status message.
     """
-    total_available_capacity = get_total_available_capacity()
-    pending_capacity = get_pending_capacity()
-    effective_capacity = total_available_capacity + pending_capacity
+    policy = policy or get_scaling_policy()
+    policy.record_requests(len(owners))
+    requested = len(owners) * slots
 
-    logger.error(f"Available: {total_available_capacity} | Pending: {pending_capacity} | Effective: {effective_capacity} / Required: {min_capacity_required}")
+    with transaction.atomic():
+        state = lock_scaling_state()
+        nodes = get_nodes() if get_nodes else get_node_snapshot()
+        if state.pending_capacity > 0 and nodes:
+            logger.error(_reconcile_swarm_state({node['ip']: node for node in nodes}))
+            state.refresh_from_db()
 
-    # Step 3: Decide whether to scale
-    if effective_capacity >= min_capacity_required:
-        if total_available_capacity == 0:
-            while True:
-                total_available_capacity = get_total_available_capacity()
-                if total_available_capacity > 0:
-                    break
-                time.sleep(15)
-        return "✅ Sufficient capacity. No scaling needed."
+        free_capacity = sum(node['free_slots'] for node in nodes if node['availability'] == 'active')
+        total_available_capacity = free_capacity - get_reserved_capacity(nodes)
+        pending_capacity = state.pending_capacity
+        # Nodes are sized by what the launch template starts, not one global count
+        launch_capacity = get_launch_capacity()
+        policy.capacity_per_node = launch_capacity
+        deficit = requested + min_capacity_required - (total_available_capacity + pending_capacity)
+
+        logger.error(f"Available: {total_available_capacity} | Pending: {pending_capacity} | Requested: {requested} | Deficit: {max(0, deficit)}")
+
+        # The policy decides for a single slot, larger requests are always
+        # covered in full and the policy may add headroom on top
+        if requested == 1:
+            node_count = policy.plan(total_available_capacity, pending_capacity)
+        else:
+            node_count = max(
+                math.ceil(max(0, deficit) / launch_capacity),
+                policy.plan(total_available_capacity - requested, pending_capacity),
+            )
+
+        CapacityReservation.objects.filter(owner__in=owners).delete()
+        CapacityReservation.objects.bulk_create([CapacityReservation(owner=owner, slots=slots) for owner in owners])
+
+        if node_count == 0:
+            return "✅ Sufficient capacity. No scaling needed."
+
+        # Step 4: Trigger scaling logic, still under the lock
+        try:
+            lunch_template(max_count=node_count)
+            state.refresh_from_db()
+            return f"⚠️ Scaling triggered for {node_count} node(s) by the '{policy.name}' policy. Pending capacity now set to {state.pending_capacity}"
+        except Exception as e:
+            return f"❌ Scaling failed: {str(e)}"
 
-    # Step 4: Trigger scaling logic
-    try:
-        lunch_template()
 
-        if total_available_capacity == 0:
-            while True:
-                total_available_capacity = get_total_available_capacity()
-                if total_available_capacity > 0:
-                    break
-                time.sleep(15)
+def check_and_scale_up(owner: str, profile: str = None):
+    """
+    Checks if the Swarm has enough free capacity for a new container of
+    `owner` with the resource `profile` and reserves its slots. If short,
+    adds as many nodes as the active scaling policy asks for. Never waits
+    for the new nodes, see `wait_for_capacity`.
+
+    Returns:
+        str: Status message.
+    """
+    return reserve_capacity([owner], get_profile_slots(profile))
 
-        return f"⚠️ Scaling triggered. Pending capacity now set to {pending_capacity + accepted_containers_count}"
+
+def ensure_capacity_for(owners: list, profile: str = None):
+    """
+    Scale up once for a batch of new sessions of the resource `profile`: one locked capacity check
+    and, if short, one launch covering the whole deficit plus the usual
+    buffer. Never waits for the new nodes.
+
+    Returns:
+        str: Status message.
+    """
+    try:
+        return reserve_capacity(owners, get_profile_slots(profile))
     except Exception as e:
-        return f"❌ Scaling failed: {str(e)}"
+        return f"❌ {e}"
+
+
+def wait_for_capacity(timeout: float = capacity_wait_timeout, poll_interval: float = capacity_poll_interval, slots: int = 1):
+    """
+    Block until at least `slots` capacity slots are free on the worker nodes.
+    Only called from provisioning workers, never from a request thread.
+
+    Returns:
+        bool: False if no slot became free within `timeout` seconds.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        total_available_capacity = get_total_available_capacity()
+        if isinstance(total_available_capacity, int) and total_available_capacity >= slots:
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(poll_interval)
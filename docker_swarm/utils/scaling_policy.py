@@ -0,0 +1,195 @@
+import math
+import threading
+import time
+from collections import deque
+
+from config import (
+    accepted_containers_count, min_capacity_required, scaling_policy_name, scaling_rate_windows,
+    scaling_boot_latency, scaling_batch_interval, scaling_max_nodes_per_launch, logger
+)
+from docker_swarm.models import ScalingState
+
+DEFAULT_KEY = 'global'
+
+
+class ScalingPolicy:
+    """
+    Decides how many nodes to launch when sessions are requested.
+    `record_requests` is called for every requested session, then `plan`
+    gets the free and pending slot counts and returns a node count.
+    """
+    name = None
+
+    def __init__(self, capacity_per_node: int = accepted_containers_count, clock=time.monotonic):
+        self.capacity_per_node = capacity_per_node
+        self.clock = clock
+
+    def record_requests(self, count: int = 1):
+        pass
+
+    def plan(self, total_available_capacity: int, pending_capacity: int):
+        raise NotImplementedError
+
+    def get_params(self):
+        return {}
+
+    def stats(self):
+        return {'name': self.name, 'params': self.get_params()}
+
+
+class ThresholdPolicy(ScalingPolicy):
+    """
+    Launch one node whenever free plus pending capacity drops below
+    `min_capacity`. The original behaviour.
+    """
+    name = "threshold"
+
+    def __init__(self, min_capacity: int = min_capacity_required, **kwargs):
+        super().__init__(**kwargs)
+        self.min_capacity = int(min_capacity)
+
+    def plan(self, total_available_capacity: int, pending_capacity: int):
+        if total_available_capacity + pending_capacity >= self.min_capacity:
+            return 0
+        return 1
+
+    def get_params(self):
+        return {'min_capacity': self.min_capacity}
+
+
+class RatePolicy(ScalingPolicy):
+    """
+    Scale for the projected demand over one node boot. The request rate is
+    measured over sliding windows and the highest one is used, so a spike
+    shows up in the short window while the long one keeps the estimate
+    from collapsing between bursts. Once free plus pending capacity falls
+    short of `rate * boot_latency` sessions plus `min_capacity` spare
+    slots, one launch covers the shortfall and the `rate * batch_interval`
+    sessions expected next, so a burst is served by a few batched launches
+    instead of a node per request.
+
+    Rates are per process; with several workers each sees its own share.
+    """
+    name = "rate"
+
+    def __init__(self, windows: list = scaling_rate_windows, boot_latency: float = scaling_boot_latency,
+                 min_capacity: int = min_capacity_required, max_nodes_per_launch: int = scaling_max_nodes_per_launch,
+                 batch_interval: float = scaling_batch_interval, **kwargs):
+        super().__init__(**kwargs)
+        self.windows = sorted(int(window) for window in windows)
+        if not self.windows or self.windows[0] <= 0:
+            raise ValueError("windows must be a non-empty list of positive seconds.")
+        self.boot_latency = float(boot_latency)
+        self.min_capacity = int(min_capacity)
+        self.max_nodes_per_launch = int(max_nodes_per_launch)
+        self.batch_interval = float(batch_interval)
+        if self.batch_interval < 0:
+            raise ValueError("batch_interval must not be negative.")
+        self._lock = threading.Lock()
+        self._requests = deque()  # (timestamp, count), oldest first
+
+    def record_requests(self, count: int = 1):
+        with self._lock:
+            self._requests.append((self.clock(), count))
+
+    def current_rate(self):
+        """
+        Highest session-request rate (per second) over the configured windows.
+        """
+        now = self.clock()
+        with self._lock:
+            while self._requests and self._requests[0][0] <= now - self.windows[-1]:
+                self._requests.popleft()
+            counts = [0] * len(self.windows)
+            for timestamp, count in self._requests:
+                for i, window in enumerate(self.windows):
+                    if timestamp > now - window:
+                        counts[i] += count
+        return max(count / window for count, window in zip(counts, self.windows))
+
+    def plan(self, total_available_capacity: int, pending_capacity: int):
+        rate = self.current_rate()
+        projected_demand = math.ceil(rate * self.boot_latency) + self.min_capacity
+        deficit = projected_demand - (total_available_capacity + pending_capacity)
+        if deficit <= 0:
+            return 0
+        batch = deficit + math.ceil(rate * self.batch_interval)
+        return min(self.max_nodes_per_launch, math.ceil(batch / self.capacity_per_node))
+
+    def get_params(self):
+        return {
+            'windows': self.windows,
+            'boot_latency': self.boot_latency,
+            'min_capacity': self.min_capacity,
+            'max_nodes_per_launch': self.max_nodes_per_launch,
+            'batch_interval': self.batch_interval,
+        }
+
+    def stats(self):
+        return {**super().stats(), 'current_rate': round(self.current_rate(), 4)}
+
+
+SCALING_POLICIES = {policy.name: policy for policy in (ThresholdPolicy, RatePolicy)}
+
+
+def build_scaling_policy(name: str, params: dict = None, **kwargs):
+    """
+    Instantiate a policy by name. Raises ValueError for an unknown name or bad params.
+    """
+    if name not in SCALING_POLICIES:
+        raise ValueError(f"Unknown scaling policy '{name}', expected one of {sorted(SCALING_POLICIES)}.")
+    if params and 'clock' in params:
+        raise ValueError("'clock' cannot be set through params.")
+    try:
+        return SCALING_POLICIES[name](**(params or {}), **kwargs)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid params for scaling policy '{name}': {e}")
+
+
+_policy = None
+_policy_config = None
+_policy_lock = threading.Lock()
+
+
+def get_scaling_policy():
+    """
+    The active policy, as stored on ScalingState (SCALING_POLICY when unset).
+    The row is re-read on each call so a change made through the API in
+    another process is picked up; the instance, and the request history
+    it holds, is only rebuilt when the configuration actually changed.
+    """
+    global _policy, _policy_config
+    try:
+        name, params = ScalingState.objects.filter(key=DEFAULT_KEY).values_list(
+            'scaling_policy', 'scaling_policy_params'
+        ).first() or ('', {})
+    except Exception as e:
+        logger.error(f"Could not read the scaling policy, keeping the current one: {e}")
+        name, params = _policy_config or ('', {})
+
+    config = (name or scaling_policy_name, params or {})
+    with _policy_lock:
+        if _policy is None or config != _policy_config:
+            try:
+                _policy = build_scaling_policy(*config)
+            except ValueError as e:
+                logger.error(f"{e} Falling back to '{scaling_policy_name}'.")
+                _policy = build_scaling_policy(scaling_policy_name)
+            _policy_config = config
+        return _policy
+
+
+def set_scaling_policy(name: str, params: dict = None):
+    """
+    Validate and store the policy for every process. Raises ValueError when invalid.
+    """
+    global _policy, _policy_config
+    policy = build_scaling_policy(name, params)
+    obj, _ = ScalingState.objects.get_or_create(key=DEFAULT_KEY)
+    obj.scaling_policy = name
+    obj.scaling_policy_params = params or {}
+    obj.save(update_fields=['scaling_policy', 'scaling_policy_params', 'updated_at'])
+    with _policy_lock:
+        _policy = policy
+        _policy_config = (name, params or {})
+    return policy
@@ -0,0 +1,108 @@
+import os
+import threading
+from datetime import datetime
+
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.triggers.interval import IntervalTrigger
+from django_apscheduler.jobstores import DjangoJobStore, register_events
+
+from config import (
+    swarm_mirror_enabled, codespace_reconcile_interval, image_prepull_enabled, warm_pool_size, warm_pool_interval,
+    consolidation_enabled, consolidation_interval, logger
+)
+
+CODESPACE_RECONCILE_JOB_ID = "codespace-reconcile"
+WARM_POOL_JOB_ID = "warm-pool"
+CONSOLIDATION_JOB_ID = "node-consolidation"
+STALE_JOBS_JOB_ID = "provisioning-stale-jobs"
+
+# Set by the serving entry points (wsgi.py, asgi.py); management commands, tests
+# and scripts leave it unset. Exporting SCHEDULER_AUTOSTART=false disables the
+# background services in a serving process as well.
+AUTOSTART_ENV = "SCHEDULER_AUTOSTART"
+
+scheduler = BackgroundScheduler()
+_start_lock = threading.Lock()
+
+
+def background_services_enabled():
+    return os.environ.get(AUTOSTART_ENV, "false").lower() == "true"
+
+
+def start_background_services_if_enabled():
+    """
+    Start the background services when the process opted in through
+    SCHEDULER_AUTOSTART. Returns whether they were started.
+    """
+    if not background_services_enabled():
+        return False
+    start_background_services()
+    return True
+
+
+def start_background_services():
+    """
+    Start the scheduler with its internal periodic jobs, and the swarm
+    mirror. Safe to call more than once.
+    """
+    with _start_lock:
+        if scheduler.running:
+            return
+
+        # Imported here so loading this module touches neither Docker nor the database
+        from docker_swarm.utils.codespace_utils import reconcile_codespaces
+        from docker_swarm.utils.consolidation import consolidate_nodes
+        from docker_swarm.utils.job_queue import fail_stale_jobs
+        from docker_swarm.utils.swarm_mirror import swarm_mirror
+        from docker_swarm.utils.warm_pool import maintain_warm_pool
+
+        scheduler.add_jobstore(DjangoJobStore(), "default")
+        # Internal periodic jobs are re-added on every start, they need no persistence
+        scheduler.add_jobstore(MemoryJobStore(), "memory")
+        register_events(scheduler)
+        scheduler.start()
+
+        scheduler.add_job(
+            reconcile_codespaces,
+            IntervalTrigger(seconds=codespace_reconcile_interval),
+            id=CODESPACE_RECONCILE_JOB_ID,
+            name=f"Reconcile code-spaces every {codespace_reconcile_interval} seconds",
+            jobstore="memory",
+            replace_existing=True,
+        )
+
+        # First run right away, for the jobs a previous process left active
+        scheduler.add_job(
+            fail_stale_jobs,
+            IntervalTrigger(seconds=codespace_reconcile_interval),
+            id=STALE_JOBS_JOB_ID,
+            name=f"Fail stale provisioning jobs every {codespace_reconcile_interval} seconds",
+            jobstore="memory",
+            next_run_time=datetime.now(),
+            replace_existing=True,
+        )
+
+        if image_prepull_enabled or warm_pool_size > 0:
+            scheduler.add_job(
+                maintain_warm_pool,
+                IntervalTrigger(seconds=warm_pool_interval),
+                id=WARM_POOL_JOB_ID,
+                name=f"Maintain warm pool every {warm_pool_interval} seconds",
+                jobstore="memory",
+                replace_existing=True,
+            )
+
+        if consolidation_enabled:
+            scheduler.add_job(
+                consolidate_nodes,
+                IntervalTrigger(seconds=consolidation_interval),
+                id=CONSOLIDATION_JOB_ID,
+                name=f"Consolidate under-used nodes every {consolidation_interval} seconds",
+                jobstore="memory",
+                replace_existing=True,
+            )
+
+        if swarm_mirror_enabled:
+            swarm_mirror.start()
+        logger.error("Background scheduler started.")
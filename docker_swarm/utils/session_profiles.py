@@ -0,0 +1,121 @@
+import math
+
+from docker.types import Resources
+
+from config import accepted_containers_count, session_profiles, default_session_profile
+from docker_swarm.utils.labels import NODE_CAPACITY_LABEL
+
+NANO_CPUS = 10 ** 9
+MIB = 1024 * 1024
+
+
+def get_session_profile(name: str = None):
+    """
+    The resource profile `name`, the default one when empty.
+    Raises ValueError for an unknown profile.
+    """
+    name = name or default_session_profile
+    if name not in session_profiles:
+        raise ValueError(f"Unknown session profile '{name}', expected one of {sorted(session_profiles)}.")
+    return session_profiles[name]
+
+
+def get_session_resources(profile: str = None):
+    """
+    Swarm resources of one session of `profile`: the reservations the
+    scheduler places by and the limits enforced on the container. None
+    when the profile sets neither.
+    """
+    spec = get_session_profile(profile)
+    values = {
+        'cpu_reservation': int(spec.get('cpu_reservation', 0) * NANO_CPUS) or None,
+        'cpu_limit': int(spec.get('cpu_limit', 0) * NANO_CPUS) or None,
+        'mem_reservation': int(spec.get('memory_reservation', 0) * MIB) or None,
+        'mem_limit': int(spec.get('memory_limit', 0) * MIB) or None,
+    }
+    if not any(values.values()):
+        return None
+    return Resources(**values)
+
+
+def get_slot_size():
+    """
+    NanoCPUs and bytes reserved by a session of the default profile, the
+    unit all capacity is counted in. 0 for a resource it does not reserve.
+    """
+    spec = get_session_profile()
+    return int(spec.get('cpu_reservation', 0) * NANO_CPUS), int(spec.get('memory_reservation', 0) * MIB)
+
+
+def get_reservation_slots(cpu_reservation: int, memory_reservation: int):
+    """
+    Capacity slots taken by a reservation of NanoCPUs and bytes, at least one.
+    """
+    slot_cpu, slot_memory = get_slot_size()
+    ratios = []
+    if slot_cpu:
+        ratios.append(cpu_reservation / slot_cpu)
+    if slot_memory:
+        ratios.append(memory_reservation / slot_memory)
+    return max(1, math.ceil(round(max(ratios, default=1), 6)))
+
+
+def get_profile_slots(profile: str = None):
+    """
+    Capacity slots taken by one session of `profile`.
+    """
+    spec = get_session_profile(profile)
+    return get_reservation_slots(int(spec.get('cpu_reservation', 0) * NANO_CPUS), int(spec.get('memory_reservation', 0) * MIB))
+
+
+def get_task_reservation(task: dict):
+    """
+    NanoCPUs and bytes reserved by a swarm task. Sessions created without
+    reservations count as one slot.
+    """
+    reservations = task.get('Spec', {}).get('Resources', {}).get('Reservations') or {}
+    if not reservations:
+        return get_slot_size()
+    return reservations.get('NanoCPUs', 0), reservations.get('MemoryBytes', 0)
+
+
+def get_resource_slots(nano_cpus: int, memory_bytes: int):
+    """
+    Capacity slots of a machine with the given NanoCPUs and memory bytes,
+    or None when neither is known or no profile reserves it.
+    """
+    slot_cpu, slot_memory = get_slot_size()
+    fits = [total // slot for total, slot in ((nano_cpus, slot_cpu), (memory_bytes, slot_memory)) if total and slot]
+    return min(fits) if fits else None
+
+
+def get_node_slots(node_attrs: dict, task_info: list):
+    """
+    Total and free capacity slots of a node. The total comes from the
+    NODE_CAPACITY_LABEL node label, else from the node's CPUs and memory,
+    else it is ACCEPTED_CONTAINERS_COUNT. Sessions (`get_task_info`
+    entries) take the slots their reservations are worth.
+    """
+    labels = node_attrs.get('Spec', {}).get('Labels') or {}
+    resources = node_attrs.get('Description', {}).get('Resources') or {}
+    used_slots = sum(get_reservation_slots(task['cpu_reservation'], task['memory_reservation']) for task in task_info)
+
+    if labels.get(NODE_CAPACITY_LABEL, '').isdigit():
+        total_slots = int(labels[NODE_CAPACITY_LABEL])
+        return total_slots, max(0, total_slots - used_slots)
+
+    total_slots = get_resource_slots(resources.get('NanoCPUs', 0), resources.get('MemoryBytes', 0))
+    if total_slots is None:
+        return accepted_containers_count, max(0, accepted_containers_count - used_slots)
+
+    # Free room is measured on the raw reservations, a slot is not always fully used
+    slot_cpu, slot_memory = get_slot_size()
+    free_slots = min(
+        max(0, total - sum(task[key] for task in task_info)) // slot
+        for total, slot, key in (
+            (resources.get('NanoCPUs', 0), slot_cpu, 'cpu_reservation'),
+            (resources.get('MemoryBytes', 0), slot_memory, 'memory_reservation'),
+        )
+        if total and slot
+    )
+    return total_slots, free_slots
@@ -0,0 +1,123 @@
+import threading
+import time
+
+from config import swarm_cache_ttl
+from docker_swarm.utils.node_utils import get_docker_node_detail_info
+
+NODES_KEY = 'nodes'
+
+
+class _Flight:
+    """
+    A fetch in progress. Callers that miss while it runs wait on `done`
+    and share its result instead of issuing their own request.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SwarmStateCache:
+    """
+    In-process, TTL-bounded cache of swarm state with single-flight refresh.
+    """
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._inflight = {}
+        self._generation = 0
+        self._stats = {'hits': 0, 'misses': 0, 'refreshes': 0, 'errors': 0, 'invalidations': 0}
+
+    def get(self, key: str, loader):
+        """
+        Return the cached value for `key`, calling `loader()` when it is
+        missing or expired. Concurrent misses share a single `loader()` call.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._stats['hits'] += 1
+                return entry[1]
+
+            self._stats['misses'] += 1
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._inflight[key] = flight
+            generation = self._generation
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = loader()
+            with self._lock:
+                self._stats['refreshes'] += 1
+                # Drop results that raced with an invalidation, they may be stale.
+                if generation == self._generation and self.ttl > 0:
+                    self._entries[key] = (time.monotonic() + self.ttl, flight.value)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            with self._lock:
+                self._stats['errors'] += 1
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    def invalidate(self, *keys):
+        """
+        Drop the given keys, or everything when no key is given.
+        """
+        with self._lock:
+            self._generation += 1
+            self._stats['invalidations'] += 1
+            if not keys:
+                self._entries.clear()
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                **self._stats,
+                'ttl_seconds': self.ttl,
+                'hit_ratio': round(self._stats['hits'] / lookups, 4) if lookups else 0.0,
+                'cached_keys': sorted(self._entries),
+            }
+
+
+swarm_cache = SwarmStateCache(ttl=swarm_cache_ttl)
+
+
+class _NodeInfoError(Exception):
+    def __init__(self, response):
+        super().__init__(response.get('error'))
+        self.response = response
+
+
+def _load_node_detail_info():
+    response = get_docker_node_detail_info()
+    if response['status'] == 'failed':
+        # Raise so the failure is shared with waiters but never cached.
+        raise _NodeInfoError(response)
+    return response
+
+
+def get_cached_node_detail_info():
+    """
+    Same contract as `get_docker_node_detail_info`, served from the shared cache.
+    """
+    try:
+        return swarm_cache.get(NODES_KEY, _load_node_detail_info)
+    except _NodeInfoError as e:
+        return e.response
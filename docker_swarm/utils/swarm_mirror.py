@@ -0,0 +1,253 @@
+import threading
+import time
+
+from config import swarm_mirror_reconnect_delay, swarm_mirror_resync_interval, logger
+from docker_swarm.utils.node_utils import get_api_client, get_task_info, get_node_info, is_session_task
+from docker_swarm.utils.swarm_cache import swarm_cache, get_cached_node_detail_info, NODES_KEY
+from docker_swarm.utils.session_profiles import get_node_slots
+
+EVENT_TYPES = ['service', 'node']
+
+# Docker emits no task events, so a service whose tasks are not yet placed
+# is re-read after this delay until every task has a node.
+SETTLE_DELAY = 2
+MAX_SETTLE_ATTEMPTS = 30
+
+
+class SwarmStateMirror:
+    """
+    In-memory model of worker nodes and running tasks, kept current from the
+    Docker `events()` stream.
+
+    A full resync runs on start, after every reconnect and every
+    `resync_interval` seconds. In between, node and service events update
+    only the affected nodes and services. The free slot total is kept up to
+    date on every change, so capacity reads are O(1).
+
+    `api_client` is anything with the `docker.APIClient` methods `nodes`,
+    `tasks`, `inspect_node` and `events`, so a fake or recorded stream can
+    drive the mirror in tests.
+    """
+    def __init__(self, api_client=None, reconnect_delay: float = swarm_mirror_reconnect_delay,
+                 resync_interval: float = swarm_mirror_resync_interval):
+        self._api_client = api_client
+        self.reconnect_delay = reconnect_delay
+        self.resync_interval = resync_interval
+
+        self._lock = threading.RLock()
+        self._nodes = {}       # node_id -> raw node attrs (workers only)
+        self._tasks = {}       # task_id -> raw task
+        self._node_tasks = {}  # node_id -> set of task ids
+        self._free_slots = 0
+        self._synced = False
+        self._since = None
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {'events': 0, 'resyncs': 0, 'reconnects': 0, 'service_refreshes': 0}
+
+    @property
+    def api_client(self):
+        return self._api_client or get_api_client()
+
+    # ---- reads -----------------------------------------------------------
+
+    def is_synced(self):
+        return self._synced
+
+    def available_capacity(self):
+        """
+        Free capacity slots across all worker nodes.
+        """
+        return self._free_slots
+
+    def node_count(self):
+        return len(self._nodes)
+
+    def node_detail_list(self):
+        """
+        The mirrored cluster in the `get_docker_node_detail_info` shape.
+        """
+        with self._lock:
+            return [
+                get_node_info(attrs, [get_task_info(self._tasks[task_id]) for task_id in sorted(self._node_tasks.get(node_id, ()))])
+                for node_id, attrs in self._nodes.items()
+            ]
+
+    def get_node_detail_info(self):
+        if not self._synced:
+            return get_cached_node_detail_info()
+        return {'status': 'success', 'data': self.node_detail_list()}
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                'synced': self._synced,
+                'nodes': len(self._nodes),
+                'tasks': len(self._tasks),
+                'free_slots': self._free_slots,
+            }
+
+    # ---- model updates (callers hold the lock) ---------------------------
+
+    def _slots(self, node_id):
+        # Paused and drained nodes take no new sessions
+        if node_id not in self._nodes or self._nodes[node_id]['Spec'].get('Availability') != 'active':
+            return 0
+        task_info = [get_task_info(self._tasks[task_id]) for task_id in self._node_tasks.get(node_id, ())]
+        return get_node_slots(self._nodes[node_id], task_info)[1]
+
+    def _set_node(self, attrs):
+        node_id = attrs['ID']
+        before = self._slots(node_id)
+        self._nodes[node_id] = attrs
+        self._free_slots += self._slots(node_id) - before
+
+    def _remove_node(self, node_id):
+        self._free_slots -= self._slots(node_id)
+        self._nodes.pop(node_id, None)
+        # Its tasks go with it, rescheduled ones come back through their service
+        for task_id in self._node_tasks.pop(node_id, ()):
+            self._tasks.pop(task_id, None)
+
+    def _add_task(self, task):
+        node_id = task.get('NodeID')
+        if not node_id or not is_session_task(task):
+            return
+        before = self._slots(node_id)
+        self._tasks[task['ID']] = task
+        self._node_tasks.setdefault(node_id, set()).add(task['ID'])
+        self._free_slots += self._slots(node_id) - before
+
+    def _remove_task(self, task_id):
+        task = self._tasks.get(task_id)
+        if task is None:
+            return
+        node_id = task.get('NodeID')
+        # Slots are summed over the node's tasks, so count them before the task leaves
+        before = self._slots(node_id)
+        del self._tasks[task_id]
+        self._node_tasks.get(node_id, set()).discard(task_id)
+        if not self._node_tasks.get(node_id):
+            self._node_tasks.pop(node_id, None)
+        self._free_slots += self._slots(node_id) - before
+
+    def _replace_service_tasks(self, service_id, tasks):
+        for task_id in [task_id for task_id, task in self._tasks.items() if task.get('ServiceID') == service_id]:
+            self._remove_task(task_id)
+        for task in tasks:
+            self._add_task(task)
+
+    # ---- sync --------------------------------------------------------------
+
+    def resync(self):
+        """
+        Rebuild the whole model from one nodes() and one tasks() call.
+        """
+        since = int(time.time())
+        nodes = self.api_client.nodes(filters={'role': 'worker'})
+        tasks = self.api_client.tasks(filters={'desired-state': ['running']})
+
+        with self._lock:
+            self._nodes, self._tasks, self._node_tasks, self._free_slots = {}, {}, {}, 0
+            for attrs in nodes:
+                self._set_node(attrs)
+            for task in tasks:
+                self._add_task(task)
+            self._since = since
+            self._synced = True
+            self._stats['resyncs'] += 1
+
+        swarm_cache.invalidate(NODES_KEY)
+
+    def refresh_service(self, service_id, attempt: int = 0):
+        """
+        Re-read the running tasks of one service. Retries later while some
+        of its tasks are still waiting for a node.
+        """
+        tasks = self.api_client.tasks(filters={'service': service_id, 'desired-state': ['running']})
+        with self._lock:
+            self._replace_service_tasks(service_id, tasks)
+            self._stats['service_refreshes'] += 1
+
+        if any(not task.get('NodeID') for task in tasks) and attempt < MAX_SETTLE_ATTEMPTS and not self._stop.is_set():
+            timer = threading.Timer(SETTLE_DELAY, self._safe_refresh_service, args=(service_id, attempt + 1))
+            timer.daemon = True
+            timer.start()
+
+    def _safe_refresh_service(self, service_id, attempt):
+        try:
+            self.refresh_service(service_id, attempt)
+        except Exception as e:
+            logger.error(f"Swarm mirror: refreshing service '{service_id}' failed: {e}")
+
+    def handle_event(self, event: dict):
+        """
+        Apply one decoded Docker event to the model.
+        """
+        event_type = event.get('Type')
+        action = event.get('Action')
+        actor_id = event.get('Actor', {}).get('ID')
+        with self._lock:
+            self._stats['events'] += 1
+
+        if event_type == 'node':
+            attrs = None if action == 'remove' else self.api_client.inspect_node(actor_id)
+            with self._lock:
+                affected_services = {task.get('ServiceID') for task in self._tasks.values() if task.get('NodeID') == actor_id}
+                if attrs is not None and attrs['Spec']['Role'] == 'worker':
+                    self._set_node(attrs)
+                else:
+                    self._remove_node(actor_id)
+            # Tasks of a node that changed state or left may be rescheduled elsewhere.
+            for service_id in affected_services:
+                self.refresh_service(service_id)
+            swarm_cache.invalidate(NODES_KEY)
+
+        elif event_type == 'service':
+            if action == 'remove':
+                with self._lock:
+                    self._replace_service_tasks(actor_id, [])
+            else:
+                self.refresh_service(actor_id)
+            swarm_cache.invalidate(NODES_KEY)
+
+        if event.get('time'):
+            self._since = event['time']
+
+    # ---- background subscriber ---------------------------------------------
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.resync()
+                until = self._since + int(self.resync_interval)
+                stream = self.api_client.events(since=self._since, until=until, filters={'type': EVENT_TYPES}, decode=True)
+                for event in stream:
+                    if self._stop.is_set():
+                        break
+                    self.handle_event(event)
+                # Stream ended at `until`, loop around for a periodic resync.
+                continue
+            except Exception as e:
+                logger.error(f"Swarm mirror: event stream lost, resyncing after reconnect: {e}")
+
+            self._synced = False
+            with self._lock:
+                self._stats['reconnects'] += 1
+            self._stop.wait(self.reconnect_delay)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="swarm-state-mirror", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._synced = False
+
+
+swarm_mirror = SwarmStateMirror()
@@ -0,0 +1,168 @@
+import threading
+
+import docker
+from django.db import transaction
+from docker.types import TaskTemplate, ContainerSpec, RestartPolicy, Placement, Resources, ServiceMode
+
+from config import code_server_image, image_prepull_enabled, warm_pool_size, logger
+from docker_swarm.models import NodeInstance
+from docker_swarm.utils.docker_client import docker_client
+from docker_swarm.utils.labels import PREPULL_LABEL, WARM_NODE_LABEL
+from docker_swarm.utils.node_utils import get_api_client
+from docker_swarm.utils.scale_up import lunch_template, lock_scaling_state
+from docker_swarm.utils.swarm_mirror import swarm_mirror
+
+PREPULL_SERVICE_NAME = "code-server-prepull"
+WARM_CONSTRAINT = f"node.labels.{WARM_NODE_LABEL} == true"
+
+
+class WarmPool:
+    """
+    Keeps the code-server image on every worker ahead of the first session
+    and `size` idle workers on standby.
+
+    The image is pulled by a global pre-pull service: swarm runs one idle
+    task of the code-server image on every worker, including workers that
+    join later, so the pull overlaps the node join instead of delaying the
+    first session. A worker whose pre-pull task is running has the image
+    and gets the WARM_NODE_LABEL, which new sessions are pinned to while a
+    warm worker has a free slot.
+    """
+    def __init__(self, size: int = warm_pool_size, image: str = code_server_image):
+        self.size = size
+        self.image = image
+        self._lock = threading.Lock()
+        self._warm_nodes = set()
+        self._stats = {'refreshes': 0, 'labelled': 0, 'launched': 0, 'warm_placements': 0, 'cold_placements': 0}
+
+    def warm_nodes(self):
+        with self._lock:
+            return set(self._warm_nodes)
+
+    def ensure_prepull_service(self):
+        """
+        Create the global pre-pull service if it is missing.
+        """
+        try:
+            docker_client.services.get(PREPULL_SERVICE_NAME)
+            return False
+        except docker.errors.NotFound:
+            pass
+
+        container_spec = ContainerSpec(
+            image=self.image,
+            command=["sleep", "infinity"],
+            labels={PREPULL_LABEL: "true"},
+        )
+        task_template = TaskTemplate(
+            container_spec=container_spec,
+            restart_policy=RestartPolicy(condition="any"),
+            placement=Placement(constraints=["node.role == worker"]),
+            resources=Resources(cpu_limit=10_000_000, mem_limit=32 * 1024 * 1024),
+        )
+        docker_client.api.create_service(task_template=task_template, name=PREPULL_SERVICE_NAME, mode=ServiceMode('global'))
+        logger.error(f"Created image pre-pull service '{PREPULL_SERVICE_NAME}' for {self.image}.")
+        return True
+
+    def refresh(self):
+        """
+        Re-read which workers have a running pre-pull task and label the
+        newly warm ones. One tasks() call, plus one inspect/update per new node.
+        """
+        api_client = get_api_client()
+        tasks = api_client.tasks(filters={'service': PREPULL_SERVICE_NAME, 'desired-state': ['running']})
+        warm = {task['NodeID'] for task in tasks if task.get('NodeID') and task['Status']['State'] == 'running'}
+
+        for node_id in warm - self.warm_nodes():
+            attrs = api_client.inspect_node(node_id)
+            spec = attrs['Spec']
+            labels = spec.get('Labels') or {}
+            if labels.get(WARM_NODE_LABEL) != 'true':
+                spec['Labels'] = {**labels, WARM_NODE_LABEL: 'true'}
+                api_client.update_node(node_id, attrs['Version']['Index'], spec)
+                self._stats['labelled'] += 1
+
+        with self._lock:
+            self._warm_nodes = warm
+            self._stats['refreshes'] += 1
+        return warm
+
+    def has_warm_capacity(self):
+        response = swarm_mirror.get_node_detail_info()
+        if response['status'] == 'failed':
+            return False
+        warm = self.warm_nodes()
+        return any(
+            node['id'] in warm and node['status'] == 'ready' and node['availability'] == 'active'
+            and node['free_slots'] > 0
+            for node in response['data']
+        )
+
+    def get_placement_constraints(self):
+        """
+        Placement constraints for a new session: warm workers only while one
+        of them has a free slot, otherwise any worker.
+        """
+        constraints = ["node.role == worker"]
+        if self.has_warm_capacity():
+            constraints.append(WARM_CONSTRAINT)
+            self._stats['warm_placements'] += 1
+        else:
+            self._stats['cold_placements'] += 1
+        return constraints
+
+    def ensure_standby(self):
+        """
+        Launch workers until `size` idle ones are running or booting. The
+        count and the launch run under the capacity ledger lock, so workers
+        of several processes never top the pool up at the same time.
+
+        Returns:
+            int: Number of nodes launched.
+        """
+        if self.size <= 0:
+            return 0
+
+        with transaction.atomic():
+            lock_scaling_state()
+            response = swarm_mirror.get_node_detail_info()
+            if response['status'] == 'failed':
+                logger.error(f"Warm pool: could not read nodes: {response.get('error')}")
+                return 0
+
+            idle = sum(1 for node in response['data'] if node['tasks_count'] == 0)
+            booting = NodeInstance.objects.filter(status='provisioning').count()
+            missing = self.size - idle - booting
+            if missing <= 0:
+                return 0
+
+            lunch_template(max_count=missing)
+        self._stats['launched'] += missing
+        logger.error(f"Warm pool: launched {missing} standby node(s).")
+        return missing
+
+    def select_standby(self, idle_node_ids: list):
+        """
+        The idle nodes scale-down must keep for the pool, warm ones first.
+        """
+        if self.size <= 0:
+            return []
+        warm = self.warm_nodes()
+        return sorted(idle_node_ids, key=lambda node_id: node_id not in warm)[:self.size]
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'size': self.size, 'prepull_enabled': image_prepull_enabled, 'warm_nodes': len(self._warm_nodes)}
+
+
+warm_pool = WarmPool()
+
+
+def maintain_warm_pool():
+    """
+    Periodic job: keep the pre-pull service, warm labels and standby nodes current.
+    """
+    if image_prepull_enabled:
+        warm_pool.ensure_prepull_service()
+        warm_pool.refresh()
+    warm_pool.ensure_standby()
@@ -0,0 +1,79 @@
+# Django Imports
+from django.http import JsonResponse
+from django.views import View
+from rest_framework import status
+from rest_framework.utils.encoders import JSONEncoder
+
+# Local Imports
+from docker_swarm.models import CodeSpace, ProvisioningJob
+from docker_swarm.utils.codespace_utils import parse_codespace_list_params, list_codespaces, get_codespace_detail
+from docker_swarm.utils.docker_utils import get_service_name
+from docker_swarm.utils.job_queue import get_job_info
+from docker_swarm.utils.offload import run_blocking
+from docker_swarm.utils.swarm_cache import get_cached_node_detail_info
+
+# Read-only variants of the status endpoints for ASGI deployments. The
+# request is handled on the event loop, only the blocking Docker and
+# database calls take a thread from the bounded offload pool.
+
+
+def json_response(data, status_code: int = status.HTTP_200_OK):
+    """
+    JsonResponse with DRF's encoder, so payloads match the sync views
+    (datetimes keep their microseconds).
+    """
+    return JsonResponse(data, status=status_code, encoder=JSONEncoder)
+
+
+class AsyncContainerCollection(View):
+    async def get(self, request):
+        """
+        Same as GET /task.
+        """
+        try:
+            limit, cursor, fields = parse_codespace_list_params(request.GET)
+            service_list, next_cursor = await run_blocking(list_codespaces, limit, cursor, fields)
+            return json_response({'status': 'success', 'data': service_list, 'next_cursor': next_cursor})
+        except Exception as e:
+            response_body = {'error': str(e), "status": "failed"}
+            return json_response(response_body, status.HTTP_400_BAD_REQUEST)
+
+
+class AsyncContainerResource(View):
+    async def get(self, request, username: str):
+        """
+        Same as GET /task/<username>.
+        """
+        try:
+            obj = await run_blocking(get_codespace_detail, username)
+            return json_response({'status': 'success', 'data': obj})
+        except CodeSpace.DoesNotExist:
+            response_body = {"error": f"Service '{get_service_name(username)}' not found.", "status": "failed"}
+            return json_response(response_body, status.HTTP_204_NO_CONTENT)
+        except Exception as e:
+            response_body = {'error': str(e), "status": "failed"}
+            return json_response(response_body, status.HTTP_400_BAD_REQUEST)
+
+
+class AsyncProvisioningJobResource(View):
+    async def get(self, request, job_id):
+        """
+        Same as GET /job/<job_id>.
+        """
+        try:
+            job = await run_blocking(ProvisioningJob.objects.get, job_id=job_id)
+        except ProvisioningJob.DoesNotExist:
+            response_body = {"error": f"Job '{job_id}' not found.", "status": "failed"}
+            return json_response(response_body, status.HTTP_404_NOT_FOUND)
+        return json_response({'status': 'success', 'data': get_job_info(job)})
+
+
+class AsyncNodeCollection(View):
+    async def get(self, request):
+        """
+        Same as GET /node.
+        """
+        node_details = await run_blocking(get_cached_node_detail_info)
+        if node_details['status'] == 'failed':
+            return json_response(node_details, status.HTTP_400_BAD_REQUEST)
+        return json_response(node_details)
@@ -1,21 +1,20 @@
-# Standard Imports
-import os
-import re
-
 # Installed Imports
 import docker
-from docker.types import TaskTemplate, ContainerSpec, Mount, RestartPolicy, Placement
 
 # Django Imports
 from rest_framework.views import APIView, Response, status
 
 # Local Imports
-from config import mapping_path, nginx_conf_path, docker_client, base_url, logger
-from docker_swarm.utils.nginx_utils import update_nginx_config, restart_nginx
-from docker_swarm.utils.scale_up import check_and_scale_up
-
-if mapping_path[-1] == "/":
-    mapping_path = mapping_path[:-1]
+from config import base_url, logger
+from docker_swarm.utils.bulk_utils import validate_usernames, create_sessions_bulk, delete_sessions_bulk, get_bulk_status_code
+from docker_swarm.models import CodeSpace
+from docker_swarm.utils.codespace_utils import (
+    parse_codespace_list_params, list_codespaces, get_codespace_detail, remove_codespace
+)
+from docker_swarm.utils.docker_utils import get_service_name, remove_code_server_service, ensure_service_absent
+from docker_swarm.utils.job_queue import enqueue_provisioning
+from docker_swarm.utils.nginx_utils import remove_nginx_config, request_nginx_reload
+from docker_swarm.utils.session_profiles import get_session_profile
 
 
 class ContainerCollection(APIView):
@@ -24,28 +23,52 @@ class ContainerCollection(APIView):
     """
     def get(self, request):
         """
-        List all services in the Docker Swarm.
+        List the code-server services, sorted by name. Read from the CodeSpace
+        registry, which is reconciled with Docker periodically.
+
+        Query params:
+            limit: page size (all services when omitted).
+            cursor: `next_cursor` of the previous page.
+            fields: comma separated subset of id,name,status,owner,created_at,image,port,node_id.
         """
         try:
-            services = docker_client.services.list()
-            service_list = []
-
-            for s in services:
-                if "code-server" not in s.name:
-                    continue
-
-                # logger.error(f"Service: {s.name}")
-                # for key, value in s.attrs.items():
-                #     logger.error(f"{key}: {value}")
-
-                # Append service details to the list
-                service_list.append({
-                    "id": s.id,
-                    "name": s.name,
-                    "status": s.attrs['UpdateStatus']['State'] if 'UpdateStatus' in s.attrs else "active",
-                })
-            
-            return Response({'status': 'success', 'data': service_list})
+            limit, cursor, fields = parse_codespace_list_params(request.query_params)
+            service_list, next_cursor = list_codespaces(limit, cursor, fields)
+
+            return Response({'status': 'success', 'data': service_list, 'next_cursor': next_cursor})
+
+        except Exception as e:
+            response_body = {'error': str(e), "status": "failed"}
+            return Response(response_body, status=status.HTTP_400_BAD_REQUEST)
+
+    def post(self, request):
+        """
+        Queue services for a list of users: {"usernames": ["alice", "bob"]},
+        with an optional resource "profile" (small, medium, large).
+        Reports a job id or an error for each user, 202 when every user was queued.
+        """
+        try:
+            usernames = validate_usernames(request.data.get("usernames"))
+            profile = request.data.get("profile")
+            get_session_profile(profile)
+            results = create_sessions_bulk(usernames, profile)
+            response_status = get_bulk_status_code(results, success_status=status.HTTP_202_ACCEPTED)
+            return Response({'status': 'success' if response_status == 202 else 'failed', 'data': results}, status=response_status)
+
+        except Exception as e:
+            response_body = {'error': str(e), "status": "failed"}
+            return Response(response_body, status=status.HTTP_400_BAD_REQUEST)
+
+    def delete(self, request):
+        """
+        Remove the services of a list of users: {"usernames": ["alice", "bob"]}.
+        Reports a result for each user.
+        """
+        try:
+            usernames = validate_usernames(request.data.get("usernames"))
+            results = delete_sessions_bulk(usernames)
+            response_status = get_bulk_status_code(results)
+            return Response({'status': 'success' if response_status == 200 else 'failed', 'data': results}, status=response_status)
 
         except Exception as e:
             response_body = {'error': str(e), "status": "failed"}
@@ -55,18 +78,13 @@ class ContainerCollection(APIView):
 class ContainerResource(APIView):
     def get(self, request, username: str):
         """
-        Retrieve details of a service by its name.
+        Retrieve details of a service by its name, from the CodeSpace registry.
         """
         try:
-            service_name = f"{username}-code-server"
-            service = docker_client.services.get(service_name)
-            obj = {
-                "service_id": service.id,
-                "service_name": service_name,
-                "status": service.attrs['UpdateStatus']['State'] if 'UpdateStatus' in service.attrs else "active",
-            }
+            service_name = get_service_name(username)
+            obj = get_codespace_detail(username)
             return Response({'status': 'success', 'data': obj})
-        except docker.errors.NotFound:
+        except CodeSpace.DoesNotExist:
             response_body = {"error": f"Service '{service_name}' not found.", "status": "failed"}
             return Response(response_body, status=status.HTTP_204_NO_CONTENT)
         except Exception as e:
@@ -75,66 +93,25 @@ class ContainerResource(APIView):
 
     def post(self, request, username: str):
         """
-        Create a new service in Docker Swarm with a unique username as the service name.
+        Queue the creation of a new service in Docker Swarm with a unique username as the service name.
+        An optional resource "profile" (small, medium, large) sets its CPU and memory.
+        Returns 202 with a job id; progress is reported by GET /job/<job_id>.
         """
         try:
-            check_and_scale_up()
-            # Ensure the folder for the user exists in mapping_path
-            container_mount_path = os.path.join(mapping_path, username)
-            user_folder_path = os.path.join("/code-spaces-mapping", username)
-            logger.error(f"User folder path: {user_folder_path}")
-
-            if not os.path.exists(user_folder_path):
-                logger.error(f"Creating user folder: {user_folder_path}")
-                os.makedirs(user_folder_path)
-
-            # Check if a service with the same name already exists
-            try:
-                existing_service = docker_client.services.get(f"{username}-code-server")
-                logger.error(existing_service)
-                if existing_service:
-                    logger.error("Comming to if")
-                    raise ValueError(f"A service with the name '{username}' already exists.")
-            except docker.errors.NotFound:
-                pass  # No existing service with this name
-
-            # Create the service
-            container_spec = ContainerSpec(
-                image="taasheeadmin/code-server",
-                user="root",
-                mounts=[Mount(type="bind", source=container_mount_path, target="/home/coder")],
-                tty=True,
-                command=["code-server", "--bind-addr", "0.0.0.0:8080", "--auth", "none"]
-            )
-
-            # Define task template with placement
-            task_template = TaskTemplate(
-                container_spec=container_spec,
-                restart_policy=RestartPolicy(condition="any"),
-                placement=Placement(constraints=["node.role == worker"])
-            )
-
-            # Create the service using low-level API
-            service = docker_client.api.create_service(
-                task_template=task_template,
-                name=f"{username}-code-server",
-                networks=["code-spaces"]
-            )
-
-            # Update Nginx config
-            update_nginx_config(username)
-
-            # Restart Nginx to apply changes
-            restart_nginx()
-
-            # Return service details
+            profile = request.data.get("profile")
+            get_session_profile(profile)
+
+            # Reject duplicates right away instead of failing the job later
+            ensure_service_absent(username)
+
+            job = enqueue_provisioning(username, profile)
             obj = {
-                "message": "Service created successfully!",
-                "service_id": service["ID"],
-                "service_name": f"{username}-code-server",
-                "access_url": f"{base_url}/{username}/?folder=/home/coder",
+                "message": "Service creation queued.",
+                "job_id": str(job.job_id),
+                "state": job.state,
+                "status_url": f"{base_url}/job/{job.job_id}",
             }
-            return Response({'status': 'success', 'data': obj})
+            return Response({'status': 'success', 'data': obj}, status=status.HTTP_202_ACCEPTED)
 
         except Exception as e:
             response_body = {'error': str(e), "status": "failed"}
@@ -143,27 +120,18 @@ class ContainerResource(APIView):
     def delete(self, request, username: str):
         """
         Remove a service by its name.
-        Also removes the corresponding location block from nginx.conf and restarts Nginx.
+        Also removes the corresponding nginx route and reloads Nginx.
         """
         try:
-            service_name = f"{username}-code-server"
+            service_name = get_service_name(username)
             # Remove the service
-            service = docker_client.services.get(service_name)
-            service.remove()
-            
-            # Remove location from nginx.conf
-            location_block_pattern = rf"\n\s*location /{service_name.replace('-code-server', '')}/ \{{.*?\n\s*\}}"
+            remove_code_server_service(username)
+            remove_codespace(username)
             
-            with open(nginx_conf_path, "r") as file:
-                nginx_conf = file.read()
-
-            updated_conf = re.sub(location_block_pattern, "", nginx_conf, flags=re.DOTALL)
-
-            with open(nginx_conf_path, "w") as file:
-                file.write(updated_conf)
-
-            # Restart Nginx to apply changes
-            restart_nginx()
+            # Remove the user's nginx route, reload Nginx if the strategy needs it
+            # (coalesced with other sessions)
+            if remove_nginx_config(username):
+                request_nginx_reload()
 
             response_obj = {"message": f"Service '{service_name}' removed successfully and Nginx updated!", 'status': 'success'}
             return Response(response_obj)
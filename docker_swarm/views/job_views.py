@@ -0,0 +1,19 @@
+# Django Imports
+from rest_framework.views import APIView, Response, status
+
+# Local Imports
+from docker_swarm.models import ProvisioningJob
+from docker_swarm.utils.job_queue import get_job_info
+
+
+class ProvisioningJobResource(APIView):
+    def get(self, request, job_id):
+        """
+        Report the progress of a session provisioning job.
+        """
+        try:
+            job = ProvisioningJob.objects.get(job_id=job_id)
+        except ProvisioningJob.DoesNotExist:
+            response_body = {"error": f"Job '{job_id}' not found.", "status": "failed"}
+            return Response(response_body, status=status.HTTP_404_NOT_FOUND)
+        return Response({'status': 'success', 'data': get_job_info(job)})
@@ -1,25 +1,17 @@
 # Django Imports
 from rest_framework.views import APIView, Response, status
-from apscheduler.schedulers.background import BackgroundScheduler
-from django_apscheduler.jobstores import DjangoJobStore, register_events
 from apscheduler.triggers.interval import IntervalTrigger
 
 # Local Imports
-from docker_swarm.utils.node_utils import get_docker_node_detail_info
+from docker_swarm.utils.swarm_cache import get_cached_node_detail_info
 from docker_swarm.utils.custom_utils import schedule_scale_down
 from docker_swarm.utils.scale_up import lunch_template
-
-scheduler = BackgroundScheduler()
-scheduler.add_jobstore(DjangoJobStore(), "default")
-register_events(scheduler)
-
-if not scheduler.running:
-    scheduler.start()
+from docker_swarm.utils.scheduler import scheduler
 
 
 class NodeCollection(APIView):
     def get(self, request):
-        node_details = get_docker_node_detail_info()
+        node_details = get_cached_node_detail_info()
         if node_details['status'] == 'failed':
             return Response(node_details, status=status.HTTP_400_BAD_REQUEST)
         return Response(node_details)
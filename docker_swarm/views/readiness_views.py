@@ -0,0 +1,97 @@
+# Installed Imports
+import json
+import time
+
+# Django Imports
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework import status
+
+# Local Imports
+from config import readiness_stream_timeout, readiness_keepalive
+from docker_swarm.utils.docker_utils import get_service_name
+from docker_swarm.utils.readiness import readiness_watcher, TERMINAL_STATES
+
+
+def format_event(readiness: dict):
+    return f"event: readiness\ndata: {json.dumps(readiness)}\n\n"
+
+
+KEEPALIVE_EVENT = ": keepalive\n\n"
+
+
+class SessionReadiness(View):
+    """
+    Readiness of a session: queued, scaling, scheduled, pulling, running,
+    routable (or failed), from the shared readiness watcher.
+
+    With `Accept: text/event-stream` every change is pushed as a
+    "readiness" event until the session is routable or failed. Otherwise
+    this is a long-poll: with `?since=<state>` the answer is held until
+    the state differs, at most `timeout` seconds (30 by default).
+    """
+    async def get(self, request, username: str):
+        readiness_watcher.watch(username)
+        try:
+            readiness = await readiness_watcher.async_wait(username, None, readiness_keepalive)
+            if readiness is None and readiness_watcher.get_error():
+                readiness_watcher.unwatch(username)
+                response_body = {"error": f"Readiness unavailable: {readiness_watcher.get_error()}", "status": "failed"}
+                return JsonResponse(response_body, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            if readiness is None or readiness['state'] is None:
+                readiness_watcher.unwatch(username)
+                response_body = {"error": f"Service '{get_service_name(username)}' not found.", "status": "failed"}
+                return JsonResponse(response_body, status=status.HTTP_404_NOT_FOUND)
+
+            if "text/event-stream" in request.headers.get("Accept", ""):
+                # The watcher is released by the stream when it ends
+                stream = self.async_stream if isinstance(request, ASGIRequest) else self.sync_stream
+                response = StreamingHttpResponse(stream(username, readiness), content_type="text/event-stream")
+                response["Cache-Control"] = "no-cache"
+                response["X-Accel-Buffering"] = "no"
+                return response
+
+            since = request.GET.get("since")
+            timeout = min(float(request.GET.get("timeout", 30)), readiness_stream_timeout)
+            deadline = time.monotonic() + timeout
+            while since and readiness['state'] == since and time.monotonic() < deadline:
+                readiness = await readiness_watcher.async_wait(username, readiness, deadline - time.monotonic())
+            readiness_watcher.unwatch(username)
+            return JsonResponse({'status': 'success', 'data': readiness})
+
+        except Exception as e:
+            readiness_watcher.unwatch(username)
+            response_body = {'error': str(e), "status": "failed"}
+            return JsonResponse(response_body, status=status.HTTP_400_BAD_REQUEST)
+
+    @staticmethod
+    async def async_stream(username: str, readiness: dict):
+        try:
+            yield format_event(readiness)
+            deadline = time.monotonic() + readiness_stream_timeout
+            while readiness['state'] not in TERMINAL_STATES and time.monotonic() < deadline:
+                current = await readiness_watcher.async_wait(username, readiness, readiness_keepalive)
+                if current == readiness:
+                    yield KEEPALIVE_EVENT
+                    continue
+                readiness = current
+                yield format_event(readiness)
+        finally:
+            readiness_watcher.unwatch(username)
+
+    @staticmethod
+    def sync_stream(username: str, readiness: dict):
+        # Under WSGI the stream holds its worker thread
+        try:
+            yield format_event(readiness)
+            deadline = time.monotonic() + readiness_stream_timeout
+            while readiness['state'] not in TERMINAL_STATES and time.monotonic() < deadline:
+                current = readiness_watcher.wait(username, readiness, readiness_keepalive)
+                if current == readiness:
+                    yield KEEPALIVE_EVENT
+                    continue
+                readiness = current
+                yield format_event(readiness)
+        finally:
+            readiness_watcher.unwatch(username)
@@ -0,0 +1,29 @@
+# Django Imports
+from rest_framework.views import APIView, Response, status
+
+# Local Imports
+from docker_swarm.utils.scaling_policy import SCALING_POLICIES, get_scaling_policy, set_scaling_policy
+
+
+class ScalingPolicyResource(APIView):
+    def get(self, request):
+        """
+        The active scale-up policy, its parameters and the available policies.
+        """
+        data = {**get_scaling_policy().stats(), 'available': sorted(SCALING_POLICIES)}
+        return Response({'status': 'success', 'data': data})
+
+    def put(self, request):
+        """
+        Switch the scale-up policy, e.g. {"policy": "rate", "params": {"windows": [60, 300]}}.
+        Omitted params keep their defaults.
+        """
+        name = request.data.get('policy')
+        params = request.data.get('params') or {}
+        if not isinstance(params, dict):
+            return Response({"error": "'params' must be an object.", "status": "failed"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            policy = set_scaling_policy(name, params)
+        except ValueError as e:
+            return Response({"error": str(e), "status": "failed"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'status': 'success', 'data': policy.stats()})
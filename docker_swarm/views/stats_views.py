@@ -0,0 +1,28 @@
+# Django Imports
+from rest_framework.views import APIView, Response
+
+# Local Imports
+from docker_swarm.utils.codespace_utils import get_time_to_ready_stats
+from docker_swarm.utils.nginx_utils import nginx_reload_coalescer
+from docker_swarm.utils.placement import placement_engine
+from docker_swarm.utils.readiness import readiness_watcher
+from docker_swarm.utils.swarm_cache import swarm_cache
+from docker_swarm.utils.swarm_mirror import swarm_mirror
+from docker_swarm.utils.warm_pool import warm_pool
+
+
+class SwarmStats(APIView):
+    def get(self, request):
+        """
+        Runtime counters of the controller, used to tune cache TTLs and batching.
+        """
+        data = {
+            'swarm_cache': swarm_cache.stats(),
+            'swarm_mirror': swarm_mirror.stats(),
+            'nginx_reload': nginx_reload_coalescer.stats(),
+            'warm_pool': warm_pool.stats(),
+            'placement': placement_engine.stats(),
+            'readiness': readiness_watcher.stats(),
+            'time_to_ready': get_time_to_ready_stats(),
+        }
+        return Response({'status': 'success', 'data': data})